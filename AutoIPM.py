@@ -1,4 +1,4 @@
-from pihist import Server
+from pihist import Server, FederatedServer, RequestPlan
 import pandas as pd
 import numpy as np
 import datetime
@@ -18,43 +18,75 @@ import pandas as pd
 import cx_Oracle
 
 server_name = 'ANGLUAKN1'
+pi_workers = 8 # number of PI tags to download concurrently
 database = 'ANGSDB'
 server = Server(server_name)
-db = EMSDB.EMSDB()
+db = EMSDB.EMSDB() # pools its database sessions, so it is shared by every query of a run
 
 #Initialises an 'OpenServer' class
 petex = OpenServer()
 
-def initalize(server_name, EMSDB):
+def initalize(server_name, EMSDB, backend = None, prefixes = None):
+    #server_name: a PI historian, or a list of them to query concurrently as one (see pihist.FederatedServer),
+    #with prefixes mapping PI tag name prefixes to server names, e.g. {'KZA_': 'ANGLUAKN1'}; tags that match no
+    #prefix go to the first server
+    #backend: optional pihist historian backend, e.g. pisynth.SyntheticHistorian()
     global server
     global database
-    server = Server(server_name)
+    if isinstance(server_name, str):
+        server = Server(server_name, backend = backend)
+    else:
+        servers = {name : Server(name, backend = backend) for name in server_name}
+        server = FederatedServer(servers, prefixes = prefixes, default = server_name[0])
     database = EMSDB
 
-def GetWellInputData(start_time, end_time, welltags, OutputToExcel = True, data_dir = None):
-
-    #dic to store values
-    BHP_values = {}
-    WHP_values = {}
-    WHT_values = {}
-    WHPDP_values = {}
-    status_values = {}
-    routing_values = {}
-    date_values = {}
-    GLRate_values = {}
-    endDate = datetime.fromisoformat(end_time)
-    startDate = datetime.fromisoformat(start_time)
-    interval = endDate - startDate
-    interval = interval.total_seconds()
-
-    #Final list
-    BHPs = []
-    WHPs = []
-    WHTs = []
-    WHPDPs = []
-    Status = []
-    Routing = []
-    GLRates = []
+def LastValues(frame):
+    #Last row of a wide pihist frame as float64, indexed by PI tag (NaN if the frame is empty)
+    if len(frame) == 0:
+        return pd.Series(np.nan, index = frame.columns)
+    return frame.iloc[-1].astype(np.float64)
+
+def ValuesByWell(values):
+    #Values indexed by PI tag, re-indexed by the well name in each tag (e.g. KZA_W01.WHP)
+    values = pd.Series(values.values.astype(np.float64), index = [tag.split("_")[1] for tag in values.index])
+    return values[~values.index.duplicated(keep = 'last')]
+
+def LastValuesByWell(frame):
+    #Last values of a wide pihist frame, indexed by well name
+    return ValuesByWell(LastValues(frame))
+
+def IntervalSecs(start_time, end_time):
+    return (datetime.fromisoformat(end_time) - datetime.fromisoformat(start_time)).total_seconds()
+
+def NewPlan():
+    #Plan that coalesces the PI requests of a run (see pihist.RequestPlan): add the requests of each
+    #Get*Data function (and date) with the Plan* functions, then pass the plan to the Get*Data functions
+    return RequestPlan(server, pi_workers)
+
+def PlanWellInputData(plan, start_time, end_time, welltags):
+    #PI requests of GetWellInputData, by tag table column
+    interval = IntervalSecs(start_time, end_time)
+    requests = {}
+    #Status and routing are states, so only their values at end_time are needed.  These are read at end_time
+    #itself, where the 600 s series used before ended on the last whole interval, up to 600 s earlier
+    for column in ["Well Status", "Flowline A Routing"]:
+        requests[column] = plan.values_at(welltags[column].dropna(), end_time)
+    for column in ["WHP", "WHT", "Choke DP", "BHP", "GL Rate"]:
+        requests[column] = plan.time_averaged(welltags[column].dropna(), start_time, end_time, interval_secs= interval)
+    return requests
+
+def PlanMPFMRates(plan, start_time, end_time, welltags):
+    #PI requests of GetMPFMRates, by tag table column
+    interval = IntervalSecs(start_time, end_time)
+    return {column : plan.time_averaged(welltags[column], start_time, end_time, interval_secs= interval)
+            for column in ["MPFM Oil Rates", "MPFM Water Rates", "MPFM Gas Rates"]}
+
+def PlanManifoldInputData(plan, start_time, end_time, ManifoldTags):
+    #PI request of GetManifoldInputData
+    interval = IntervalSecs(start_time, end_time)
+    return plan.time_averaged(list(ManifoldTags["Tag"].values), start_time, end_time, interval_secs= interval)
+
+def GetWellInputData(start_time, end_time, welltags, OutputToExcel = True, data_dir = None, plan = None):
 
     if data_dir is None:
         data_dir = os.getcwd()
@@ -62,95 +94,41 @@ def GetWellInputData(start_time, end_time, welltags, OutputToExcel = True, data_
     path = data_dir + url
     header = True
 
-    ##NEED TO DROP NAN PI TAGS
-    statusTags = welltags["Well Status"].dropna()
-    FlowARoutingTags = welltags["Flowline A Routing"].dropna()
-    whpTags = welltags["WHP"].dropna()
-    whpdpTags = welltags["Choke DP"].dropna()
-    whtTags = welltags["WHT"].dropna()
-    bhpTags = welltags["BHP"].dropna()
-    glRateTags = welltags["GL Rate"].dropna()
     wellNames = list(welltags["Well Name"].values)
 
-    statusData = server.get_tag_interpolated_data(statusTags, start_time, end_time)
-    FlowlineAData = server.get_tag_interpolated_data(FlowARoutingTags, start_time, end_time)
-
-    for i in statusData:
-        value = 'FLOW' if i[1].values[-1] == 0 else 'NFLOW'
-        well = i[0].split("_")[1]
-        status_values[well] = value
-
-    for i in FlowlineAData:
-        value = 'HEADER_A' if i[1].values[-1] == 1 else 'HEADER_B'
-        well = i[0].split("_")[1]
-        routing_values[well] = value
-
-    WHPData = server.get_tag_time_averaged_data(whpTags, start_time, end_time, interval_secs= interval)
-    WHTData = server.get_tag_time_averaged_data(whtTags, start_time, end_time, interval_secs= interval)
-    WHPDPData = server.get_tag_time_averaged_data(whpdpTags, start_time, end_time, interval_secs= interval)
-    BHPData = server.get_tag_time_averaged_data(bhpTags, start_time, end_time, interval_secs= interval)
-    GLRateData = server.get_tag_time_averaged_data(glRateTags, start_time, end_time, interval_secs= interval)
-
-    for i in WHPData:
-        value = 0 if i[1] is None else i[1].Avg.values[0] * 14.5038
-        well = i[0].split("_")[1]
-        WHP_values[well] = value
-
-    for i in WHTData:
-        value = 0 if i[1] is None else i[1].Avg.values[0]* 9/5 + 32
-        well = i[0].split("_")[1]
-        WHT_values[well] = value
-
-    for i in WHPDPData:
-        value = 0 if i[1] is None else i[1].Avg.values[0] * 14.5038
-        well = i[0].split("_")[1]
-        WHPDP_values[well] = value
-
-    for i in BHPData:
-        value = 0 if i[1] is None else i[1].Avg.values[0] * 14.5038
-        well = i[0].split("_")[1]
-        BHP_values[well] = value
-
-    for i in GLRateData:
-        value = 0 if i[1] is None else (i[1].Avg.values[0] * 35.3147 * 24)/(1000 * 1000)
-        well = i[0].split("_")[1]
-        GLRate_values[well] = value
-
-    for well in wellNames:
-        if well in status_values:
-            Status.append(status_values[well])
-        else:
-            Status.append(-999)
-
-        if well in routing_values:
-            Routing.append(routing_values[well])
-        else:
-            Routing.append(-999)
-
-        if well in WHP_values:
-            WHPs.append(WHP_values[well])
-        else:
-            WHPs.append(-999)
-
-        if well in WHT_values:
-            WHTs.append(WHT_values[well])
-        else:
-            WHTs.append(-999)
-
-        if well in WHPDP_values:
-            WHPDPs.append(WHPDP_values[well])
-        else:
-            WHPDPs.append(-999)
-
-        if well in BHP_values:
-            BHPs.append(BHP_values[well])
-        else:
-            BHPs.append(-999)
-
-        if well in GLRate_values:
-            GLRates.append(GLRate_values[well])
-        else:
-            GLRates.append(-999)
+    #All of the passes are downloaded together, with those of any other consumers of the plan
+    if plan is None:
+        plan = NewPlan()
+    requests = PlanWellInputData(plan, start_time, end_time, welltags)
+    statusData = requests["Well Status"].result()
+    FlowlineAData = requests["Flowline A Routing"].result()
+
+    status_values = ValuesByWell(statusData)
+    status_values = pd.Series(np.where(status_values == 0, 'FLOW', 'NFLOW'), index = status_values.index, dtype = object)
+    routing_values = ValuesByWell(FlowlineAData)
+    routing_values = pd.Series(np.where(routing_values == 1, 'HEADER_A', 'HEADER_B'), index = routing_values.index, dtype = object)
+
+    #One wide frame per pass, with a column per PI tag
+    WHPData, _ = requests["WHP"].result()
+    WHTData, _ = requests["WHT"].result()
+    WHPDPData, _ = requests["Choke DP"].result()
+    BHPData, _ = requests["BHP"].result()
+    GLRateData, _ = requests["GL Rate"].result()
+
+    #Tags without data give 0, wells without tags give -999
+    WHP_values = (LastValuesByWell(WHPData) * 14.5038).fillna(0)
+    WHT_values = (LastValuesByWell(WHTData) * 9/5 + 32).fillna(0)
+    WHPDP_values = (LastValuesByWell(WHPDPData) * 14.5038).fillna(0)
+    BHP_values = (LastValuesByWell(BHPData) * 14.5038).fillna(0)
+    GLRate_values = ((LastValuesByWell(GLRateData) * 35.3147 * 24)/(1000 * 1000)).fillna(0)
+
+    Status = list(status_values.reindex(wellNames, fill_value = -999))
+    Routing = list(routing_values.reindex(wellNames, fill_value = -999))
+    WHPs = list(WHP_values.reindex(wellNames, fill_value = -999))
+    WHTs = list(WHT_values.reindex(wellNames, fill_value = -999))
+    WHPDPs = list(WHPDP_values.reindex(wellNames, fill_value = -999))
+    BHPs = list(BHP_values.reindex(wellNames, fill_value = -999))
+    GLRates = list(GLRate_values.reindex(wellNames, fill_value = -999))
 
     date_values = [end_time] * len(wellNames)
 
@@ -164,16 +142,9 @@ def GetWellInputData(start_time, end_time, welltags, OutputToExcel = True, data_
 
     return df
 
-def GetMPFMRates(start_time, end_time, welltags, OutputToExcel = True, data_dir = None):
+def GetMPFMRates(start_time, end_time, welltags, OutputToExcel = True, data_dir = None, plan = None):
 
-    date_values = []
-    OilRate_values = []
-    WaterRate_values = []
-    GasRate_values = []
-    endDate = datetime.fromisoformat(end_time)
     startDate = datetime.fromisoformat(start_time)
-    interval = endDate - startDate
-    interval = interval.total_seconds()
 
     if data_dir is None:
         data_dir = os.getcwd()
@@ -185,26 +156,18 @@ def GetMPFMRates(start_time, end_time, welltags, OutputToExcel = True, data_dir
     if file_exists:
         header = False
     
-    oilRateTags = welltags["MPFM Oil Rates"]
-    waterRateTags = welltags["MPFM Water Rates"]
-    gasRateTags = welltags["MPFM Gas Rates"]
     wellNames = welltags["Well Name"]
-    OilRateData = server.get_tag_time_averaged_data(oilRateTags, start_time, end_time, interval_secs= interval)
-    WaterRateData = server.get_tag_time_averaged_data(waterRateTags, start_time, end_time, interval_secs= interval)
-    GasRateData = server.get_tag_time_averaged_data(gasRateTags, start_time, end_time, interval_secs= interval)
-
-    for i in OilRateData:
-        value = 0 if i[1] is None else i[1].Avg.values[0]
-        OilRate_values.append(value * 6.2981 * 24)
-        date_values.append(startDate)
-
-    for i in WaterRateData:
-        value = 0 if i[1] is None else i[1].Avg.values[0]
-        WaterRate_values.append(value * 6.2981 * 24)
-
-    for i in GasRateData:
-        value = 0 if i[1] is None else i[1].Avg.values[0]
-        GasRate_values.append(value * 35.4147 * 24 / 1000000)
+    if plan is None:
+        plan = NewPlan()
+    requests = PlanMPFMRates(plan, start_time, end_time, welltags)
+    OilRateData, _ = requests["MPFM Oil Rates"].result()
+    WaterRateData, _ = requests["MPFM Water Rates"].result()
+    GasRateData, _ = requests["MPFM Gas Rates"].result()
+
+    OilRate_values = LastValues(OilRateData).fillna(0).values * 6.2981 * 24
+    WaterRate_values = LastValues(WaterRateData).fillna(0).values * 6.2981 * 24
+    GasRate_values = LastValues(GasRateData).fillna(0).values * 35.4147 * 24 / 1000000
+    date_values = [startDate] * len(OilRate_values)
 
     Result = {'Date' : date_values, 'WellName' : wellNames,
             "OilRate" : OilRate_values, "WaterRate" : WaterRate_values, "GasRate" : GasRate_values}
@@ -215,23 +178,48 @@ def GetMPFMRates(start_time, end_time, welltags, OutputToExcel = True, data_dir
 
     return df
     
-def GetReservoirPressure(end_time, wellName):
-    db = EMSDB.EMSDB()
-    resPressure_values = []
-    end_time = end_time.split()[0]
-    qq = """SELECT b.completion_name, a.test_date, a.analyzed_pressure_at_gauge * 0.145038, a.mid_perf_pressure * 0.145038
+def CompletionFilter(column, wellNames, params):
+    #SQL condition selecting the given completion names, with their bind values added to params; Oracle allows at
+    #most 1000 values in an IN list
+    names = list(dict.fromkeys(wellNames))
+    if len(names) == 0:
+        return "1 = 0"
+    lists = [EMSDB.bind_list("well" + str(i // 1000) + "_", names[i:i + 1000], params) for i in range(0, len(names), 1000)]
+    return "(" + " or ".join(column + " in (" + l + ")" for l in lists) + ")"
+
+def LatestReservoirPressureQuery(end_time, wellNames):
+    #The latest published reservoir pressure of each of the wells up to end_time (yyyy-mm-dd), one row per well,
+    #as the SQL and its bind values
+    params = {"end_date" : end_time}
+    return """SELECT completion_name, test_date, gauge_pressure, mid_perf_pressure from (
+        SELECT b.completion_name, a.test_date, a.analyzed_pressure_at_gauge * 0.145038 gauge_pressure, a.mid_perf_pressure * 0.145038 mid_perf_pressure,
+            row_number() over (partition by b.completion_name order by a.test_date desc) rn
         from rpm.reservoir_pressure_published a left join eg.ofm_completion b on a.id_completion = b.id_completion
-        where a.test_date <= TO_DATE('""" + end_time + """', 'yyyy-mm-dd')
-        order by b.completion_name, a.test_date desc"""
-    df = db.query(qq, database)
+        where a.test_date <= TO_DATE(:end_date, 'yyyy-mm-dd') and """ + CompletionFilter("b.completion_name", wellNames, params) + """)
+        where rn = 1""", params
+
+def LatestWellTestQuery(end_time, wellNames):
+    #The latest allocation well test of each of the wells up to end_time (yyyy-mm-dd), one row per well, as the SQL
+    #and its bind values
+    params = {"end_date" : end_time}
+    return """SELECT completion_name, test_usage, start_date, oil_rate, water_rate, gas_rate, gas_lift_rate, fbhp, fwhp, fwht from (
+        SELECT b.completion_name, a.test_usage, a.start_date, a.oil_rate * 6.289 oil_rate, a.water_rate * 6.289 water_rate,
+            a.assoc_gas_rate * 35.3147/1000/1000 gas_rate, a.glg_rate * 35.3147/1000/1000 gas_lift_rate, a.flowing_bhp * 0.145038 fbhp,
+            a.flowing_wellhead_pressure * 0.145038 fwhp, a.flowing_wellhead_temp * 9/5 + 32 fwht,
+            row_number() over (partition by b.completion_name order by a.start_date desc) rn
+        from eg.well_test_prod a left join eg.ofm_completion b on a.id_completion = b.id_completion
+        where a.start_date <= TO_DATE(:end_date, 'yyyy-mm-dd') and a.test_usage = 'Allocation'
+            and """ + CompletionFilter("b.completion_name", wellNames, params) + """)
+        where rn = 1""", params
 
-    for well in wellName:
+def GetReservoirPressure(end_time, wellName):
+    end_time = end_time.split()[0]
+    qq, params = LatestReservoirPressureQuery(end_time, wellName)
+    df = db.query(database, qq, params)
 
-        #wellnamestr = well[0:3] + "-" + well[3:]
-        df1 = df[df["COMPLETION_NAME"] == well]
-        midPerfPressure = df1.values[0][3] if df1.values.size > 0 else 0.0
-        resPressure_values.append(midPerfPressure)
-    return resPressure_values
+    #One row per well, so look each well up directly
+    midPerfPressures = df.set_index("COMPLETION_NAME")["MID_PERF_PRESSURE"]
+    return list(midPerfPressures.reindex(wellName).fillna(0.0).values)
 
 def GetWellTest(end_time, wellData, OutputToExcel = True, data_dir = None):
 
@@ -246,27 +234,24 @@ def GetWellTest(end_time, wellData, OutputToExcel = True, data_dir = None):
     FBHPs = []
     WellTestDates = []
     end_time = end_time.split()[0]
-    qq = """SELECT b.completion_name, a.test_usage, a.start_date, a.oil_rate * 6.289, a.water_rate * 6.289, a.assoc_gas_rate * 35.3147/1000/1000,
-        a.glg_rate * 35.3147/1000/1000, a.flowing_bhp * 0.145038, a.flowing_wellhead_pressure * 0.145038, a.flowing_wellhead_temp * 9/5 + 32
-        from eg.well_test_prod a left join eg.ofm_completion b on a.id_completion = b.id_completion
-        where a.start_date <= TO_DATE('""" + end_time + """', 'yyyy-mm-dd') and a.test_usage = 'Allocation'
-        order by b.completion_name, a.start_date desc"""
-    db = EMSDB.EMSDB()
-    df = db.query(qq, database)
+    qq, params = LatestWellTestQuery(end_time, wellName)
+    df = db.query(database, qq, params)
 
+    #One row per well, so look each well up directly
+    tests = {row[0] : row for row in df.itertuples(index = False)}
     for well in wellName:
 
-        df1 = df[df["COMPLETION_NAME"] == well]
-        if df1.values.size > 0:
-            startDate = df1.values[0][2]
-            oilRate = df1.values[0][3]
-            waterRate = df1.values[0][4]
-            gasRate = df1.values[0][5]
-            gasliftRate = df1.values[0][6]
-            FBHP = df1.values[0][7]
-            FWHP = df1.values[0][8]
-            FWHT = df1.values[0][9]
-            completionName = df1.values[0][0]
+        if well in tests:
+            test = tests[well]
+            startDate = test[2]
+            oilRate = test[3]
+            waterRate = test[4]
+            gasRate = test[5]
+            gasliftRate = test[6]
+            FBHP = test[7]
+            FWHP = test[8]
+            FWHT = test[9]
+            completionName = test[0]
 
             WellTestDates.append(startDate)
             oilRates.append(oilRate)
@@ -278,7 +263,7 @@ def GetWellTest(end_time, wellData, OutputToExcel = True, data_dir = None):
             FWHTs.append(FWHT)
             wellNames.append(completionName)
 
-    resPressures = GetReservoirPressure(end_time, wellName)
+    resPressures = GetReservoirPressure(end_time, wellNames)
     Result = {'WellName' : wellNames, 'Date' : WellTestDates, "OilRate" : oilRates, "WaterRate" : waterRates, "GasRate" : gasRates,
              "GasLiftRate" : gasLiftRates, 'WHP': FWHPs, 'BHP': FBHPs, 'WHT': FWHTs, "ResPressure" : resPressures}   
     df = pd.DataFrame(Result, columns = ['WellName', 'Date', "OilRate", "WaterRate", "GasRate", "GasLiftRate", "WHP", "BHP", "WHT", "ResPressure"])
@@ -291,25 +276,19 @@ def GetWellTest(end_time, wellData, OutputToExcel = True, data_dir = None):
 
     return df
 
-def GetManifoldInputData(start_time, end_time, ManifoldTags, OutputToExcel = True,  data_dir = None):
+def GetManifoldInputData(start_time, end_time, ManifoldTags, OutputToExcel = True,  data_dir = None, plan = None):
 
     values = []
 
     if data_dir is None:
         data_dir = os.getcwd()
 
-    Tags = list(ManifoldTags["Tag"].values)
-    endDate = datetime.fromisoformat(end_time)
-    startDate = datetime.fromisoformat(start_time)
-    interval = endDate - startDate
-    interval = interval.total_seconds()
     Types = []
 
-    ManifoldData = server.get_tag_time_averaged_data(Tags, start_time, end_time, interval_secs= interval)
-
-    for i in ManifoldData:
-        value = 0 if i[1] is None else i[1].Avg.values[0]
-        values.append(value)
+    if plan is None:
+        plan = NewPlan()
+    ManifoldData, _ = PlanManifoldInputData(plan, start_time, end_time, ManifoldTags).result()
+    values = list(LastValues(ManifoldData).fillna(0).values)
 
     #Get pressure index
     pressure_index = list(ManifoldTags[ManifoldTags["Type"] == "Pressure"].index)
@@ -18,20 +18,28 @@ start_time = '2022-12-10 00:00:00'
 end_time = '2022-12-11 00:00:00'
 Corr = "PetroleumExperts5" # VLP Correlation
 path = r'C:\Users\lcyan01\Desktop\Assets\Angola\SnO\WTA\Python Code Test' #to be modified - folder where models are stored
-server_name = 'ANGLUAKN1' #PI historian server
+server_name = 'ANGLUAKN1' #PI historian server, or a list of servers for several hubs
+hub_prefixes = None # for several servers, the PI tag name prefix of each hub, e.g. {'KZA_': 'ANGLUAKN1'}
 database = 'ANGSDB' # EMSDB Database
 ###END: user specified input data
 
 #initialize
-ipm.initalize(server_name, database)
+ipm.initalize(server_name, database, prefixes = hub_prefixes)
 
-#well input data
+#PI tag tables
 wellTags = pd.read_csv(path + "/Well Status Table PI Tags.csv")
-wellData = ipm.GetWellInputData(start_time, end_time, wellTags, data_dir=path)
+ManifoldTags = pd.read_csv(path + "/ManifoldTags.csv")
+
+#plan the PI requests of the well and manifold data, so that they are downloaded in as few passes as possible
+plan = ipm.NewPlan()
+ipm.PlanWellInputData(plan, start_time, end_time, wellTags)
+ipm.PlanManifoldInputData(plan, start_time, end_time, ManifoldTags)
+
+#well input data
+wellData = ipm.GetWellInputData(start_time, end_time, wellTags, data_dir=path, plan=plan)
 
 #manifold data
-ManifoldTags = pd.read_csv(path + "/ManifoldTags.csv")
-manifoldData = ipm.GetManifoldInputData(start_time, end_time, ManifoldTags, data_dir=path)
+manifoldData = ipm.GetManifoldInputData(start_time, end_time, ManifoldTags, data_dir=path, plan=plan)
 
 #prosper IPR data
 IPRData = ipm.GetIPRFromProsper(data_dir = path)
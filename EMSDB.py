@@ -1,8 +1,16 @@
 import os
-import cx_Oracle
+import re
+import json
 import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+import cx_Oracle
+from contextlib import contextmanager
 from pandas import read_sql_query
 from pandas import DataFrame
+from pandas import Series
 from functools import reduce
 from datetime import datetime
 
@@ -14,33 +22,320 @@ def strfdb(val):
         return '' if val == None else val
 
 class EMSDB:
-    def __init__(self, tnsAdmin=r'I:\appl\TechOraClients\tns_admin\aso'):
+    def __init__(self, tnsAdmin=r'I:\appl\TechOraClients\tns_admin\aso', minSessions: int = 1, maxSessions: int = 4,
+                 healthCheck: bool = True, statementCacheSize: int = 50, arraySize: int = 1000, prefetchRows: int = 1000,
+                 cacheDir: str = None, cacheTtlSecs: float = 86400):
+        # minSessions/maxSessions: the number of sessions kept open to each database; threads that need a session
+        # while maxSessions are in use wait for one to be released
+        # healthCheck: ping each session as it is checked out of the pool, and replace it if it has gone stale
+        # statementCacheSize: the number of parsed statements each session keeps for reuse; a statement that is
+        # executed again with new bind values (see query) is then neither re-sent nor re-parsed
+        # arraySize/prefetchRows: the default number of rows fetched per round trip, and fetched along with the
+        # execute itself; see query
+        # cacheDir: a directory in which to keep query results (see QueryCache), or None for no cache
+        # cacheTtlSecs: the default time for which a cached result is used
         os.environ['TNS_ADMIN'] = tnsAdmin
         if 'ORACLE_HOME' in os.environ:
             del os.environ['ORACLE_HOME'] 
         if 'ORACLE_HOME_NAME' in os.environ:
             del os.environ['ORACLE_HOME_NAME'] 
+        self.minSessions = minSessions
+        self.maxSessions = maxSessions
+        self.healthCheck = healthCheck
+        self.statementCacheSize = statementCacheSize
+        self.arraySize = arraySize
+        self.prefetchRows = prefetchRows
+        self.cache = QueryCache(cacheDir, cacheTtlSecs) if cacheDir is not None else None
+        self._pools = {}
+        self._lock = threading.Lock()
 
     def try_get_retry(self, num: int, fn, default=None):
+        error = None
         for i in range(num):
             while True:
                 try:
                     return fn()
                 except cx_Oracle.DatabaseError as err:
+                    error = err
                     print('DB error, trying again in {0} ({1} of {2})'.format(1 * 10 ** i, i + 1, num))
                     time.sleep(1 * 10 ** i)
                     break
         print('DB error, giving up!')
         if default is None:
-            raise err
+            raise error
         return default
+
+    def get_pool(self, database) -> cx_Oracle.SessionPool:
+        # One pool of sessions per database, shared by all threads; like cx_Oracle.connect('', '', database), the
+        # sessions use external authentication, so TNS resolution and authentication happen once per session.
+        # The pool is created (with its retries) outside the lock, so that other databases aren't held up; if two
+        # threads create a pool for the same database at once, the first one published is kept
+        with self._lock:
+            pool = self._pools.get(database)
+        if pool is not None:
+            return pool
+        pool = self.try_get_retry(3, lambda: cx_Oracle.SessionPool(
+            dsn=database, min=self.minSessions, max=self.maxSessions, increment=1, threaded=True,
+            getmode=cx_Oracle.SPOOL_ATTRVAL_WAIT, externalauth=True, homogeneous=False))
+        with self._lock:
+            published = self._pools.setdefault(database, pool)
+        if published is not pool:
+            pool.close(force=True)
+        return published
+
+    def checkout(self, pool: cx_Oracle.SessionPool) -> cx_Oracle.Connection:
+        # Take a session from the pool, dropping any that fail the health check
+        for i in range(self.maxSessions + 1):
+            connection = self.try_get_retry(3, pool.acquire)
+            connection.stmtcachesize = self.statementCacheSize
+            if not self.healthCheck:
+                return connection
+            try:
+                connection.ping()
+                return connection
+            except cx_Oracle.DatabaseError as err:
+                print('DB session is stale, replacing it ({0})'.format(err))
+                pool.drop(connection)
+        connection = self.try_get_retry(3, pool.acquire)
+        connection.stmtcachesize = self.statementCacheSize
+        return connection
+
+    @contextmanager
+    def connection(self, database):
+        # A pooled session for the duration of a with block; it is rolled back (if anything was left uncommitted)
+        # and returned to the pool afterwards
+        pool = self.get_pool(database)
+        connection = self.checkout(pool)
+        try:
+            yield connection
+        finally:
+            try:
+                connection.rollback()
+                pool.release(connection)
+            except cx_Oracle.DatabaseError:
+                pool.drop(connection)
+
+    def close(self):
+        # Close every pooled session; the pools are reopened by the next statement
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close(force=True)
+            self._pools = {}
     
-    def execute(self, database, execute: str, params:dict = None, default: DataFrame = DataFrame()) -> DataFrame:
-        with self.try_get_retry(3, lambda: cx_Oracle.connect('', '', database)) as connection:
-            cur = connection.cursor()
-            cur.execute(execute)
+    def execute(self, database, execute: str, params = None, default: DataFrame = DataFrame()) -> DataFrame:
+        # params: the bind values, as a dict for :name binds (or a list for :1, :2, ...); a list of them executes
+        # the statement once per entry, in one round trip
+        with self.connection(database) as connection:
+            with connection.cursor() as cur:
+                if isinstance(params, list) and len(params) > 0 and isinstance(params[0], (dict, list, tuple)):
+                    cur.executemany(execute, params)
+                else:
+                    cur.execute(execute, params or {})
             connection.commit()
 
-    def query(self, database, query: str, params:dict = None, default: DataFrame = DataFrame()) -> DataFrame:
-        with self.try_get_retry(3, lambda: cx_Oracle.connect('', '', database)) as connection:
-            return read_sql_query(query, con=connection, params=params)
+    def query(self, database, query: str, params = None, default: DataFrame = DataFrame(), arraySize: int = None,
+              prefetchRows: int = None, useCache: bool = True, cacheTtlSecs: float = None) -> DataFrame:
+        # params: the bind values, as a dict for :name binds (or a list for :1, :2, ...); with binds instead of
+        # literals the SQL text stays the same from run to run, so Oracle and the statement cache reuse its parse
+        # arraySize/prefetchRows: override the defaults for this query, e.g. larger for long histories
+        # useCache/cacheTtlSecs: with a cacheDir, whether to answer this query from the cache, and for how long a
+        # cached result may be used (by default, cacheTtlSecs of the EMSDB); a hit doesn't open a connection
+        cache = self.cache if useCache else None
+        if cache is not None:
+            result = cache.get(database, query, params, cacheTtlSecs)
+            if result is not None:
+                return result
+        with self.connection(database) as connection, connection.cursor() as cur:
+            cur.arraysize = arraySize or self.arraySize
+            cur.prefetchrows = prefetchRows or self.prefetchRows
+            cur.execute(query, params or {})
+            columns = [d[0] for d in cur.description]
+            result = DataFrame.from_records(cur.fetchall(), columns = columns)
+        if cache is not None:
+            cache.put(database, query, params, result)
+        return result
+
+    def iter_query(self, database, query: str, params = None, batchSize: int = 10000, prefetchRows: int = None):
+        # Run a query and yield its rows in DataFrames of at most batchSize rows, fetched with fetchmany, so that
+        # long histories can be aggregated batch by batch in constant memory, e.g.
+        #     for batch in db.iter_query(database, qq, params):
+        #         totals = totals.add(batch.groupby("COMPLETION_NAME")["OIL_RATE"].sum(), fill_value = 0)
+        # Each column is filled straight from the fetched rows into a typed NumPy array, without building lists or
+        # object arrays of the column first: numbers (fetched as native doubles) to float64 with NaN for NULL,
+        # dates and timestamps to datetime64 with NaT for NULL, and other types (e.g. strings) to object arrays.
+        # (cx_Oracle only returns rows of Python values, so each value is still converted once.)  Every batch has
+        # the same columns and dtypes, and a query with no rows yields one empty DataFrame with them.  The pooled
+        # session is held until the iteration finishes (or the generator is closed); the cache is not used.
+        with self.connection(database) as connection, connection.cursor() as cur:
+            cur.arraysize = batchSize
+            cur.prefetchrows = prefetchRows or self.prefetchRows
+            cur.outputtypehandler = fetch_numbers_as_floats
+            cur.execute(query, params or {})
+            names = [d[0] for d in cur.description]
+            dtypes = [column_dtype(d[1]) for d in cur.description]
+            rows = cur.fetchmany(batchSize)
+            while True:
+                # Series with explicit dtypes, so that text columns stay object columns in every batch
+                yield DataFrame({name : Series(np.fromiter((row[i] for row in rows), dtype = dtype, count = len(rows)),
+                                               dtype = dtype, copy = False)
+                                 for (i, (name, dtype)) in enumerate(zip(names, dtypes))}, columns = names)
+                rows = cur.fetchmany(batchSize)
+                if len(rows) == 0:
+                    break
+
+class QueryCache:
+    # Query results kept on disk, one directory per result with a NumPy file per column, keyed by the database,
+    # the SQL (with its whitespace normalized outside quotes) and the bind values.  Text columns are stored as
+    # fixed-width strings with a separate mask of NULLs, so nothing is pickled; results with other Python objects
+    # in a column are not cached.  Results are used for ttlSecs after they were stored and deleted once they are
+    # found to be older (or by prune()); invalidate() forgets them sooner, e.g. after new well tests are loaded.
+    # A directory should only be used by one process at a time; within a process, a QueryCache may be shared
+    # between threads.
+    def __init__(self, cacheDir: str, ttlSecs: float = 86400):
+        self.cacheDir = cacheDir
+        self.ttlSecs = ttlSecs
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        os.makedirs(cacheDir, exist_ok = True)
+
+    def key(self, database, query: str, params = None) -> str:
+        text = json.dumps([database.upper(), normalize_sql(query), params], sort_keys = True, default = str)
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, database, query: str, params = None, ttlSecs: float = None) -> DataFrame:
+        # The cached result, or None if there is none younger than ttlSecs
+        path = os.path.join(self.cacheDir, self.key(database, query, params))
+        ttlSecs = self.ttlSecs if ttlSecs is None else ttlSecs
+        with self._lock:
+            meta = self._read_meta(path)
+            if meta is None:
+                self.misses += 1
+                return None
+            if time.time() - meta['stored'] > ttlSecs:
+                self.misses += 1
+                self.expired += 1
+                if time.time() - meta['stored'] > self.ttlSecs:
+                    shutil.rmtree(path, ignore_errors = True)
+                return None
+            arrays = []
+            for i in range(len(meta['columns'])):
+                values = np.load(os.path.join(path, str(i) + '.npy'))
+                if meta['text'][i]:
+                    values = values.astype(object)
+                    values[np.load(os.path.join(path, str(i) + '.null.npy'))] = None
+                arrays.append(values)
+            self.hits += 1
+        # Built by position and then named, since a query may return several columns with the same name
+        result = DataFrame(dict(enumerate(arrays)))
+        result.columns = meta['columns']
+        return result
+
+    def put(self, database, query: str, params, result: DataFrame) -> bool:
+        # Store a result, and return whether it could be; text columns are stored as fixed-width strings plus a
+        # mask of NULLs, and the rest as plain arrays.  A column of other Python objects (e.g. LOBs) isn't stored
+        arrays = []
+        for i in range(len(result.columns)):
+            values = result.iloc[:, i].to_numpy()
+            if values.dtype != object:
+                arrays.append((values, None))
+                continue
+            isNull = np.array([(v is None) or (isinstance(v, float) and v != v) for v in values], dtype = bool)
+            if not all(isinstance(v, str) for v in values[~isNull]):
+                return False
+            arrays.append((np.array(['' if n else v for (v, n) in zip(values, isNull)], dtype = str), isNull))
+        key = self.key(database, query, params)
+        path = os.path.join(self.cacheDir, key)
+        with self._lock:
+            tmp_path = path + '.tmp'
+            shutil.rmtree(tmp_path, ignore_errors = True)
+            os.makedirs(tmp_path)
+            for (i, (values, isNull)) in enumerate(arrays):
+                np.save(os.path.join(tmp_path, str(i) + '.npy'), values, allow_pickle = False)
+                if isNull is not None:
+                    np.save(os.path.join(tmp_path, str(i) + '.null.npy'), isNull, allow_pickle = False)
+            meta = {'database': database, 'query': normalize_sql(query), 'params': params, 'stored': time.time(),
+                    'columns': [str(c) for c in result.columns], 'text': [n is not None for (v, n) in arrays]}
+            with open(os.path.join(tmp_path, 'meta.json'), 'w') as fp:
+                json.dump(meta, fp, default = str)
+            shutil.rmtree(path, ignore_errors = True)
+            os.replace(tmp_path, path)
+        return True
+
+    def invalidate(self, database = None, query: str = None, params = None):
+        # Forget one cached result, or (without a query) every result for a database, or (without either) everything
+        with self._lock:
+            if query is not None:
+                shutil.rmtree(os.path.join(self.cacheDir, self.key(database, query, params)), ignore_errors = True)
+                return
+            for key in os.listdir(self.cacheDir):
+                path = os.path.join(self.cacheDir, key)
+                if database is not None:
+                    # An entry that can't be read may belong to any database, so leave it to prune()
+                    meta = self._read_meta(path)
+                    if (meta is None) or (str(meta['database']).upper() != database.upper()):
+                        continue
+                shutil.rmtree(path, ignore_errors = True)
+
+    def prune(self, ttlSecs: float = None) -> int:
+        # Delete every result older than ttlSecs (by default, the cache's ttlSecs), along with entries that can't
+        # be read (e.g. left over from an interrupted put()), and return how many were deleted
+        ttlSecs = self.ttlSecs if ttlSecs is None else ttlSecs
+        numDeleted = 0
+        with self._lock:
+            for key in os.listdir(self.cacheDir):
+                path = os.path.join(self.cacheDir, key)
+                meta = self._read_meta(path)
+                if (meta is None) or (time.time() - meta['stored'] > ttlSecs):
+                    shutil.rmtree(path, ignore_errors = True)
+                    numDeleted += 1
+        return numDeleted
+
+    def _read_meta(self, path: str) -> dict:
+        # The description of a stored result, or None if it is missing, damaged or in an older format
+        try:
+            with open(os.path.join(path, 'meta.json')) as fp:
+                meta = json.load(fp)
+        except (IOError, ValueError):
+            return None
+        if not isinstance(meta, dict) or not all(k in meta for k in ('database', 'stored', 'columns', 'text')):
+            return None
+        return meta
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'expired': self.expired,
+                    'entries': len(os.listdir(self.cacheDir))}
+
+def fetch_numbers_as_floats(cursor, name, defaultType, size, precision, scale):
+    # cx_Oracle output type handler that fetches NUMBER columns as native doubles instead of Python ints/Decimals
+    if defaultType == cx_Oracle.DB_TYPE_NUMBER:
+        return cursor.var(cx_Oracle.DB_TYPE_BINARY_DOUBLE, arraysize = cursor.arraysize)
+
+def column_dtype(typeCode):
+    # The NumPy dtype of a fetched column, from the type code in cursor.description
+    if typeCode in (cx_Oracle.DB_TYPE_NUMBER, cx_Oracle.DB_TYPE_BINARY_DOUBLE, cx_Oracle.DB_TYPE_BINARY_FLOAT):
+        return np.float64
+    if typeCode in (cx_Oracle.DB_TYPE_DATE, cx_Oracle.DB_TYPE_TIMESTAMP):
+        return 'datetime64[us]'
+    return object
+
+def normalize_sql(query: str) -> str:
+    # The SQL with runs of whitespace collapsed, so that reformatting a query doesn't miss the cache.  Whitespace
+    # inside quoted literals and identifiers is kept as it is, since it changes what the query means
+    return re.sub(r"""('(?:[^']|'')*'|"[^"]*")|\s+""", lambda m: m.group(1) or ' ', query).strip()
+
+def bind_list(name: str, values, params: dict) -> str:
+    # Bind placeholders (:name0, :name1, ...) for an IN list of values, added to params.  The list is padded to the
+    # next power of two (at most 1000, Oracle's limit for an IN list) by repeating its last value, so that lists
+    # of similar length share one SQL text
+    values = list(values)
+    size = 1
+    while size < len(values):
+        size *= 2
+    size = max(len(values), min(size, 1000))
+    values = values + values[-1:] * (size - len(values))
+    for (i, value) in enumerate(values):
+        params[name + str(i)] = value
+    return ', '.join(':' + name + str(i) for i in range(len(values)))
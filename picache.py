@@ -0,0 +1,360 @@
+"""Local, persistent cache of PI tag data for pihist.
+
+A TagCache stores downloaded time series on disk, as memory-mapped NumPy
+column files per (server, tag, retrieval mode), together with an index of the
+time ranges that each series covers.  Each column keeps its own dtype (e.g.
+int32 codes for digital tags).  A request for [t1, t2) is answered by
+downloading only the sub-ranges that are not covered yet, appending them to
+the series as a new segment of files (so that the stored data is not
+rewritten on every update; the segments are merged once there are
+MAX_SEGMENTS of them) and slicing the result from the segments on disk.  When
+the cache grows past its size limit, the least recently used series are
+evicted.
+
+Retrieval modes are strings such as 'raw', 'interpolated@600+0' or
+'averaged@3600+0[Avg]': the interval, the phase of the sample grid within
+the interval, and (for averages) the summary columns are all part of the mode,
+since data for one mode can't answer requests for another.
+
+Usage:
+    cache = picache.TagCache(r'C:\\pi_cache')
+    server = pihist.Server(server_name, cache=cache)
+
+A cache directory should only be used by one process at a time.
+"""
+
+import os
+import json
+import math
+import time
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+# The number of segments a series may have before they are merged into one
+MAX_SEGMENTS = 16
+
+
+class TagCache(object):
+    """On-disk cache of PI tag data with a range-coverage index. """
+
+    def __init__(self, cache_dir, max_bytes=2*1024**3, settle_secs=3600):
+        """Open (or create) a cache directory.
+
+        Args:
+            cache_dir   -- the directory in which to store the data
+            max_bytes   -- the size above which the least recently used
+                           series are evicted
+            settle_secs -- data newer than this many seconds before the
+                           server's current time is never marked as covered,
+                           since the PI historian may still be receiving it
+        """
+        self._dir = cache_dir
+        self._max_bytes = max_bytes
+        self._settle_secs = settle_secs
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        try:
+            with open(self._index_path) as fp:
+                self._index = json.load(fp)
+        except (IOError, ValueError):
+            self._index = dict()
+
+    def get(self, server_name, tag_name, mode, t1, t2, fetch, now,
+            columns=None, step=None):
+        """Return the data for one tag over [t1, t2), downloading only what
+           is missing from the cache.
+
+        Args:
+            server_name -- the name of the PI historian
+            tag_name    -- the name of the PI tag
+            mode        -- the retrieval mode (see the module docstring)
+            t1, t2      -- the time range, in UTC seconds
+            fetch       -- a function fetch(a, b) that downloads the data for
+                           [a, b) (UTC seconds) as a Pandas Series or, if
+                           columns is given, a DataFrame
+            now         -- the server's current time, in UTC seconds, or a
+                           function returning it, which is only called if
+                           something is missing from the cache
+            columns     -- the DataFrame columns returned by fetch, or None
+                           if it returns a Series
+            step        -- for evenly spaced data, the time between samples;
+                           the stored ranges then always start and end on the
+                           grid t1 + k*step, so that every later download
+                           starts on the same grid
+
+        Returns:
+            The same kind of Pandas object that fetch returns.
+        """
+        key = self._key(server_name, tag_name, mode)
+        with self._lock:
+            entry = self._index.get(key)
+            ranges = [] if entry is None else entry['ranges']
+            missing = subtract_ranges([(t1, t2)], ranges)
+        # Download what is missing.  Data newer than the settling time is
+        # returned but not stored, since it may still change.
+        if (len(missing) > 0) and callable(now):
+            now = now()
+        if len(missing) > 0:
+            t_settled = now - self._settle_secs
+            if step is not None:
+                t_settled = t1 + math.floor((t_settled - t1)/step)*step
+        new_ranges = []
+        new_data = []
+        unsettled = []
+        for (a, b) in missing:
+            data = fetch(a, b)
+            settled = min(b, t_settled)
+            if settled > a:
+                new_ranges.append((a, settled))
+                new_data.append(_slice(data, a, settled))
+            if settled < b:
+                unsettled.append(_slice(data, max(a, settled), b))
+        with self._lock:
+            if len(new_ranges) > 0:
+                self._store(key, server_name, tag_name, mode, new_data,
+                            new_ranges, columns)
+            if key in self._index:
+                self._index[key]['used'] = time.time()
+                output = self._load(key, tag_name, t1, t2, columns)
+            else:
+                output = _to_pandas(np.zeros(0, dtype=np.int64),
+                                    [np.zeros(0)]*len(columns or ['value']),
+                                    tag_name, columns)
+            self._evict()
+            self._save_index()
+        pieces = [d for d in unsettled if len(d) > 0]
+        if len(pieces) > 0:
+            output = pd.concat([output] + pieces, axis=0).sort_index()
+        return output
+
+    def invalidate(self, tag_name, mode=None, server_name=None):
+        """Forget the cached data for a tag (optionally only for one mode
+           and/or server).
+        """
+        with self._lock:
+            for key in list(self._index):
+                entry = self._index[key]
+                if (   (entry['tag'] == tag_name)
+                    and (mode is None or entry['mode'] == mode)
+                    and (   server_name is None
+                         or entry['server'] == server_name)):
+                    self._remove(key)
+            self._save_index()
+
+    def clear(self):
+        """Forget all of the cached data. """
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+            self._save_index()
+
+    def get_size(self):
+        """Return the total size of the cached data, in bytes. """
+        with self._lock:
+            return sum(e['bytes'] for e in self._index.values())
+
+    def get_ranges(self, server_name, tag_name, mode):
+        """Return the list of (start, end) UTC-second ranges that are cached
+           for a tag in a retrieval mode.
+        """
+        with self._lock:
+            entry = self._index.get(self._key(server_name, tag_name, mode))
+            return [] if entry is None else [tuple(r) for r in entry['ranges']]
+
+    # --- internals ---
+
+    def _key(self, server_name, tag_name, mode):
+        text = '\n'.join([server_name.lower(), tag_name.lower(), mode])
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _path(self, key, column, segment=''):
+        if segment != '':
+            column += '.' + segment
+        return os.path.join(self._dir, key, column + '.npy')
+
+    def _segments(self, entry):
+        # [id, first time, last time] of each segment, oldest first; series
+        # stored before segments were introduced have one unnamed segment
+        return entry.get('segments', [['', None, None]])
+
+    def _load(self, key, tag_name, t1, t2, columns, segments=None):
+        names = columns or ['value']
+        (ns1, ns2) = (_to_ns(t1), _to_ns(t2))
+        times = []
+        values = [[] for c in names]
+        if segments is None:
+            segments = self._segments(self._index[key])
+        for (segment, first, last) in segments:
+            if (first is not None) and ((last < ns1) or (first >= ns2)):
+                continue
+            t = np.load(self._path(key, 'times', segment), mmap_mode='r')
+            i1 = np.searchsorted(t, ns1, side='left')
+            i2 = np.searchsorted(t, ns2, side='left')
+            times.append(np.array(t[i1:i2]))
+            for (j, c) in enumerate(names):
+                v = np.load(self._path(key, 'value_' + c, segment),
+                            mmap_mode='r')
+                values[j].append(np.array(v[i1:i2]))
+        (times, values) = _merge(times, values)
+        return _to_pandas(times, values, tag_name, columns)
+
+    def _store(self, key, server_name, tag_name, mode, new_data, new_ranges,
+               columns):
+        names = columns or ['value']
+        new_data = [d for d in new_data if len(d) > 0]
+        times = [d.index.as_unit('ns').asi8 for d in new_data]
+        if columns is None:
+            values = [[_column(d.values) for d in new_data]]
+        else:
+            values = [[_column(d[c].values) for d in new_data] for c in names]
+        (times, values) = _merge(times, values)
+
+        entry = self._index.get(key)
+        if entry is None:
+            entry = {'server': server_name, 'tag': tag_name, 'mode': mode,
+                     'ranges': [], 'segments': [], 'next': 0, 'bytes': 0}
+        else:
+            entry['segments'] = self._segments(entry)
+            entry.setdefault('next', 0)
+        entry['ranges'] = merge_ranges(entry['ranges']
+                                       + [list(r) for r in new_ranges])
+        entry['used'] = time.time()
+        os.makedirs(os.path.join(self._dir, key), exist_ok=True)
+        if len(times) > 0:
+            segment = str(entry['next'])
+            entry['next'] += 1
+            self._write(key, names, segment, times, values)
+            entry['segments'].append([segment, int(times[0]),
+                                      int(times[-1])])
+            entry['bytes'] += int(times.nbytes + sum(v.nbytes
+                                                     for v in values))
+        if len(entry['segments']) > MAX_SEGMENTS:
+            # Merge the segments, so that loading doesn't open too many files
+            old = entry['segments']
+            merged = self._load(key, tag_name, -np.inf, np.inf, columns, old)
+            times = merged.index.as_unit('ns').asi8
+            if columns is None:
+                values = [_column(merged.values)]
+            else:
+                values = [_column(merged[c].values) for c in names]
+            segment = str(entry['next'])
+            entry['next'] += 1
+            self._write(key, names, segment, times, values)
+            entry['segments'] = [[segment, int(times[0]), int(times[-1])]]
+            entry['bytes'] = int(times.nbytes + sum(v.nbytes for v in values))
+            for (s, first, last) in old:
+                for c in ['times'] + ['value_' + c for c in names]:
+                    try:
+                        os.remove(self._path(key, c, s))
+                    except OSError:
+                        pass
+        self._index[key] = entry
+
+    def _write(self, key, names, segment, times, values):
+        np.save(self._path(key, 'times', segment), times)
+        for (c, v) in zip(names, values):
+            np.save(self._path(key, 'value_' + c, segment), v)
+
+    def _remove(self, key):
+        del self._index[key]
+        shutil.rmtree(os.path.join(self._dir, key), ignore_errors=True)
+
+    def _evict(self):
+        total = sum(e['bytes'] for e in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]['used']):
+            if total <= self._max_bytes:
+                break
+            total -= self._index[key]['bytes']
+            self._remove(key)
+
+    def _save_index(self):
+        tmp_path = self._index_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self._index, fp)
+        os.replace(tmp_path, self._index_path)
+
+
+def _to_ns(t):
+    """Convert UTC seconds to integer nanoseconds, as stored in the cache. """
+    if np.isinf(t):
+        return np.iinfo(np.int64).max if t > 0 else np.iinfo(np.int64).min
+    return int(round(t*1e9))
+
+
+def _column(values):
+    """Return a column of downloaded values as the NumPy array to store,
+       keeping its dtype unless it is a dtype of Python objects.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype(np.float64)
+    return values
+
+
+def _merge(times, values):
+    """Concatenate pieces of times (in nanoseconds) and of each column of
+       values, sorted by time, keeping the last copy of any repeated time.
+    """
+    times = np.concatenate([np.zeros(0, dtype=np.int64)] + list(times))
+    values = [np.concatenate(v) if len(v) > 0 else np.zeros(0)
+              for v in values]
+    if (len(times) > 1) and np.any(times[1:] <= times[:-1]):
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        keep = np.ones(len(times), dtype=bool)
+        keep[:-1] = times[1:] != times[:-1]
+        times = times[keep]
+        values = [v[order][keep] for v in values]
+    return (times, values)
+
+
+def _slice(data, a, b):
+    """Return the part of a downloaded Series or DataFrame in [a, b). """
+    if len(data) == 0:
+        return data
+    t = data.index.as_unit('ns').asi8
+    return data[(t >= _to_ns(a)) & (t < _to_ns(b))]
+
+
+def _to_pandas(times, values, tag_name, columns):
+    """Build the Pandas object for cached times (in nanoseconds) and values."""
+    index = pd.to_datetime(times, unit='ns', utc=True)
+    if columns is None:
+        return pd.Series(values[0], index=index, name=tag_name)
+    output = pd.DataFrame(dict(zip(columns, values)), index=index,
+                          columns=columns)
+    if 'Num' in columns:
+        output.Num = output.Num.fillna(0).astype(int)
+    return output
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or touching (start, end) ranges. """
+    merged = []
+    for (a, b) in sorted(ranges):
+        if len(merged) > 0 and a <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], b)
+        else:
+            merged.append([a, b])
+    return merged
+
+
+def subtract_ranges(ranges, covered):
+    """Return the parts of the (start, end) ranges not in covered. """
+    output = []
+    for (a, b) in ranges:
+        for (c, d) in merge_ranges(covered):
+            if d <= a or c >= b:
+                continue
+            if c > a:
+                output.append((a, c))
+            a = max(a, d)
+            if a >= b:
+                break
+        if a < b:
+            output.append((a, b))
+    return output
@@ -8,19 +8,48 @@ This module has several advantages over using the PI SDK directly:
     2 - Robustness.  The user may make large requests from a PI historian using
         a single function call, and this module will automatically split the
         request into smaller queries to avoid network timeouts and lost data.
+
+Server and Tag talk to the historian through a backend object.  The default
+backend is PISDK, which needs pywin32 and the PI SDK on Windows; any object
+with the same methods (see the PISDK docstring) may be passed to Server
+instead, e.g. pisynth.SyntheticHistorian for testing and benchmarking.
 """
 #TODO   why is kr1_1300-161-SDV-3015-4.STS returning NaNs?
 #TODO   figure out how to use filter_expressions, document their use
 
+import os
 import sys
+import json
 import math
-import win32com.client
-import pythoncom
-import pywintypes
+import time
+import calendar
+import collections
+import threading
+import queue
+try:
+    import win32com.client
+    import pythoncom
+    import pywintypes
+except ImportError:
+    # Without pywin32, only non-COM backends (such as pisynth) can be used
+    win32com = pythoncom = pywintypes = None
 import datetime
 import pytz
 import numpy as np
 import pandas as pd
+import pisummary
+
+# The statistics that Tag.get_time_averaged_data() can return, mapped to the
+# PI SDK summary types (ArchiveSummariesTypeConstants) that compute them
+SUMMARY_TYPES = collections.OrderedDict([('Avg', 'Average'),
+                                         ('Std', 'StdDev'),
+                                         ('Min', 'Minimum'),
+                                         ('Max', 'Maximum'),
+                                         ('Num', 'Count')])
+SUMMARY_COLUMNS = tuple(SUMMARY_TYPES)
+
+# The most tags whose values Server.get_values_at() requests in one call
+MAX_LIST_SIZE = 1000
 
 sdk = None # single, global interface to the PI SDK
 def sdk_init():
@@ -29,13 +58,42 @@ def sdk_init():
         sdk = PISDK() # initialize the PISDK object
 
 
+_apartment = threading.local() # per-thread state; COM objects can't be
+                               # shared between threads' COM apartments
+def apartment_sdk():
+    """Return the PISDK object for the calling thread's COM apartment.  This
+       is the global sdk object in the thread that first called sdk_init().
+    """
+    sdk_init()
+    if getattr(_apartment, 'sdk', None) is None:
+        if threading.current_thread() is threading.main_thread():
+            _apartment.sdk = sdk
+        else:
+            _apartment.sdk = PISDK()
+    return _apartment.sdk
+
+
 class PISDK(object):
-    """Wrapper around the PI SDK (not any particular server)."""
+    """Wrapper around the PI SDK (not any particular server).
+
+    This is also the default historian backend for Server and Tag.  A backend
+    provides open_server(), new_time_format(), new_point_list(),
+    get_constant(), get_digital_codes() and the thread hooks enter_thread(),
+    for_thread() and leave_thread(); the objects returned by open_server(),
+    new_time_format() and new_point_list() must mimic the PISDK.Server,
+    PITimeServer.PITimeFormat and PISDK.PointList COM objects as far as this
+    module uses them.  Backends other than the PI
+    SDK should raise TimeoutError when a request times out (see is_timeout()).
+    """
 
     def __init__(self):
         # COM PISDK object
         self._pi_sdk = win32com.client.Dispatch('PISDK.PISDK')
 
+        # Memoized enumerated constants, keyed by (collection, constant) name;
+        # looking these up is a COM round trip, and they never change
+        self._constants = dict()
+
     def get_servers(self):
         """Return the names of all PI historians registered on this computer.
            Any of these may be used as the server_name argument to the Server
@@ -55,8 +113,78 @@ class PISDK(object):
         """Return an enumerated constant required by an
            internal PI SDK function call.
         """
-        collection = self._pi_sdk.PIConstants.Item(collection_name)
-        return collection.Item(constant_name)
+        key = (collection_name, constant_name)
+        constant = self._constants.get(key)
+        if constant is None:
+            collection = self._pi_sdk.PIConstants.Item(collection_name)
+            constant = collection.Item(constant_name)
+            self._constants[key] = constant
+        return constant
+
+    def open_server(self, server_name, connection_string):
+        """Open a connection to a PI historian and return its COM object. """
+        pi_server = self._pi_sdk.Servers(server_name)
+        pi_server.Open(connection_string)
+        return pi_server
+
+    def new_time_format(self, pi_server):
+        """Return a PITimeServer.PITimeFormat COM object for times in the
+           time zone of the given (open) PI historian.
+        """
+        pi_time = win32com.client.Dispatch('PITimeServer.PITimeFormat')
+        try:
+            tzi = pi_server.PITimeZoneInfo
+            #pi_time.TimeZoneInfo = tzi
+            # For some reason, simply setting this parameter fails.
+            # This seems to be required instead:
+            attr = 'TimeZoneInfo'
+            pi_time.__LazyMap__(attr)
+            entry = pi_time._olerepr_.propMapPut[attr]
+            pi_time._oleobj_.Invoke(entry.dispid, 0,
+                                    pythoncom.INVOKE_PROPERTYPUTREF, 0,
+                                    tzi)
+        except Exception as e:
+            print('** Error setting TimeZoneInfo: ' + str(e))
+        pi_time.FormatString = 'yyyy-MM-dd hh:mm:ss'
+        return pi_time
+
+    def new_point_list(self):
+        """Return an empty PISDK.PointList COM object, to which PIPoints can
+           be added to request data for all of them at once.
+        """
+        return win32com.client.Dispatch('PISDK.PointList')
+
+    def get_digital_codes(self, values, is_good):
+        """Return the integer codes of a digital tag's values, as found in the
+           first of the "parallel SafeArrays" from PIValues.GetValueArrays(),
+           as an int32 NumPy array with -1 wherever is_good is False.
+        """
+        # In this case, values contains DigitalState PyIDispatch objects, so
+        # each code still has to be read through COM; reading it with the
+        # same dispid straight into one array, and skipping the values that
+        # aren't good, is still much faster than iterating over the pi_vals
+        # collection
+        codes = np.full(len(values), -1, dtype=np.int32)
+        good = np.flatnonzero(is_good)
+        if len(good) > 0:
+            dispid = values[good[0]].GetIDsOfNames('Code')
+            flags = pythoncom.DISPATCH_PROPERTYGET
+            codes[good] = np.fromiter(
+                (values[i].Invoke(dispid, 0, flags, True) for i in good),
+                dtype=np.int32, count=len(good))
+        return codes
+
+    def enter_thread(self):
+        """Prepare a new worker thread for using this backend. """
+        pythoncom.CoInitialize()
+
+    def for_thread(self):
+        """Return the backend object to use from the calling thread. """
+        return apartment_sdk()
+
+    def leave_thread(self):
+        """Undo enter_thread() when a worker thread is finished. """
+        pythoncom.CoUninitialize()
 
 
 class Server:
@@ -69,16 +197,60 @@ class Server:
     the Tag class.
     """
 
-    def __init__(self, server_name, user_name=None, password=None):
+    def __init__(self, server_name, user_name=None, password=None,
+                 max_cached_tags=5000, backend=None, cache=None,
+                 sizer=None, metadata=None, time_zone=None, rollups=None,
+                 metrics=None):
         """Open a connection to a single PI historian.
 
         Args:
-            server_name -- name of the PI historian to connect to
-            user_name   -- optional user name to log into the server with;
-                           try 'piuser' if the default doesn't work
-            password    -- optional password to log into the server with
+            server_name     -- name of the PI historian to connect to
+            user_name       -- optional user name to log into the server with;
+                               try 'piuser' if the default doesn't work
+            password        -- optional password to log into the server with
+            max_cached_tags -- the maximum number of resolved Tag objects to
+                               keep for reuse; see Server.get_tag()
+            backend         -- the historian backend to connect through; by
+                               default, the PI SDK (see PISDK)
+            cache           -- an optional picache.TagCache in which to keep
+                               downloaded data; see Server.set_cache()
+            sizer           -- the RequestSizer that chooses how many values
+                               to request at a time; by default, a new one
+                               that is not saved between runs
+            metadata        -- the MetadataCache in which to keep tag names,
+                               attributes and point types; by default, a new
+                               one with a one-hour time-to-live
+            time_zone       -- the server's TimeZoneRules, e.g. to share the
+                               years already learned with another Server on
+                               the same historian; see
+                               Server.get_time_zone()
+            rollups         -- an optional pirollup.RollupStore from which to
+                               answer time-averaged downloads; see
+                               Server.set_rollups()
+            metrics         -- an optional pimetrics.Metrics in which to
+                               record requests; see Server.set_metrics()
         """
-        sdk_init()
+        self._pi_server = None
+        self._sdk = backend if backend is not None else apartment_sdk()
+
+        # Remember how we connected so that worker threads can open their own
+        # connections for concurrent downloads
+        self._server_name = server_name
+        self._user_name   = user_name
+        self._password    = password
+        self._workers     = None
+        self._workers_lock = threading.Lock()
+        self._server_clock = None # (server time, local time) when last read
+
+        # Resolved Tag objects, least recently used first
+        self._tags = collections.OrderedDict()
+        self._max_cached_tags = max_cached_tags
+        self._cache = cache
+        self._sizer = sizer if sizer is not None else RequestSizer()
+        self._metadata = metadata if metadata is not None else MetadataCache()
+        self._time_zone = time_zone
+        self._rollups = rollups
+        self._metrics = metrics
 
         # Open a connection to the PI historian
         connection_string = ''
@@ -86,31 +258,80 @@ class Server:
             connection_string += 'UID=' + user_name
         if password is not None:
             connection_string += 'PWD=' + password
-        self._pi_server = sdk._pi_sdk.Servers(server_name)
-        self._pi_server.Open(connection_string)
+        self._pi_server = self._sdk.open_server(server_name,
+                                                connection_string)
 
-        # Build a COM time format object to be cloned for all time I/O
-        self._pi_time = win32com.client.Dispatch('PITimeServer.PITimeFormat')
-        try:
-            tzi = self._pi_server.PITimeZoneInfo
-            #self._pi_time.TimeZoneInfo = tzi
-            # For some reason, simply setting this parameter fails.
-            # This seems to be required instead:
-            attr = 'TimeZoneInfo'
-            self._pi_time.__LazyMap__(attr)
-            entry = self._pi_time._olerepr_.propMapPut[attr]
-            self._pi_time._oleobj_.Invoke(entry.dispid, 0,
-                                          pythoncom.INVOKE_PROPERTYPUTREF, 0,
-                                          tzi)
-        except Exception as e:
-            print('** Error setting TimeZoneInfo: ' + str(e))
-        self._pi_time.FormatString = 'yyyy-MM-dd hh:mm:ss'
+        # Build a time format object to be cloned for all time I/O
+        self._pi_time = self._sdk.new_time_format(self._pi_server)
 
     def __del__(self):
         """Close the connection to the PI historian. """
+        if getattr(self, '_workers', None) is not None:
+            self.close_workers()
+        if hasattr(self, '_tags'):
+            self._tags.clear()
         if self._pi_server is not None:
             self._pi_server.Close()
 
+    def set_cache(self, cache):
+        """Keep the data downloaded by the get_tag_*_data() methods in a local,
+           persistent picache.TagCache (or stop doing so if cache is None).
+
+        With a cache, each request only downloads the time ranges that are
+        not already cached for the tag, retrieval mode and interval.  Requests
+        with a filter_expression or improve_start_time, and tags with
+        non-numeric values, always bypass the cache.
+        """
+        self._cache = cache
+        # The workers' connections share the cache, so reopen them
+        self.close_workers()
+
+    def set_rollups(self, rollups):
+        """Answer get_tag_time_averaged_data() from the time-weighted
+           aggregates in a pirollup.RollupStore (or stop doing so if rollups
+           is None).
+
+        Requests for intervals that are a whole number of the store's
+        buckets are computed from the stored buckets, and only the missing
+        buckets are requested from the PI historian.  Other requests, and
+        requests with improve_start_time, go to the PI historian as before.
+        Num, Min and Max are the same as from the PI historian's Summaries
+        call, unless the store builds its buckets from raw values; see the
+        pirollup module.
+        """
+        self._rollups = rollups
+        # The workers' connections share the rollups, so reopen them
+        self.close_workers()
+
+    def get_rollups(self):
+        """Return the pirollup.RollupStore set by set_rollups(), if any. """
+        return self._rollups
+
+    def set_metrics(self, metrics):
+        """Record every request to the PI historian, and the conversion of
+           its values, in a pimetrics.Metrics (or stop doing so if metrics is
+           None).
+        """
+        self._metrics = metrics
+        # The workers' connections share the metrics, so reopen them
+        self.close_workers()
+
+    def get_metrics(self):
+        """Return the pimetrics.Metrics set by set_metrics(), if any. """
+        return self._metrics
+
+    def get_sizer(self):
+        """Return the RequestSizer used by this server's downloads, e.g. to
+           look at its get_stats() when tuning set_timeout().
+        """
+        return self._sizer
+
+    def get_metadata_cache(self):
+        """Return the MetadataCache used by this server, e.g. to invalidate()
+           tags whose attributes have just been edited.
+        """
+        return self._metadata
+
     def get_timeout(self):
         """Return the current value of the server timeout delay, in seconds."""
         return self._pi_server.Timeout
@@ -127,6 +348,8 @@ class Server:
                             canceling
         """
         self._pi_server.Timeout = timeout_secs
+        # The workers' connections have their own timeout, so reopen them
+        self.close_workers()
 
     def get_server_time(self):
         """Return a string with the local date and time at the
@@ -135,6 +358,20 @@ class Server:
         self._pi_time.UTCSeconds = self._pi_server.ServerTime().UTCSeconds
         return self._pi_time.OutputString
 
+    def get_server_seconds(self):
+        """Return the current time at the PI historian, in seconds since the
+           epoch (UTC).
+
+        The time is read from the PI historian at most once a minute, and
+        extrapolated with the local clock in between, so that e.g. checking
+        every tag of a download against the cache doesn't cost a round trip
+        per tag.
+        """
+        now = time.time()
+        if (self._server_clock is None) or (now - self._server_clock[1] > 60):
+            self._server_clock = (self._pi_server.ServerTime().UTCSeconds, now)
+        return self._server_clock[0] + (now - self._server_clock[1])
+
     def get_server_name(self):
         """Return the name of the PI historian. """
         return self._pi_server.Name
@@ -161,6 +398,64 @@ class Server:
         """Return the name of the user logged into the PI historian. """
         return self._pi_server.CurrentUser
 
+    def get_time_zone(self):
+        """Return the TimeZoneRules of the PI historian's time zone, creating
+           them on the first call; they learn each year as convert_times()
+           first needs it.
+        """
+        if self._time_zone is None:
+            self._time_zone = TimeZoneRules.from_time_format(self._pi_time)
+        return self._time_zone
+
+    def local_to_utc(self, local):
+        """Convert an array of local times (as seconds since the epoch, as if
+           they were UTC) with the TimeZoneRules, learning any of their years
+           that the rules don't know yet.
+
+        This is for internal use only.
+        """
+        rules = self.get_time_zone()
+        rules.learn_times(local, self._pi_time)
+        return rules.local_to_utc(local)
+
+    def convert_times(self, times):
+        """Convert many times to seconds since the epoch (UTC) at once.
+
+        Strings in 'yyyy-mm-dd HH:MM:SS' (or any ISO 8601) format and naive
+        datetimes are interpreted as local times in the server's time zone
+        using the TimeZoneRules (see get_time_zone()), without a COM call per
+        time; time zone aware datetimes and numbers (already UTC seconds) are
+        used as they are.  Only times that can't be handled this way, such as
+        PI relative times like '*-1d', are converted by the PI SDK.
+
+        Args:
+            times -- a sequence (list, NumPy array, Pandas Series or Index)
+                     of times in the formats above
+
+        Returns:
+            A float64 NumPy array of seconds since the epoch (UTC).
+        """
+        values = np.asarray(times)
+        if values.dtype.kind in 'iuf':
+            return values.astype(np.float64)
+        if values.dtype.kind == 'M':
+            local = values.astype('datetime64[ns]').view(np.int64)/1e9
+            output = self.local_to_utc(local)
+        else:
+            parsed = pd.to_datetime(pd.Series(values, dtype=object),
+                                    format='ISO8601', errors='coerce')
+            if parsed.dt.tz is not None:
+                return np.where(parsed.isna(), np.nan,
+                                parsed.dt.tz_convert('UTC').dt.tz_localize(None)
+                                .dt.as_unit('ns').astype(np.int64)/1e9)
+            local = np.where(parsed.isna(), np.nan,
+                             parsed.dt.as_unit('ns').astype(np.int64)/1e9)
+            output = self.local_to_utc(local)
+        for i in np.flatnonzero(np.isnan(output)):
+            if not pd.isna(values[i]):
+                output[i] = self.convert_time(values[i]).UTCSeconds
+        return output
+
     def convert_time(self, t):
         """Convert the time t to a PITimeServer.PITimeFormat COMObject.
 
@@ -168,27 +463,68 @@ class Server:
 
         Args:
             t -- Either a string in 'yyyy-mm-dd HH:MM:SS' format,
+                        a number of seconds since the epoch (UTC),
                         a PyTime object, or
                         a PITimeServer.PITimeFormat COMObject
 
         Returns:
             A PITimeServer.PITimeFormat COMObject that may be used directly by
             PI SDK calls.  The input time is interpreted as a local time in the
-            server's time zone.
+            server's time zone.  Strings in the years that the TimeZoneRules
+            have already learned (see get_time_zone()) are converted by them
+            and only the UTC seconds are passed to the PI SDK.
         """
         if (   isinstance(t, str)
             or ((sys.version_info[0]==2) and isinstance(t, unicode)) ):
             pi_time = self._pi_time.Clone()
-            pi_time.InputString = t
+            utc_seconds = np.nan
+            if self._time_zone is not None:
+                utc_seconds = self._time_zone.string_to_utc(t)
+            if np.isnan(utc_seconds):
+                pi_time.InputString = t
+            else:
+                pi_time.UTCSeconds = utc_seconds
+            return pi_time
+        elif isinstance(t, (int, float, np.number)):
+            pi_time = self._pi_time.Clone()
+            pi_time.UTCSeconds = float(t)
             return pi_time
-        elif isinstance(t, pywintypes.TimeType):
+        elif (pywintypes is not None) and isinstance(t, pywintypes.TimeType):
             pi_time = self._pi_time.Clone()
-            pi_time.InputString = val.Format('%Y-%m-%d %H:%M:%S')
+            pi_time.InputString = t.Format('%Y-%m-%d %H:%M:%S')
             return pi_time
         else:
             # XXX Assume it is already a PITimeServer.PITimeFormat COMObject
             return t
 
+    def get_tag(self, tag_name):
+        """Return the Tag object for a PI tag on this server.
+
+        Resolving a tag name costs a round trip to the PI historian, so the
+        most recently used Tag objects are kept and handed out again on later
+        calls.
+        """
+        tag = self._tags.get(tag_name)
+        if tag is not None:
+            self._tags.move_to_end(tag_name)
+            return tag
+        tag = Tag(self, tag_name)
+        self._tags[tag_name] = tag
+        while len(self._tags) > self._max_cached_tags:
+            self._tags.popitem(last=False)
+        return tag
+
+    def find_tag(self, tag_name):
+        """Return get_tag(tag_name), or None if the tag can't be resolved. """
+        try:
+            return self.get_tag(tag_name)
+        except Exception:
+            return None
+
+    def clear_tag_cache(self):
+        """Forget all of the Tag objects kept by get_tag(). """
+        self._tags.clear()
+
     def get_tag_names(self, query='tag="*"'):
         """Get the names of all PI tags that match a given query.
 
@@ -206,39 +542,137 @@ class Server:
 
         Returns:
             A list of the PI tag names (as strings) that fit the query and
-            that the current user has permission to see.
+            that the current user has permission to see.  The list for each
+            query is kept in the MetadataCache.
         """
-        pi_points = self._pi_server.GetPoints(query, None)
-        return [p.Name for p in pi_points]
-
-    def get_tag_attributes(self, tag_names):
+        names = self._metadata.get('names', query)
+        if names is None:
+            pi_points = self._pi_server.GetPoints(query, None)
+            names = [p.Name for p in pi_points]
+            self._metadata.put('names', query, names)
+        return list(names)
+
+    def get_tag_attributes(self, tag_names, max_tags_per_query=200):
         """Get all of the attributes (descriptor, engunits, etc.) for one or
            more PI tags.
 
         Args:
-            tag_names -- iterable collection of PI tag names
+            tag_names          -- iterable collection of PI tag names
+            max_tags_per_query -- see get_tag_metadata()
 
         Returns:
             A dictionary mapping tag names to sub-dictionaries,
             each of which maps tag attribute names to tag attribute values.
+            Tags that could not be found map to empty dictionaries.
         """
-        # This would be much faster if we called self._pi_server.GetPoints()
-        # with a query, then did the Tag.get_all_attributes() work here.
-        attributes = dict()
+        tag_names = list(tag_names)
+        found = self.load_metadata(tag_names, max_tags_per_query)
+        return {tag_name: dict(found.get(tag_name.lower(), dict()))
+                for tag_name in tag_names}
+
+    def get_tag_metadata(self, tag_names, attributes=None,
+                         max_tags_per_query=200):
+        """Get the attributes of many PI tags as a table, e.g. to validate a
+           tag list before downloading data for it.
+
+        Args:
+            tag_names          -- iterable collection of PI tag names
+            attributes         -- the attribute names to return (e.g.
+                                  ['descriptor', 'engunits', 'pointtype']);
+                                  by default, all of them
+            max_tags_per_query -- the number of tags to resolve with a single
+                                  GetPoints() query
+
+        Returns:
+            A Pandas DataFrame indexed by tag name, with one column per
+            attribute.  The rows of tags that could not be found are all NaN.
+        """
+        tag_names = list(tag_names)
+        found = self.load_metadata(tag_names, max_tags_per_query)
+        rows = [found.get(tag_name.lower(), dict()) for tag_name in tag_names]
+        if attributes is None:
+            attributes = []
+            for attrs in rows:
+                attributes.extend(a for a in attrs if a not in attributes)
+        return pd.DataFrame([[attrs.get(a, np.nan) for a in attributes]
+                             for attrs in rows],
+                            index=pd.Index(tag_names, name='tag'),
+                            columns=list(attributes))
+
+    def load_metadata(self, tag_names, max_tags_per_query=200):
+        """Make sure that the MetadataCache holds the attributes and point
+           types of the given PI tags.
+
+        This is for internal use only.  The tags that are not cached yet are
+        resolved with a few GetPoints() queries, each naming up to
+        max_tags_per_query tags, instead of one round trip per tag.  Tag
+        names that a query can't name exactly (those containing the
+        wildcards * or ?, or a double quote), and the tags of a query that
+        fails, are resolved one at a time instead.  Each tag that can't be
+        resolved is reported once.
+
+        Returns:
+            A dictionary mapping the lower-case names of the tags that were
+            found to their attribute dictionaries.
+        """
+        found = dict()
+        missing = []
         for tag_name in tag_names:
+            attrs = self._metadata.get('attributes', tag_name)
+            if attrs is not None:
+                found[tag_name.lower()] = attrs
+            elif tag_name.lower() not in found:
+                missing.append(tag_name)
+                found[tag_name.lower()] = None
+
+        def add(p):
+            # See Tag.get_all_attributes() for why Count is read
+            n = p.PointAttributes.Count
+            attrs = {a.Name: simplify_attribute_value(a.Value)
+                     for a in p.PointAttributes.GetAttributes()}
+            self._metadata.put('attributes', p.Name, attrs)
+            self._metadata.put('point_type', p.Name, p.PointType)
+            found[p.Name.lower()] = attrs
+
+        def lookup(tag_name):
             try:
-                tag = Tag(self, tag_name)
-                attrs = tag.get_all_attributes()
+                add(self._pi_server.PIPoints.Item(tag_name))
             except Exception as e:
-                print(  '** Error getting attribute for "' + tag_name + ':  '
-                      + str(e))
-                attrs = dict()
-            attributes[tag_name] = attrs
-        return attributes
+                print(  '** Error getting attributes for "' + tag_name
+                      + ':  ' + str(e))
+                found.pop(tag_name.lower(), None)
+
+        exact = [n for n in missing if not any(c in n for c in '*?"')]
+        for tag_name in missing:
+            if tag_name not in exact:
+                lookup(tag_name)
+        for i in range(0, len(exact), max_tags_per_query):
+            batch = exact[i:i + max_tags_per_query]
+            query = ' or '.join('tag="' + n + '"' for n in batch)
+            try:
+                pi_points = self._pi_server.GetPoints(query, None)
+                for p in pi_points:
+                    if p.Name.lower() in found:
+                        add(p)
+            except Exception as e:
+                print(  '** Error getting attributes for ' + str(len(batch))
+                      + ' tags starting with "' + batch[0] + '"; resolving'
+                      + ' them one at a time:  ' + str(e))
+                for tag_name in batch:
+                    if found.get(tag_name.lower()) is None:
+                        lookup(tag_name)
+        for tag_name in missing:
+            if (tag_name.lower() in found) and (found[tag_name.lower()]
+                                                is None):
+                print('** Error getting attributes for "' + tag_name
+                      + ':  tag not found')
+                del found[tag_name.lower()]
+        return found
 
     def get_tag_raw_data(self, tag_names, start_time, end_time,
                          max_samples_per_request=100000,
-                         filter_expression=''):
+                         filter_expression='',
+                         num_workers=1, ordered=True):
         """Download every value recorded for one or more PI tags between the
            two given times (inclusive).
 
@@ -259,6 +693,11 @@ class Server:
                                        during a single request from the PI
                                        historian
             filter_expression       --
+            num_workers             -- the number of tags to download at
+                                       once; see Server.download_tags()
+            ordered                 -- if True, then yield the results in the
+                                       same order as tag_names; otherwise,
+                                       yield them as soon as they complete
 
         Yields:
             A 3-tuple, the first element of which is the tag name, the second
@@ -267,27 +706,125 @@ class Server:
             unrecoverable error occurs, then the second (and maybe the third)
             elements are None.
         """
-        # The SDK only allows us to get data one tag at a time
-        for tag_name in tag_names:
-            tag = None
-            try:
-                tag = Tag(self, tag_name)
-                data = tag.get_large_raw_data(start_time, end_time,
-                                              max_samples_per_request,
+        def download(tag, max_samples_per_request):
+            def fetch(t1, t2):
+                return tag.get_large_raw_data(t1, t2, max_samples_per_request,
                                               filter_expression)
-                max_samples_per_request = min(max_samples_per_request,
-                                              tag._max_samples_per_request)
+            if filter_expression != '':
+                return fetch(start_time, end_time)
+            return self.cached_download(tag, 'raw', start_time, end_time,
+                                        fetch)
+        return self.download_tags(tag_names, download,
+                                  max_samples_per_request,
+                                  num_workers, ordered)
+
+    def stream_tag_raw_data(self, tag_names, start_time, end_time,
+                            max_samples_per_request=100000,
+                            filter_expression='',
+                            num_workers=1, max_pending_chunks=4):
+        """Download every value recorded for one or more PI tags between the
+           two given times, yielding each downloaded chunk as it arrives.
+
+        Unlike get_tag_raw_data(), no tag's full history is ever held in
+        memory, so long downloads can be aggregated or written to disk in
+        constant memory.  With num_workers > 1, the worker threads keep
+        downloading while the caller processes earlier chunks, but stop once
+        max_pending_chunks chunks are waiting.  Streamed data bypasses the
+        cache (see Server.set_cache()).
+
+        Args:
+            tag_names               -- an iterable sequence of PI tag names for
+                                       which to download data
+            start_time              -- a starting time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            end_time                -- an ending time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            max_samples_per_request -- the maximum number of values to download
+                                       during a single request from the PI
+                                       historian
+            filter_expression       --
+            num_workers             -- the number of tags to download at
+                                       once; see Server.download_tags()
+            max_pending_chunks      -- with num_workers > 1, the number of
+                                       downloaded chunks that may wait to be
+                                       yielded
+
+        Yields:
+            A 2-tuple of (tag name, chunk), where chunk is a non-empty part of
+            the Pandas Series that Tag.get_large_raw_data() would return.
+            Each tag's chunks are yielded in time order, but with
+            num_workers > 1 the chunks of different tags are interleaved.  If
+            an unrecoverable error occurs, then the error is printed and no
+            more chunks are yielded for that tag.
+        """
+        if num_workers <= 1:
+            try:
+                for tag_name in tag_names:
+                    try:
+                        tag = self.get_tag(tag_name)
+                        for chunk in tag.iter_raw_data(
+                                start_time, end_time, max_samples_per_request,
+                                filter_expression):
+                            yield (tag_name, chunk)
+                    except Exception as e:
+                        print(  '** Error getting data for "' + tag_name
+                              + ':  ' + str(e))
+            finally:
+                self._sizer.save()
+            return
+
+        workers = self.get_workers(num_workers)
+        results = queue.Queue(max_pending_chunks)
+        cancelled = threading.Event()
+
+        def put(item):
+            # Give up if the caller has stopped iterating, so that a worker
+            # never blocks forever on a full queue
+            while not cancelled.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def task(server, tag_name):
+            try:
+                if cancelled.is_set():
+                    return
+                tag = server.get_tag(tag_name)
+                for chunk in tag.iter_raw_data(start_time, end_time,
+                                               max_samples_per_request,
+                                               filter_expression):
+                    if not put((tag_name, chunk)):
+                        return
             except Exception as e:
                 print(  '** Error getting data for "' + tag_name + ':  '
                       + str(e))
-                data = None
-            yield (tag_name, data, tag)
+            finally:
+                put((tag_name, None))
+
+        tasks = ((tag_name,) for tag_name in tag_names)
+        num_tasks = workers.submit_from(task, tasks, num_workers)
+        try:
+            while num_tasks > 0:
+                (tag_name, chunk) = results.get()
+                if chunk is None:
+                    num_tasks += workers.submit_from(task, tasks, 1) - 1
+                else:
+                    yield (tag_name, chunk)
+        finally:
+            cancelled.set()
+            self._sizer.save()
 
     def get_tag_interpolated_data(self, tag_names, start_time, end_time,
                                   interval_secs=600,
                                   max_samples_per_request=50000,
                                   filter_expression='',
-                                  improve_start_time=False):
+                                  improve_start_time=False,
+                                  num_workers=1, ordered=True):
         """Download interpolated values of one or more PI tags.
 
         The data is requested at evenly spaced points in time between the two
@@ -321,6 +858,11 @@ class Server:
                                        creation time because the tag creation
                                        time might not be an "even" number
                                        relative to interval_secs
+            num_workers             -- the number of tags to download at
+                                       once; see Server.download_tags()
+            ordered                 -- if True, then yield the results in the
+                                       same order as tag_names; otherwise,
+                                       yield them as soon as they complete
 
         Yields:
             A 3-tuple, the first element of which is the tag name, the second
@@ -329,28 +871,26 @@ class Server:
             is the Tag object.  If an unrecoverable error occurs, then the
             second (and maybe the third) elements are None.
         """
-        # The SDK only allows us to get data one tag at a time
-        for tag_name in tag_names:
-            tag = None
-            try:
-                tag = Tag(self, tag_name)
-                data = tag.get_large_interpolated_data(start_time, end_time,
-                                                       interval_secs,
+        def download(tag, max_samples_per_request):
+            def fetch(t1, t2):
+                return tag.get_large_interpolated_data(t1, t2, interval_secs,
                                                        max_samples_per_request,
                                                        filter_expression,
                                                        improve_start_time)
-                max_samples_per_request = min(max_samples_per_request,
-                                              tag._max_samples_per_request)
-            except Exception as e:
-                print(  '** Error getting data for "' + tag_name + ':  '
-                      + str(e))
-                data = None
-            yield (tag_name, data, tag)
+            if (filter_expression != '') or improve_start_time:
+                return fetch(start_time, end_time)
+            return self.cached_download(tag, 'interpolated', start_time,
+                                        end_time, fetch, interval_secs)
+        return self.download_tags(tag_names, download,
+                                  max_samples_per_request,
+                                  num_workers, ordered)
 
     def get_tag_time_averaged_data(self, tag_names, start_time, end_time,
                                    interval_secs=600,
                                    max_samples_per_request=50000,
-                                   improve_start_time=False):
+                                   improve_start_time=False,
+                                   num_workers=1, ordered=True,
+                                   summaries=SUMMARY_COLUMNS):
         """Download time-averaged values of one or more PI tags.
 
         The data is requested at evenly spaced points in time between the two
@@ -359,7 +899,9 @@ class Server:
         request size if a server timeout occurs (so no data is lost).
         Note that averaging is done by the PI historian assuming that we have
         a true continuous signal, where interpolation between recorded values
-        is performed as by get_tag_interpolated_data().
+        is performed as by get_tag_interpolated_data().  With rollups (see
+        Server.set_rollups()), the averages are computed locally instead,
+        wherever the stored buckets can answer the request.
 
         Args:
             tag_names               -- an iterable sequence of PI tag names for
@@ -384,6 +926,13 @@ class Server:
                                        creation time because the tag creation
                                        time might not be an "even" number
                                        relative to interval_secs
+            num_workers             -- the number of tags to download at
+                                       once; see Server.download_tags()
+            ordered                 -- if True, then yield the results in the
+                                       same order as tag_names; otherwise,
+                                       yield them as soon as they complete
+            summaries               -- the statistics to download; see
+                                       Tag.get_time_averaged_data()
 
         Yields:
             A 3-tuple, the first element of which is the tag name, the second
@@ -392,22 +941,946 @@ class Server:
             is the Tag object.  If an unrecoverable error occurs, then the
             second (and maybe the third) elements are None.
         """
-        # The SDK only allows us to get data one tag at a time
-        for tag_name in tag_names:
+        def download(tag, max_samples_per_request):
+            def fetch(t1, t2):
+                return tag.get_large_time_averaged_data(t1, t2, interval_secs,
+                                                        max_samples_per_request,
+                                                        improve_start_time,
+                                                        summaries)
+            if improve_start_time:
+                return fetch(start_time, end_time)
+            if self._rollups is not None:
+                output = self._rollups.get(tag, start_time, end_time,
+                                           interval_secs, summaries)
+                if output is not None:
+                    return output
+            return self.cached_download(tag, 'averaged', start_time,
+                                        end_time, fetch, interval_secs,
+                                        list(summaries))
+        return self.download_tags(tag_names, download,
+                                  max_samples_per_request,
+                                  num_workers, ordered)
+
+    def get_partitioned_raw_data(self, tag_name, start_time, end_time,
+                                 max_samples_per_request=100000,
+                                 filter_expression='',
+                                 num_partitions=8, num_workers=None):
+        """Download every value recorded for a single PI tag over a long time
+           range, splitting the range into num_partitions parts that are
+           downloaded concurrently.
+
+        This is just like Tag.get_large_raw_data(), but a long backfill is
+        limited by the number of requests in flight rather than by waiting
+        for each request in turn.  Each part keeps the timeout back-off of
+        Tag.get_large_raw_data(), and the parts are joined in time order.
+        Unlike Tag.get_large_raw_data(), the time range can't be reversed:
+        end_time must not be before start_time.
+
+        Args:
+            tag_name                -- the name of the PI tag
+            start_time              -- a starting time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            end_time                -- an ending time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            max_samples_per_request -- the maximum number of values to download
+                                       during a single request from the PI
+                                       historian
+            filter_expression       --
+            num_partitions          -- the number of parts to split the time
+                                       range into
+            num_workers             -- the number of parts to download at
+                                       once; see Server.download_tags().  By
+                                       default, the size of this server's
+                                       worker pool, or num_partitions if it
+                                       has none yet.
+
+        Returns:
+            The same as Tag.get_large_raw_data().
+        """
+        (t1, t2) = self.convert_times([start_time, end_time])
+        if t2 < t1:
+            raise ValueError('end_time is before start_time')
+        # Round the inner edges to whole seconds, keeping the outer ones
+        edges = np.floor(np.linspace(t1, t2, num_partitions + 1))
+        edges = np.unique(np.concatenate([[t1], edges[1:-1], [t2]]))
+
+        def fetch(server, tag, a, b):
+            def download(a, b):
+                return tag.get_large_raw_data(a, b, max_samples_per_request,
+                                              filter_expression)
+            if filter_expression != '':
+                return download(a, b)
+            return server.cached_download(tag, 'raw', a, b, download)
+        chunks = self.download_partitions(tag_name, edges, fetch, num_workers)
+        return join_chunks(chunks, pd.Series(name=tag_name))
+
+    def get_partitioned_interpolated_data(self, tag_name, start_time,
+                                          end_time, interval_secs=600,
+                                          max_samples_per_request=50000,
+                                          filter_expression='',
+                                          num_partitions=8,
+                                          num_workers=None):
+        """Download interpolated values of a single PI tag over a long time
+           range, splitting the range into num_partitions parts that are
+           downloaded concurrently; see get_partitioned_raw_data().
+
+        The parts start and end on the same grid of samples that
+        Tag.get_large_interpolated_data() would use for the whole range, so
+        the result is the same.
+
+        Returns:
+            The same as Tag.get_large_interpolated_data().
+        """
+        (t1, t2) = self.convert_times([start_time, end_time])
+        if t2 < t1:
+            raise ValueError('end_time is before start_time')
+        num_samples = max(0, int(math.floor((t2 - t1)/interval_secs)))
+        steps = np.unique(np.linspace(0, num_samples, num_partitions + 1)
+                          .round().astype(np.int64))
+        edges = t1 + steps*interval_secs
+
+        def fetch(server, tag, a, b):
+            def download(a, b):
+                return tag.get_large_interpolated_data(
+                    a, b, interval_secs, max_samples_per_request,
+                    filter_expression)
+            if filter_expression != '':
+                return download(a, b)
+            return server.cached_download(tag, 'interpolated', a, b, download,
+                                          interval_secs)
+        chunks = self.download_partitions(tag_name, edges, fetch, num_workers)
+        return join_chunks(chunks, pd.Series(name=tag_name))
+
+    def download_partitions(self, tag_name, edges, fetch, num_workers):
+        """Run fetch(server, tag, a, b) concurrently over the consecutive
+           time ranges [a, b) between the edges (in UTC seconds), for one PI
+           tag.
+
+        This is for internal use only.  The chunks are returned in time
+        order, with any value at or before the end of the previous non-empty
+        chunk dropped, so that values on a boundary between two ranges are
+        not repeated.  If any range fails, then its error is raised once all
+        of the ranges are done.  If num_workers is None, then it's the size
+        of the worker pool, or the number of ranges if there is no pool yet.
+        """
+        if num_workers is None:
+            with self._workers_lock:
+                workers = self._workers
+            num_workers = (workers.size if workers is not None
+                           else max(1, len(edges) - 1))
+        workers = self.get_workers(num_workers)
+        results = queue.Queue()
+
+        def task(server, i, a, b):
+            try:
+                results.put((i, fetch(server, server.get_tag(tag_name), a, b),
+                             None))
+            except Exception as e:
+                results.put((i, None, e))
+
+        tasks = ((i, float(edges[i]), float(edges[i + 1]))
+                 for i in range(len(edges) - 1))
+        chunks = [None]*(len(edges) - 1)
+        errors = []
+        num_tasks = workers.submit_from(task, tasks, num_workers)
+        while num_tasks > 0:
+            (i, chunks[i], e) = results.get()
+            num_tasks += workers.submit_from(task, tasks, 1) - 1
+            if e is not None:
+                errors.append(e)
+        self._sizer.save()
+        if len(errors) > 0:
+            raise errors[0]
+
+        output = []
+        for chunk in chunks:
+            if (len(output) > 0) and (len(chunk) > 0):
+                chunk = chunk[chunk.index > output[-1].index[-1]]
+            if len(chunk) > 0:
+                output.append(chunk)
+        return output
+
+    def get_interpolated_frame(self, tag_names, start_time, end_time,
+                               interval_secs=600,
+                               max_samples_per_request=50000,
+                               num_workers=1, dtype=np.float64,
+                               digital='categorical'):
+        """Download interpolated values of one or more PI tags as a single
+           wide DataFrame; see get_tag_interpolated_data() and make_frame().
+
+        Returns:
+            A 2-tuple of (frame, is_good), as documented for make_frame().
+        """
+        return make_frame(self.get_tag_interpolated_data(
+                              tag_names, start_time, end_time, interval_secs,
+                              max_samples_per_request,
+                              num_workers=num_workers),
+                          dtype, digital)
+
+    def get_time_averaged_frame(self, tag_names, start_time, end_time,
+                                interval_secs=600, summary='Avg',
+                                max_samples_per_request=50000,
+                                num_workers=1, dtype=np.float64):
+        """Download one time-averaged statistic (e.g. 'Avg') of one or more PI
+           tags as a single wide DataFrame; see get_tag_time_averaged_data()
+           and make_frame().  Digital tags are given as numbers.
+
+        Returns:
+            A 2-tuple of (frame, is_good), as documented for make_frame().
+        """
+        results = self.get_tag_time_averaged_data(
+            tag_names, start_time, end_time, interval_secs,
+            max_samples_per_request, num_workers=num_workers,
+            summaries=[summary])
+        return make_frame(((tag_name, None if data is None else data[summary],
+                            tag)
+                           for (tag_name, data, tag) in results),
+                          dtype, 'codes')
+
+    def get_values_at(self, tag_names, t='*', num_workers=1, digital='codes'):
+        """Get the value of each of a list of PI tags at a single time (by
+           default the current, snapshot values), e.g. for status or routing
+           tags where only the latest state matters.
+
+        Only one value is transferred per tag, instead of a series to take
+        the last value of, and all of the values are requested in a single
+        PI SDK list call (PointList.Data.ArcValue()) per MAX_LIST_SIZE tags.
+        Each tag is still resolved once (see get_tag()) before its first
+        request.  If the list call fails (e.g. with an older PI SDK), then
+        the tags are requested one at a time instead, num_workers at a time.
+
+        Args:
+            tag_names   -- an iterable sequence of PI tag names
+            t           -- the time (in the server's time zone) in one of the
+                           formats accepted by Server.convert_time(), or '*'
+                           for now; it is converted once, so that all of the
+                           tags are read at the same time
+            num_workers -- the number of tags to request at once if the list
+                           call fails; see Server.download_tags()
+            digital     -- how to give the values of digital tags: 'codes'
+                           for the integer codes, or 'names' for the digital
+                           state names (see Tag.get_code_names())
+
+        Returns:
+            A Pandas Series indexed by tag name (in the order of tag_names)
+            and named by the (UTC) time.  Tags that are not good at that time,
+            or that could not be read, have NaN.
+        """
+        t = self.convert_times([t])[0]
+        tag_names = list(tag_names)
+
+        def convert(tag, value):
+            if tag._is_digital:
+                if (value is None) or (value < 0):
+                    return np.nan
+                if digital == 'names':
+                    names = tag.get_code_names()
+                    return names[value] if value < len(names) else np.nan
+            return value
+
+        found = dict()
+        tags = []
+        for tag_name in _unique(tag_names):
+            tag = self.find_tag(tag_name)
+            if tag is None:
+                print(  '** Error getting data for "' + tag_name
+                      + ':  tag not found')
+            else:
+                tags.append(tag)
+        try:
+            for k in range(0, len(tags), MAX_LIST_SIZE):
+                part = tags[k:k + MAX_LIST_SIZE]
+                for (tag, value) in zip(part, self.read_values_at(part, t)):
+                    found[tag._tag_name] = convert(tag, value)
+        except Exception as e:
+            print(  '** Error getting a list of values; requesting them one'
+                  + ' tag at a time:  ' + str(e))
+            def download(tag, max_samples_per_request):
+                return convert(tag, tag.get_value_at(t))
+            for (tag_name, value, tag) in self.download_tags(
+                    [tag._tag_name for tag in tags], download, 1, num_workers):
+                found[tag_name] = value
+        values = [found.get(tag_name) for tag_name in tag_names]
+        values = [np.nan if value is None else value for value in values]
+        return pd.Series(values, index=pd.Index(tag_names, name='tag'),
+                         name=pd.Timestamp(t, unit='s', tz='UTC'))
+
+    def read_values_at(self, tags, t):
+        """Get the values of several Tags at a single time (in UTC seconds)
+           with one PI SDK list call.
+
+        This is for internal use only.
+
+        Returns:
+            A list of the values, in the order of tags, as returned by
+            Tag.get_value_at().
+        """
+        pi_list = self._sdk.new_point_list()
+        for tag in tags:
+            pi_list.Add(tag._pi_point)
+        t0 = time.perf_counter()
+        try:
+            point_values = pi_list.Data.ArcValue(
+                self.convert_time(t),
+                self._sdk.get_constant('RetrievalTypeConstants',
+                                       'Interpolated'))
+        except Exception as e:
+            if self._metrics is not None:
+                self._metrics.record_request('(list)', 'value', t0,
+                                             time.perf_counter(), len(tags),
+                                             e, is_timeout(e))
+            raise
+        if self._metrics is not None:
+            self._metrics.record_request('(list)', 'value', t0,
+                                         time.perf_counter(), len(tags))
+        received = dict()
+        for point_value in point_values:
+            pi_value = point_value.PIValue
+            received[point_value.PIPoint.Name.lower()] = (pi_value.Value,
+                                                          pi_value.IsGood())
+        output = []
+        for tag in tags:
+            (value, is_good) = received.get(tag._tag_name.lower(),
+                                            (None, False))
+            if tag._is_digital:
+                output.append(int(self._sdk.get_digital_codes(
+                    np.array([value], dtype=object),
+                    np.array([is_good]))[0]))
+            elif is_good:
+                output.append(value)
+            else:
+                output.append(tag._default_value)
+        return output
+
+    def get_snapshots(self, tag_names, num_workers=1, digital='codes'):
+        """Get the current (snapshot) value of each of a list of PI tags; see
+           get_values_at().
+        """
+        return self.get_values_at(tag_names, '*', num_workers, digital)
+
+    def compute_tag_time_averaged_data(self, tag_names, start_time, end_time,
+                                       interval_secs=600,
+                                       summaries=SUMMARY_COLUMNS,
+                                       lookback_secs=86400,
+                                       max_samples_per_request=100000,
+                                       num_workers=1, ordered=True):
+        """This is just like get_tag_time_averaged_data(), except that the
+           statistics are computed locally from each tag's raw values; see
+           Tag.compute_time_averaged_data().  With a cache (see
+           Server.set_cache()), repeated calls for other intervals or windows
+           over the same period only read the cached raw values.
+
+        Yields:
+            A 3-tuple, the first element of which is the tag name, the second
+            element of which is the return value from
+            Tag.compute_time_averaged_data(), and the third element of which
+            is the Tag object.  If an unrecoverable error occurs, then the
+            second (and maybe the third) elements are None.
+        """
+        def download(tag, max_samples_per_request):
+            return tag.compute_time_averaged_data(
+                start_time, end_time, interval_secs, summaries,
+                lookback_secs=lookback_secs,
+                max_samples_per_request=max_samples_per_request)
+        return self.download_tags(tag_names, download,
+                                  max_samples_per_request,
+                                  num_workers, ordered)
+
+    def cached_download(self, tag, mode, start_time, end_time, fetch,
+                        interval_secs=None, columns=None):
+        """Download data for a Tag through the local cache, if there is one.
+
+        Args:
+            tag           -- the Tag to download data for
+            mode          -- 'raw', 'interpolated' or 'averaged'
+            start_time    -- a starting time in one of the formats accepted by
+                             Server.convert_time()
+            end_time      -- an ending time in one of the formats accepted by
+                             Server.convert_time()
+            fetch         -- a function fetch(t1, t2) that downloads the data
+                             between two times, given in UTC seconds
+            interval_secs -- the time between samples, for evenly spaced data
+            columns       -- the DataFrame columns returned by fetch, or None
+                             if it returns a Series
+
+        Returns:
+            The return value of fetch(start_time, end_time), either downloaded
+            or (partly) assembled from the cache.
+        """
+        if (self._cache is None) or (tag._default_value == ''):
+            return fetch(start_time, end_time)
+        server = tag._server
+        t1 = server.convert_time(start_time).UTCSeconds
+        t2 = server.convert_time(end_time).UTCSeconds
+        if t1 >= t2:
+            return fetch(start_time, end_time)
+        if interval_secs is not None:
+            # Evenly spaced samples are cached separately for each grid
+            t2 = t1 + math.floor((t2 - t1)/interval_secs)*interval_secs
+            mode += '@{0:g}+{1:g}'.format(interval_secs, t1 % interval_secs)
+        if columns is not None:
+            mode += '[' + ','.join(columns) + ']'
+        return self._cache.get(self._server_name, tag._tag_name, mode, t1, t2,
+                               fetch, server.get_server_seconds, columns,
+                               interval_secs)
+
+    def get_workers(self, num_workers):
+        """Return the pool of worker threads used for concurrent downloads,
+           creating it, or adding threads to it, so that it has at least
+           num_workers threads.
+
+        This is for internal use only.  There is one pool per Server, sized
+        for the largest request so far; a request for fewer workers keeps at
+        most num_workers of its tasks in the pool at once (see
+        _WorkerPool.submit_from()), so it only occupies that many threads.
+        """
+        with self._workers_lock:
+            if self._workers is None:
+                self._workers = _WorkerPool(self, num_workers)
+            elif self._workers.size < num_workers:
+                self._workers.grow(num_workers)
+            return self._workers
+
+    def close_workers(self):
+        """Stop the worker threads used for concurrent downloads, once they
+           have finished their tasks.  They are started again by the next
+           download with num_workers > 1.
+        """
+        with self._workers_lock:
+            workers = self._workers
+            self._workers = None
+        if workers is not None:
+            workers.close()
+
+    def download_tags(self, tag_names, download, max_samples_per_request,
+                      num_workers=1, ordered=True):
+        """Run a per-tag download function over one or more PI tags.
+
+        This is the engine behind the get_tag_*_data() generators.  The SDK
+        only allows us to get data one tag at a time, so with num_workers > 1
+        the tags are handed to a bounded pool of worker threads, each of which
+        has its own COM apartment and its own connection to the PI historian
+        (COM objects cannot be shared between apartments).  The pool is kept
+        open between calls, so each worker's Tag objects are reused just as
+        get_tag() reuses them in the calling thread, and is shared by
+        concurrent requests of different sizes.  The workers share this
+        server's RequestSizer, which is saved (if it has a path) once all of
+        the tags are done, or when the caller stops iterating or an error is
+        raised.
+
+        Args:
+            tag_names               -- an iterable sequence of PI tag names
+            download                -- a function download(tag,
+                                       max_samples_per_request) returning the
+                                       data for a single Tag
+            max_samples_per_request -- the maximum number of values to
+                                       download during a single request
+            num_workers             -- the number of tags to download at once;
+                                       1 means download in the calling thread
+            ordered                 -- if True, then yield the results in the
+                                       same order as tag_names; otherwise,
+                                       yield them as soon as they complete
+
+        Yields:
+            A 3-tuple of (tag name, data, Tag object), as documented for
+            get_tag_raw_data().  The Tag object always belongs to this
+            server's own connection (a worker's Tag cannot be used outside
+            its thread's apartment), so with num_workers > 1 it is resolved
+            again, in the calling thread, for each tag that was downloaded.
+        """
+        if num_workers <= 1:
+            try:
+                for tag_name in tag_names:
+                    tag = None
+                    try:
+                        tag = self.get_tag(tag_name)
+                        data = download(tag, max_samples_per_request)
+                    except Exception as e:
+                        print(  '** Error getting data for "' + tag_name
+                              + ':  ' + str(e))
+                        data = None
+                    yield (tag_name, data, tag)
+            finally:
+                self._sizer.save()
+            return
+
+        workers = self.get_workers(num_workers)
+        results = queue.Queue()
+
+        def task(server, tag_name, i):
             tag = None
             try:
-                tag = Tag(self, tag_name)
-                data = tag.get_large_time_averaged_data(start_time, end_time,
-                                                        interval_secs,
-                                                        max_samples_per_request,
-                                                        improve_start_time)
-                max_samples_per_request = min(max_samples_per_request,
-                                              tag._max_samples_per_request)
+                tag = server.get_tag(tag_name)
+                data = download(tag, max_samples_per_request)
             except Exception as e:
                 print(  '** Error getting data for "' + tag_name + ':  '
                       + str(e))
                 data = None
-            yield (tag_name, data, tag)
+            results.put((i, (tag_name, data, tag is not None)))
+
+        tasks = ((tag_name, i) for (i, tag_name) in enumerate(tag_names))
+        num_tasks = workers.submit_from(task, tasks, num_workers)
+        pending = dict()
+        next_index = 0
+        try:
+            while num_tasks > 0:
+                (i, (tag_name, data, found)) = results.get()
+                num_tasks += workers.submit_from(task, tasks, 1) - 1
+                result = (tag_name, data,
+                          self.find_tag(tag_name) if found else None)
+                if not ordered:
+                    yield result
+                    continue
+                pending[i] = result
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+        finally:
+            self._sizer.save()
+
+
+class _WorkerPool(object):
+    """A fixed set of threads, each with its own COM apartment and its own
+       connection to the same PI historian, for Server.download_tags().
+    """
+
+    def __init__(self, server, num_workers):
+        self.size = 0
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        args = (server._server_name, server._user_name, server._password,
+                server._max_cached_tags)
+        kwargs = {'sizer': server._sizer, 'metadata': server._metadata,
+                  'cache': server._cache,
+                  'time_zone': server.get_time_zone(),
+                  'rollups': server._rollups,
+                  'metrics': server._metrics}
+        self._work_args = (server._sdk, args, kwargs, server.get_timeout())
+        self.grow(num_workers)
+
+    def grow(self, num_workers):
+        """Start more worker threads, so that there are num_workers. """
+        with self._lock:
+            for n in range(self.size, num_workers):
+                t = threading.Thread(target=self._work, args=self._work_args,
+                                     daemon=True)
+                t.start()
+                self._threads.append(t)
+            self.size = max(self.size, num_workers)
+
+    def _work(self, backend, args, kwargs, timeout_secs):
+        backend.enter_thread()
+        try:
+            try:
+                server = Server(*args, backend=backend.for_thread(),
+                                **kwargs)
+                server.set_timeout(timeout_secs)
+            except Exception as e:
+                server = _FailedServer(e)
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                (fn, task_args) = task
+                fn(server, *task_args)
+            if isinstance(server, Server):
+                server.clear_tag_cache()
+            server = None
+        finally:
+            backend.leave_thread()
+
+    def submit(self, fn, *args):
+        """Call fn(server, *args) in the next free worker thread. """
+        self._tasks.put((fn, args))
+
+    def submit_from(self, fn, tasks, count):
+        """Submit fn(server, *args) for up to count more of the argument
+           tuples in the iterator tasks, and return how many were submitted.
+
+        A request that wants at most n tasks running submits n to start with,
+        and then one more as each of its tasks finishes, so that it never
+        holds more than n of the pool's threads.
+        """
+        num_submitted = 0
+        while num_submitted < count:
+            args = next(tasks, None)
+            if args is None:
+                break
+            self.submit(fn, *args)
+            num_submitted += 1
+        return num_submitted
+
+    def close(self):
+        """Stop the worker threads once they have finished their tasks. """
+        with self._lock:
+            threads = list(self._threads)
+        for t in threads:
+            self._tasks.put(None)
+        for t in threads:
+            if t is not threading.current_thread():
+                t.join()
+
+
+class _FailedServer(object):
+    """Stands in for a worker's Server if its connection could not be opened,
+       so that every tag given to that worker reports the error.
+    """
+
+    def __init__(self, error):
+        self._error = error
+
+    def get_tag(self, tag_name):
+        raise self._error
+
+
+class FederatedServer(object):
+    """Interface to several PI historians as if they were one Server.
+
+    Each tag is routed to its historian by a lookup table of tag names or,
+    failing that, by the longest matching tag name prefix (e.g. 'KZA_' for
+    all of one field's tags), or else to a default historian.  A request for
+    a list of tags is split by historian, the historians are queried
+    concurrently (each from a worker thread of its own Server, with its own
+    num_workers), and the results are merged into the same shape that a
+    single Server returns.  The get_tag_*_data() generators yield each tag
+    as soon as its historian returns it (in the order of the tags requested
+    if ordered is True).  Tags that can't be routed are reported and treated
+    like tags that could not be read.
+
+    Times given as strings are converted in the time zone of the default
+    historian (or the first one), so the historians should share a time
+    zone, or times should be given as UTC seconds.
+
+    Only the Server methods that read tags are provided here (the
+    get_tag_*_data() generators, the frames, values, metadata, tag names
+    and Tag objects, and time conversion).  Everything that belongs to one
+    historian (its cache, rollups, metrics, request sizer, timeout, worker
+    pool and server details) is set and read on that historian's Server,
+    from get_server(), and applies to the requests made through the
+    FederatedServer too.
+    """
+
+    def __init__(self, servers, prefixes=None, lookup=None, default=None):
+        """Route tags to already open Servers.
+
+        Args:
+            servers  -- a dictionary mapping names to Server objects
+            prefixes -- an optional dictionary mapping tag name prefixes to
+                        server names
+            lookup   -- an optional dictionary mapping tag names to server
+                        names, which takes precedence over the prefixes
+            default  -- the name of the server for tags that match neither,
+                        or None to report them as errors
+        """
+        self._servers = collections.OrderedDict(servers)
+        self._prefixes = sorted(((p.lower(), n) for (p, n)
+                                 in (prefixes or dict()).items()),
+                                key=lambda pn: -len(pn[0]))
+        self._lookup = dict((t.lower(), n)
+                            for (t, n) in (lookup or dict()).items())
+        self._default = default
+        names = ([n for (p, n) in self._prefixes] + list(self._lookup.values())
+                 + ([] if default is None else [default]))
+        unknown = sorted(set(n for n in names if n not in self._servers))
+        if len(unknown) > 0:
+            raise ValueError('unknown servers: ' + ', '.join(unknown))
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """Stop the worker threads of the historians' Servers; see
+           Server.close_workers().
+        """
+        for server in getattr(self, '_servers', dict()).values():
+            server.close_workers()
+
+    def get_server(self, name):
+        """Return the Server with the given name. """
+        return self._servers[name]
+
+    def route(self, tag_name):
+        """Return the name of the server of a tag, or None if it has none. """
+        key = tag_name.lower()
+        if key in self._lookup:
+            return self._lookup[key]
+        for (prefix, name) in self._prefixes:
+            if key.startswith(prefix):
+                return name
+        return self._default
+
+    def convert_times(self, times):
+        """Convert times to UTC seconds as the default server does; see
+           Server.convert_times().
+        """
+        return self._primary().convert_times(times)
+
+    def convert_time(self, t):
+        """Convert a time as the default server does; see
+           Server.convert_time().
+        """
+        return self._primary().convert_time(t)
+
+    def get_tag(self, tag_name):
+        """Return a Tag object from the historian of a tag; see
+           Server.get_tag().  Raises ValueError if the tag can't be routed.
+        """
+        name = self.route(tag_name)
+        if name is None:
+            raise ValueError('no PI historian for tag "' + tag_name + '"')
+        return self._servers[name].get_tag(tag_name)
+
+    def find_tag(self, tag_name):
+        """Return a Tag object from the historian of a tag, or None if the
+           tag can't be routed or found; see Server.find_tag().
+        """
+        name = self.route(tag_name)
+        return None if name is None else self._servers[name].find_tag(tag_name)
+
+    def get_tag_names(self, query='tag="*"'):
+        """Return the names of the tags matching a query on any of the
+           historians (each name once, in the order of the servers); see
+           Server.get_tag_names().
+        """
+        tag_names = []
+        seen = set()
+        for server in self._servers.values():
+            for tag_name in server.get_tag_names(query):
+                if tag_name.lower() not in seen:
+                    seen.add(tag_name.lower())
+                    tag_names.append(tag_name)
+        return tag_names
+
+    def get_values_at(self, tag_names, t='*', num_workers=1,
+                      digital='codes'):
+        """See Server.get_values_at(). """
+        t = self.convert_times([t])[0]
+        tag_names = list(tag_names)
+        parts = self._call(tag_names, 'get_values_at', t, num_workers,
+                           digital)
+        values = pd.concat([pd.Series(dtype=np.float64)]
+                           + [p for p in parts.values() if p is not None])
+        values = values[~values.index.duplicated()].reindex(tag_names)
+        values.index.name = 'tag'
+        values.name = pd.Timestamp(t, unit='s', tz='UTC')
+        return values
+
+    def get_snapshots(self, tag_names, num_workers=1, digital='codes'):
+        """See Server.get_snapshots(). """
+        return self.get_values_at(tag_names, '*', num_workers, digital)
+
+    def get_interpolated_frame(self, tag_names, start_time, end_time,
+                               *args, **kwargs):
+        """See Server.get_interpolated_frame(). """
+        return self._frame(tag_names, 'get_interpolated_frame', start_time,
+                           end_time, *args, **kwargs)
+
+    def get_time_averaged_frame(self, tag_names, start_time, end_time,
+                                *args, **kwargs):
+        """See Server.get_time_averaged_frame(). """
+        return self._frame(tag_names, 'get_time_averaged_frame', start_time,
+                           end_time, *args, **kwargs)
+
+    def get_tag_raw_data(self, tag_names, start_time, end_time,
+                         max_samples_per_request=100000,
+                         filter_expression='',
+                         num_workers=1, ordered=True):
+        """See Server.get_tag_raw_data(). """
+        return self._results(tag_names, 'get_tag_raw_data', start_time,
+                             end_time, max_samples_per_request,
+                             filter_expression, num_workers=num_workers,
+                             ordered=ordered)
+
+    def get_tag_interpolated_data(self, tag_names, start_time, end_time,
+                                  interval_secs=600,
+                                  max_samples_per_request=50000,
+                                  filter_expression='',
+                                  improve_start_time=False,
+                                  num_workers=1, ordered=True):
+        """See Server.get_tag_interpolated_data(). """
+        return self._results(tag_names, 'get_tag_interpolated_data',
+                             start_time, end_time, interval_secs,
+                             max_samples_per_request, filter_expression,
+                             improve_start_time, num_workers=num_workers,
+                             ordered=ordered)
+
+    def get_tag_time_averaged_data(self, tag_names, start_time, end_time,
+                                   interval_secs=600,
+                                   max_samples_per_request=50000,
+                                   improve_start_time=False,
+                                   num_workers=1, ordered=True,
+                                   summaries=SUMMARY_COLUMNS):
+        """See Server.get_tag_time_averaged_data(). """
+        return self._results(tag_names, 'get_tag_time_averaged_data',
+                             start_time, end_time, interval_secs,
+                             max_samples_per_request, improve_start_time,
+                             num_workers=num_workers,
+                             ordered=ordered, summaries=summaries)
+
+    def get_tag_metadata(self, tag_names, *args, **kwargs):
+        """See Server.get_tag_metadata(). """
+        tag_names = list(tag_names)
+        parts = self._call(tag_names, 'get_tag_metadata', *args, **kwargs)
+        frames = [p for p in parts.values() if p is not None]
+        if len(frames) == 0:
+            return pd.DataFrame(index=tag_names)
+        metadata = pd.concat(frames, axis=0)
+        return metadata[~metadata.index.duplicated()].reindex(tag_names)
+
+    # --- internals ---
+
+    def _primary(self):
+        name = self._default
+        if name is None:
+            name = next(iter(self._servers))
+        return self._servers[name]
+
+    def _thread(self, name):
+        """Return the pool of worker threads that queries one historian.
+
+        This is the historian's own Server pool (see Server.get_workers()),
+        so its connections have the Server's current cache, rollups, metrics
+        and timeout; the Server reopens them whenever those change.
+        """
+        return self._servers[name].get_workers(1)
+
+    def _groups(self, tag_names):
+        """Return an ordered dictionary mapping server names to their share
+           of tag_names (each name once), reporting the tags with no server.
+        """
+        groups = collections.OrderedDict()
+        for tag_name in tag_names:
+            name = self.route(tag_name)
+            if name is None:
+                print(  '** Error getting data for "' + tag_name
+                      + ':  no PI historian for this tag')
+                continue
+            groups.setdefault(name, [])
+            if tag_name not in groups[name]:
+                groups[name].append(tag_name)
+        return groups
+
+    def _call(self, tag_names, method, *args, **kwargs):
+        """Call a Server method with each historian's share of tag_names,
+           concurrently, and return a dictionary mapping the server names to
+           the results (None for a server that failed).
+        """
+        groups = self._groups(tag_names)
+        results = queue.Queue()
+
+        def task(server, name, names):
+            try:
+                output = getattr(server, method)(names, *args, **kwargs)
+            except Exception as e:
+                print('** Error getting data from "' + name + ':  ' + str(e))
+                output = None
+            results.put((name, output))
+        for (name, names) in groups.items():
+            self._thread(name).submit(task, name, names)
+        outputs = dict(results.get() for name in groups)
+        return collections.OrderedDict((name, outputs[name])
+                                       for name in groups)
+
+    def _frame(self, tag_names, method, *args, **kwargs):
+        tag_names = list(tag_names)
+        frames = []
+        masks = []
+        for part in self._call(tag_names, method, *args, **kwargs).values():
+            if part is None:
+                continue
+            (frame, is_good) = part
+            frames.append(frame)
+            masks.append(pd.DataFrame(is_good, index=frame.index,
+                                      columns=frame.columns))
+        if len(frames) == 0:
+            frame = pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC'))
+            masks = [pd.DataFrame(index=frame.index, dtype=bool)]
+        else:
+            frame = pd.concat(frames, axis=1).sort_index()
+        frame = frame.reindex(columns=tag_names)
+        is_good = pd.concat(masks, axis=1).reindex(index=frame.index,
+                                                   columns=tag_names)
+        return (frame, is_good.fillna(False).to_numpy(dtype=bool))
+
+    def _results(self, tag_names, method, *args, **kwargs):
+        """Run a get_tag_*_data() generator on each historian's share of
+           tag_names, concurrently, and yield its (tag name, data, Tag
+           object) tuples as they arrive, or in the order of tag_names if
+           the ordered keyword argument is True.  A tag that is requested more than once is
+           yielded each time.
+
+        The historian's thread only passes on whether each tag was found, so
+        that no COM object leaves that thread, and the caller's own Tag
+        object is yielded instead.  If the caller stops reading, then the
+        historians stop after their current tag.
+        """
+        tag_names = list(tag_names)
+        ordered = kwargs.get('ordered', True)
+        counts = collections.Counter(tag_names)
+        groups = self._groups(tag_names)
+        results = queue.Queue()
+        stop = threading.Event()
+
+        def task(server, name, names):
+            output = None
+            try:
+                output = getattr(server, method)(names, *args, **kwargs)
+                for (tag_name, data, tag) in output:
+                    results.put((name, (tag_name, data, tag is not None)))
+                    if stop.is_set():
+                        break
+            except Exception as e:
+                print('** Error getting data from "' + name + ':  ' + str(e))
+            finally:
+                if hasattr(output, 'close'):
+                    output.close()
+                results.put((name, None))
+
+        pending = set(n for names in groups.values() for n in names)
+        found = dict((tag_name, (tag_name, None, None))
+                     for tag_name in counts if tag_name not in pending)
+        next_index = 0
+        try:
+            for (name, names) in groups.items():
+                self._thread(name).submit(task, name, names)
+            num_running = len(groups)
+            while True:
+                if not ordered:
+                    for (tag_name, result) in list(found.items()):
+                        del found[tag_name]
+                        for k in range(counts[tag_name]):
+                            yield result
+                else:
+                    while (    (next_index < len(tag_names))
+                           and (tag_names[next_index] in found)):
+                        tag_name = tag_names[next_index]
+                        counts[tag_name] -= 1
+                        if counts[tag_name] == 0:
+                            yield found.pop(tag_name)
+                        else:
+                            yield found[tag_name]
+                        next_index += 1
+                if num_running == 0:
+                    break
+                (name, result) = results.get()
+                if result is None:
+                    # The server is done; any of its tags that it didn't
+                    # return could not be read
+                    num_running -= 1
+                    for tag_name in groups[name]:
+                        if tag_name in pending:
+                            pending.discard(tag_name)
+                            found[tag_name] = (tag_name, None, None)
+                    continue
+                (tag_name, data, tag) = result
+                pending.discard(tag_name)
+                tag = self._servers[name].find_tag(tag_name) if tag else None
+                found[tag_name] = (tag_name, data, tag)
+        finally:
+            stop.set()
 
 
 class Tag:
@@ -427,6 +1900,7 @@ class Tag:
         """
         self._tag_name = tag_name
         self._server   = server
+        self._sdk      = server._sdk
 
         # The maximum number of values to ask for at once from the server;
         # this may get automatically adjusted to avoid server timeouts, but
@@ -441,19 +1915,31 @@ class Tag:
         self._pi_point = server._pi_server.PIPoints.Item(tag_name)
 
         # Choose a default value to return when an error occurs while
-        # communicating with the PI historian
+        # communicating with the PI historian.  The point type is read once
+        # here (or taken from the server's MetadataCache), since every
+        # conversion of downloaded values depends on it.
+        self._point_type = None
+        self._is_digital = False
+        self._digital_set = None
         try:
-            pt = self._pi_point.PointType
-            if (  (pt == sdk.get_constant('PointTypeConstants', 'String').Value)
-                | (pt == sdk.get_constant('PointTypeConstants', 'Blob').Value)
-                | (pt == sdk.get_constant('PointTypeConstants', 'TimeStamp').Value)):
+            pt = server._metadata.get('point_type', tag_name)
+            if pt is None:
+                pt = self._pi_point.PointType
+                server._metadata.put('point_type', tag_name, pt)
+            self._point_type = pt
+            self._is_digital = (
+                pt == self._sdk.get_constant('PointTypeConstants',
+                                             'Digital').Value)
+            if (  (pt == self._sdk.get_constant('PointTypeConstants', 'String').Value)
+                | (pt == self._sdk.get_constant('PointTypeConstants', 'Blob').Value)
+                | (pt == self._sdk.get_constant('PointTypeConstants', 'TimeStamp').Value)):
                 # "Blob" means an arbitrary array of binary data.
                 # "Digital" means that a data value is a code into the
                 #   "digitalset" strings (e.g., 0 for 'Open', 1 for 'Closed').
                 # "TimeStamp" data will be converted to strings.
                 self._default_value = ''
             else:
-                self._default_value = np.NaN
+                self._default_value = np.nan
         except Exception:
             # don't worry too much about defaults if it has no pointtype
             self._default_value = None
@@ -463,17 +1949,16 @@ class Tag:
         """Convert an attribute value into a basic Python type.
            This is just a helper function for the other *Attribute*() methods.
         """
-        if isinstance(val, pywintypes.TimeType):
-            return val.Format('%Y-%m-%d %H:%M:%S')
-        elif isinstance(val, win32com.client.CDispatch):
-            return str(val)
-        return val
+        return simplify_attribute_value(val)
 
 
     def get_attribute(self, attribute_name):
         """Get a single attribute (descriptor, engunits, etc.) of the
            PI tag.
         """
+        attrs = self._server._metadata.get('attributes', self._tag_name)
+        if (attrs is not None) and (attribute_name in attrs):
+            return attrs[attribute_name]
         val = self._pi_point.PointAttributes.Item(attribute_name).Value
         return self.simplify_attribute_value(val)
 
@@ -488,69 +1973,135 @@ class Tag:
         # seems to be the best way to force the SDK to grab all of the
         # attributes in a single network request and NOT return a severely
         # reduced set of results.
-        n = self._pi_point.PointAttributes.Count
-        return {a.Name:self.simplify_attribute_value(a.Value)
-                for a in self._pi_point.PointAttributes.GetAttributes()}
+        attrs = self._server._metadata.get('attributes', self._tag_name)
+        if attrs is None:
+            n = self._pi_point.PointAttributes.Count
+            attrs = {a.Name:self.simplify_attribute_value(a.Value)
+                     for a in self._pi_point.PointAttributes.GetAttributes()}
+            self._server._metadata.put('attributes', self._tag_name, attrs)
+        return dict(attrs)
 
 
     def get_code_names(self):
         """Get the string equivalents of the digital codes for this tag
            (e.g., ['Open','Closed'] for a valve where the interpolated values
            would all be 0 or 1)
+
+        The code table of each digital set is kept in the server's
+        MetadataCache, and this tag remembers its digital set, so that
+        decoding doesn't repeat any requests to the PI historian.
         """
-        if (   self._pi_point.PointType
-            == sdk.get_constant('PointTypeConstants', 'Digital').Value):
-            names = self.get_attribute('digitalset').split('_')
-        else:
-            names = None
-        return names
+        if not self._is_digital:
+            return None
+        if self._digital_set is None:
+            self._digital_set = self.get_attribute('digitalset')
+        names = self._server._metadata.get('code_table', self._digital_set)
+        if names is None:
+            names = self._digital_set.split('_')
+            self._server._metadata.put('code_table', self._digital_set, names)
+        return list(names)
+
+
+    def decode_digital(self, data):
+        """Convert the integer codes downloaded for a digital tag into a
+           Pandas Series of Categorical digital state names (see
+           get_code_names()).  Codes of -1 (no good value) and codes that
+           aren't in the tag's digital set become missing values.
+        """
+        return pd.Series(decode_codes(data.values, self.get_code_names()),
+                         index=data.index, name=data.name)
 
 
-    def pivals_to_series(self, pi_vals):
+    def pivals_to_series(self, pi_vals, digital=None, mode=None):
         """Convert a PIValues Collection into a Pandas Series.
            Iterating over the PIValues collection is very slow.  This function
-           encapsulates all of the steps necessary to do this efficiently.
+           encapsulates all of the steps necessary to do this efficiently:
+           the "parallel SafeArrays" are converted straight into NumPy arrays,
+           and quality masking, default substitution and the conversion of the
+           times are all done on whole arrays at once.
 
         Returns:
             A tuple:
               1 - the first value of which is the full Pandas Series with all
                   of the resulting data;
-              2 - the second value of which is a Boolean list of the same
-                  length as the Series with true iff the corresponding element
-                  of the Series was marked IsGood by the PI historian;
-              3 - the 
+              2 - the second value of which is a Boolean NumPy array of the
+                  same length as the Series with true iff the corresponding
+                  element of the Series was marked IsGood by the PI historian;
+              3 - the third value of which is the time of the last value, in
+                  seconds since the epoch (UTC), or NaN if there were none
+            The values of digital tags (unless digital is False, e.g. for
+            summaries) are int32 codes, with -1 for the values that are not
+            good; see decode_digital().  If mode is given, then the
+            conversion is recorded under that retrieval mode in the server's
+            pimetrics.Metrics, if it has one.
         """
+        metrics = self._server._metrics if mode is not None else None
+        if metrics is not None:
+            t0 = time.perf_counter()
+        if digital is None:
+            digital = self._is_digital
         if pi_vals.Count == 0:
-            last_time = np.NaN
-            is_good = []
+            last_time = np.nan
+            is_good = np.zeros(0, dtype=bool)
             index = None
             data = None
         else:
             sa = pi_vals.GetValueArrays() # "parallel SafeArrays"
-            last_time = sa[1][-1]
-            is_good = [(sa[2][i] >= 0) for i in range(len(sa[0]))]
-            index = [datetime.datetime.fromtimestamp(t, pytz.utc)
-                     for t in sa[1]]
-            if (   self._pi_point.PointType
-                != sdk.get_constant('PointTypeConstants', 'Digital').Value):
-                # Having the if statement inside the list comprehension is
-                # required to ensure that no PyIDispatch objects are returned
-                data = [(sa[0][i] if is_good[i] else self._default_value)
-                        for i in range(len(sa[0]))]
+            times = np.asarray(sa[1], dtype=np.float64)
+            last_time = times[-1]
+            is_good = np.asarray(sa[2]) >= 0
+            index = pd.to_datetime(times, unit='s', utc=True)
+            if not digital:
+                # Values that are not good come back as PyIDispatch objects
+                # (system digital states), which makes the array dtype object;
+                # they must be replaced before converting to a numeric dtype
+                values = np.asarray(sa[0])
+                if is_good.all():
+                    data = values
+                else:
+                    data = np.where(is_good, values, self._default_value)
+                    if (   (data.dtype == object)
+                        and isinstance(self._default_value, float)):
+                        data = data.astype(np.float64)
             else:
-                # In this case, sa[0] contains PyIDispatch objects;
-                # retrieving the code from these objects is still much faster
-                # than iterating over the pi_vals collection;
-                # to convert these codes into strings, index into the
-                # "digitalset" attribute
-                dispid = sa[0][0].GetIDsOfNames('Code')
-                flags = pythoncom.DISPATCH_PROPERTYGET
-                data = [(sa[0][i].Invoke(dispid, 0, flags, True)
-                         if is_good[i] else self._default_value)
-                        for i in range(len(sa[0]))]
+                # To convert these codes into strings, index into the
+                # "digitalset" attribute (see decode_digital())
+                data = self._sdk.get_digital_codes(sa[0], is_good)
         output = pd.Series(data=data, index=index, name=self._tag_name)
+        if metrics is not None:
+            metrics.record_conversion(self._tag_name, mode, t0,
+                                      time.perf_counter(), len(output),
+                                      output.values.nbytes + 8*len(output))
         return (output, is_good, last_time)
 
+    def request(self, mode, size, method, *args):
+        """Call a method of the PI point's PIData object (e.g. 'RecordedValues')
+           and return its result, recording the request in the server's
+           pimetrics.Metrics, if it has one (see Server.set_metrics()).
+
+        This is for internal use only.
+
+        Args:
+            mode   -- the retrieval mode, for the metrics
+            size   -- the number of values or intervals requested, if known
+            method -- the name of the PIData method
+            args   -- the arguments of the method
+        """
+        metrics = self._server._metrics
+        if metrics is None:
+            return getattr(self._pi_point.Data, method)(*args)
+        t0 = time.perf_counter()
+        try:
+            output = getattr(self._pi_point.Data, method)(*args)
+        except Exception as e:
+            metrics.record_request(self._tag_name, mode, t0,
+                                   time.perf_counter(), size, e,
+                                   is_timeout(e))
+            raise
+        metrics.record_request(self._tag_name, mode, t0, time.perf_counter(),
+                               size)
+        return output
+
 
     def get_raw_data(self, start_time, end_time, filter_expression=''):
         """Download every value recorded for the given tag between the two
@@ -573,17 +2124,19 @@ class Tag:
             They will all be in Coordinated Universal Time (UTC).
         """
         # Download the data
-        pi_vals = self._pi_point.Data.RecordedValues(
+        pi_vals = self.request(
+            'raw', None, 'RecordedValues',
             self._server.convert_time(start_time),
             self._server.convert_time(end_time),
-            sdk.get_constant('BoundaryTypeConstants', 'Inside'),
+            self._sdk.get_constant('BoundaryTypeConstants', 'Inside'),
             filter_expression,
-            sdk.get_constant('FilteredViewConstants', 'Remove Filtered'),
+            self._sdk.get_constant('FilteredViewConstants', 'Remove Filtered'),
             None)
 
         # Convert the data from PI SDK types to Python types, filtering out the
         # values not marked as "good"
-        (output, is_good, last_time) = self.pivals_to_series(pi_vals)
+        (output, is_good, last_time) = self.pivals_to_series(pi_vals,
+                                                             mode='raw')
         output = output[is_good]
         return output
 
@@ -592,42 +2145,65 @@ class Tag:
                            max_samples_per_request=100000,
                            filter_expression=''):
         """This is just like get_raw_data(), except that the processing is
-           split across multiple downloads of max_samples_per_request values
-           each.  If a server timeout occurs, then max_samples_per_request is
-           reduced and the request is re-tried (so no data will be lost).
+           split across multiple downloads of at most max_samples_per_request
+           values each.  If a server timeout occurs, then the download size is
+           reduced and the request is re-tried (so no data will be lost); the
+           size grows again after successful downloads, and the server's
+           RequestSizer remembers it for the next download of this tag.
+        """
+        # Collect the batches and join them once at the end; concatenating
+        # after every batch would copy the growing result each time
+        chunks = list(self.iter_raw_data(start_time, end_time,
+                                         max_samples_per_request,
+                                         filter_expression))
+        return join_chunks(chunks, pd.Series(name=self._tag_name))
+
+
+    def iter_raw_data(self, start_time, end_time,
+                      max_samples_per_request=100000,
+                      filter_expression=''):
+        """This is just like get_large_raw_data(), except that it is a
+           generator that yields each downloaded batch of good values as a
+           (non-empty) Pandas Series as soon as it arrives, so that the full
+           history of the tag is never held in memory at once.
         """
         t1 = self._server.convert_time(start_time)
         t2 = self._server.convert_time(end_time)
         if t1.UTCSeconds < t2.UTCSeconds:
-            dir_const = sdk.get_constant('DirectionConstants', 'Forward')
+            dir_const = self._sdk.get_constant('DirectionConstants', 'Forward')
             dir_delta = +1e-3
         else:
-            dir_const = sdk.get_constant('DirectionConstants', 'Reverse')
+            dir_const = self._sdk.get_constant('DirectionConstants', 'Reverse')
             dir_delta = -1e-3
-        max_samples_per_request = np.int32(min(max_samples_per_request,
-                                               self._max_samples_per_request))
-        output = pd.Series(name=self._tag_name)
+        sizer = self._server._sizer
+        max_size = max_samples_per_request
+        max_samples_per_request = sizer.start(self._tag_name, 'raw', max_size)
         done = False
         while not done:
             # Download this batch of samples
             try:
-                pi_vals = self._pi_point.Data.RecordedValuesByCount(
+                pi_vals = self.request(
+                    'raw', max_samples_per_request, 'RecordedValuesByCount',
                     t1, max_samples_per_request, dir_const,
-                    sdk.get_constant('BoundaryTypeConstants', 'Inside'),
+                    self._sdk.get_constant('BoundaryTypeConstants', 'Inside'),
                     filter_expression,
-                    sdk.get_constant('FilteredViewConstants',
+                    self._sdk.get_constant('FilteredViewConstants',
                                      'Remove Filtered'),
                     None)
             except Exception as e:
-                if is_timeout(e) and (max_samples_per_request > 100):
-                    max_samples_per_request = np.int32(
-                        max_samples_per_request / 2)
+                if (    is_timeout(e)
+                    and (max_samples_per_request > sizer.min_size)):
+                    max_samples_per_request = sizer.timed_out(
+                        self._tag_name, 'raw', max_samples_per_request)
                     print(  '\t*** WARNING:  ' + str(e) + '\n'
                           + '\t***   reducing max_samples_per_request to '
                           + str(max_samples_per_request) + '\n')
                     self._max_samples_per_request = max_samples_per_request
                     continue
                 else:
+                    if is_timeout(e):
+                        sizer.timed_out(self._tag_name, 'raw',
+                                        max_samples_per_request, retry=False)
                     print('\t*** ERROR:  ' + str(e))
                     raise
 
@@ -635,7 +2211,11 @@ class Tag:
             # the values not marked as "good"
             if pi_vals.Count == 0:
                 break
-            (tmp,is_good,last_time) = self.pivals_to_series(pi_vals)
+            max_samples_per_request = sizer.succeeded(
+                self._tag_name, 'raw', max_samples_per_request, max_size,
+                pi_vals.Count)
+            (tmp,is_good,last_time) = self.pivals_to_series(pi_vals,
+                                                            mode='raw')
             time_limit = datetime.datetime.fromtimestamp(t2.UTCSeconds,
                                                          pytz.utc)
             tmp = tmp[is_good]
@@ -647,14 +2227,12 @@ class Tag:
                 done = last_time <= t2.UTCSeconds
                 if done:
                     tmp = tmp[tmp.index > time_limit]
-            output = pd.concat([output,tmp], axis=0)
+            if len(tmp) > 0:
+                yield tmp
 
             # Move to the next batch unless we've completed the time interval
             t1.UTCSeconds = last_time + dir_delta
 
-        # Return the results
-        return output
-
 
     def get_interpolated_data(self, start_time, end_time, num_samples,
                               filter_expression=''):
@@ -678,27 +2256,58 @@ class Tag:
 
         Returns:
             All of the values in a single Pandas time Series, with the values
-            not marked as "good" replaced by the default value for this tag.
+            not marked as "good" replaced by the default value for this tag
+            (or by the code -1 for digital tags).
             The times will be monotonic and equally spaced.
             They will all be in Coordinated Universal Time (UTC).
         """
         # Download the data; note that InterpolatedValues() always returns the
         # value at end_time, which we don't want, so we ask for one extra
         # sample and drop it later
-        pi_vals = self._pi_point.Data.InterpolatedValues(
+        pi_vals = self.request(
+            'interpolated', num_samples, 'InterpolatedValues',
             self._server.convert_time(start_time),
             self._server.convert_time(end_time),
             num_samples + 1,
             filter_expression,
-            sdk.get_constant('FilteredViewConstants', 'Remove Filtered'),
+            self._sdk.get_constant('FilteredViewConstants', 'Remove Filtered'),
             None)
 
         # Convert the data from PI SDK types to Python types
-        (output, is_good, last_time) = self.pivals_to_series(pi_vals)
+        (output, is_good, last_time) = self.pivals_to_series(
+            pi_vals, mode='interpolated')
         output = output.iloc[0:-1] # delete the extra sample at end_time
         return output
 
 
+    def get_value_at(self, t='*'):
+        """Download the (interpolated) value of the PI tag at a single time,
+           by default the current (snapshot) value.
+
+        Args:
+            t -- the time (in the server's time zone) in one of the formats
+                 accepted by Server.convert_time(), or '*' for now
+
+        Returns:
+            The value, as in get_interpolated_data(): the default value for
+            this tag (or the code -1 for digital tags) if it isn't good.
+        """
+        # Ask for the values at t and one second later, since a request for a
+        # single value would be at end_time rather than at t
+        t1 = self._server.convert_time(t)
+        t2 = t1.Clone()
+        t2.UTCSeconds = t1.UTCSeconds + 1
+        pi_vals = self.request(
+            'value', 1, 'InterpolatedValues', t1, t2, 2, '',
+            self._sdk.get_constant('FilteredViewConstants', 'Remove Filtered'),
+            None)
+        (output, is_good, last_time) = self.pivals_to_series(pi_vals,
+                                                             mode='value')
+        if len(output) == 0:
+            return -1 if self._is_digital else self._default_value
+        return output.iloc[0]
+
+
     def get_large_interpolated_data(self, start_time, end_time,
                                     interval_secs=600,
                                     max_samples_per_request=50000,
@@ -707,7 +2316,9 @@ class Tag:
         """This is just like get_interpolated_data(), except that a specific
            Delta t is imposed and the processing is split across multiple
            downloads.  If a server timeout occurs, then the download size is
-           reduced and the request is re-tried (so no data will be lost).
+           reduced and the request is re-tried (so no data will be lost); the
+           size grows again after successful downloads, and the server's
+           RequestSizer remembers it for the next download of this tag.
 
         Args:
             start_time              -- a starting time (in the server's time
@@ -720,9 +2331,11 @@ class Tag:
                                        samples
             max_samples_per_request -- the maximum number of samples to request
                                        at a time; if a server timeout occurs,
-                                       then this will be reduced and stored in
+                                       then fewer will be requested, and the
+                                       reduced size is stored in
                                        self._max_samples_per_request for the
-                                       caller's reference
+                                       caller's reference (it is not changed
+                                       by downloads without timeouts)
             filter_expression       --
             improve_start_time      -- if True, then if start_time is earlier
                                        than the tag's creation date, then reset
@@ -735,7 +2348,8 @@ class Tag:
 
         Returns:
             All of the values in a single Pandas time Series, with the values
-            not marked as "good" replaced by the default value for this tag.
+            not marked as "good" replaced by the default value for this tag
+            (or by the code -1 for digital tags).
             The times will be monotonic and equally spaced.
             They will all be in Coordinated Universal Time (UTC).
         """
@@ -754,11 +2368,13 @@ class Tag:
                      # PI tag's creationdate fails for some reason
         t2 = self._server.convert_time(end_time)
         t_end = t2.Clone()
-        max_samples_per_request = np.int32(min(max_samples_per_request,
-                                               self._max_samples_per_request))
+        sizer = self._server._sizer
+        max_size = max_samples_per_request
+        max_samples_per_request = sizer.start(self._tag_name, 'interpolated',
+                                              max_size)
 
         # Download the data
-        output = pd.Series(name=self._tag_name)
+        chunks = []
         while True:
             # Decide how many samples to grab in this batch.
             # Include the end time of the last batch, or the start time of
@@ -776,26 +2392,34 @@ class Tag:
                 new_output = self.get_interpolated_data(
                     t1, t2, num_samples, filter_expression)
             except Exception as e:
-                if is_timeout(e) and (num_samples > 100):
-                    max_samples_per_request = np.int32(num_samples / 2)
+                if is_timeout(e) and (num_samples > sizer.min_size):
+                    max_samples_per_request = sizer.timed_out(
+                        self._tag_name, 'interpolated', num_samples)
                     print(  '\t*** WARNING:  ' + str(e) + '\n'
                           + '\t***   reducing max_samples_per_request to '
                           + str(max_samples_per_request) + '\n')
                     self._max_samples_per_request = max_samples_per_request
                     continue
                 else:
+                    if is_timeout(e):
+                        sizer.timed_out(self._tag_name, 'interpolated', num_samples,
+                                        retry=False)
                     print('\t*** ERROR:  ' + str(e))
                     raise
-            output = pd.concat([output,new_output], axis=0)
+            chunks.append(new_output)
+            max_samples_per_request = sizer.succeeded(
+                self._tag_name, 'interpolated', max_samples_per_request,
+                max_size, num_samples)
 
             # Go to the next batch
             t1.UTCSeconds = t2.UTCSeconds
 
         # Return the results
-        return output
+        return join_chunks(chunks, pd.Series(name=self._tag_name))
 
 
-    def get_time_averaged_data(self, start_time, end_time, num_intervals):
+    def get_time_averaged_data(self, start_time, end_time, num_intervals,
+                               summaries=SUMMARY_COLUMNS):
         """Download a fixed number of time-averaged values of the given PI tag
            between the two given times (exclusive of the end_time).  Make only
            a single request from the PI historian, i.e. do not catch any
@@ -813,7 +2437,11 @@ class Tag:
                                  one of the formats accepted by
                                  Server.convert_time()
             num_intervals     -- the number of samples to download
-            filter_expression --
+            summaries         -- the statistics to download, as a sequence of
+                                 the column names below; only the requested
+                                 statistics are computed by the PI historian,
+                                 and the (event weighted) Num column costs a
+                                 second request
 
         Returns:
             A Pandas DataFrame, indexed by time.  The times will be monotonic
@@ -828,53 +2456,84 @@ class Tag:
                 Num   -- number of recorded events for the tag over the
                          interval; note that Num==0 does not imply that the
                          data is bad
+            Only the columns named in summaries are included, in that order.
             We used to include the percentage of the raw data that was "good"
             (via cnt_vals[n].ValueAttributes.Item('PercentGood').Value), but
             this would add a significant amount of COM overhead.
         """
-        # Download the data
-        pi_summaries = self._pi_point.Data.Summaries(
-            self._server.convert_time(start_time),
-            self._server.convert_time(end_time),
-            sdk.get_constant('BoundaryTypeConstants', 'Inside'),
-            sdk.get_constant('ArchiveSummariesTypeConstants',
-                             'All Supported Summary types'),
-            num_intervals,
-            sdk.get_constant('CalculationBasisConstants', 'Time Weighted'),
-            None)
-        pi_counts = self._pi_point.Data.Summaries(
-            self._server.convert_time(start_time),
-            self._server.convert_time(end_time),
-            sdk.get_constant('BoundaryTypeConstants', 'Inside'),
-            sdk.get_constant('ArchiveSummariesTypeConstants', 'Count'),
-            num_intervals,
-            sdk.get_constant('CalculationBasisConstants', 'Event Weighted'),
-            None)
-
-        # Convert the data from PI SDK types to Python types
-        if pi_summaries.Count == 0:
-            output = pd.DataFrame(columns=['Avg', 'Std', 'Min', 'Max', 'Num'])
+        summaries = list(summaries)
+        unknown = [c for c in summaries if c not in SUMMARY_TYPES]
+        if len(unknown) > 0:
+            raise ValueError('unknown summaries: ' + ', '.join(unknown))
+
+        # Download the data; the time-weighted statistics all come back from
+        # a single request for the combination of their summary types
+        pi_values = dict()
+        time_weighted = [c for c in summaries if c != 'Num']
+        if len(time_weighted) > 0:
+            summary_type = 0
+            for c in time_weighted:
+                summary_type |= self._sdk.get_constant(
+                    'ArchiveSummariesTypeConstants', SUMMARY_TYPES[c]).Value
+            pi_summaries = self.request(
+                'averaged', num_intervals, 'Summaries',
+                self._server.convert_time(start_time),
+                self._server.convert_time(end_time),
+                self._sdk.get_constant('BoundaryTypeConstants', 'Inside'),
+                summary_type,
+                num_intervals,
+                self._sdk.get_constant('CalculationBasisConstants',
+                                       'Time Weighted'),
+                None)
+            if pi_summaries.Count > 0:
+                for c in time_weighted:
+                    pi_values[c] = pi_summaries.Item(SUMMARY_TYPES[c]).Value
+        if 'Num' in summaries:
+            pi_counts = self.request(
+                'averaged', num_intervals, 'Summaries',
+                self._server.convert_time(start_time),
+                self._server.convert_time(end_time),
+                self._sdk.get_constant('BoundaryTypeConstants', 'Inside'),
+                self._sdk.get_constant('ArchiveSummariesTypeConstants',
+                                       'Count'),
+                num_intervals,
+                self._sdk.get_constant('CalculationBasisConstants',
+                                       'Event Weighted'),
+                None)
+            if pi_counts.Count > 0:
+                pi_values['Num'] = pi_counts.Item('Count').Value
+
+        # Convert the data from PI SDK types to Python types; the metrics
+        # count each interval once, however many summaries it has
+        metrics = self._server._metrics
+        t0 = time.perf_counter()
+        if len(pi_values) < len(summaries):
+            output = pd.DataFrame(columns=summaries)
         else:
-            (avg_vals, is_good, last_time) = self.pivals_to_series(pi_summaries.Item('Average').Value)
-            (std_vals, is_good, last_time) = self.pivals_to_series(pi_summaries.Item('StdDev' ).Value)
-            (min_vals, is_good, last_time) = self.pivals_to_series(pi_summaries.Item('Minimum').Value)
-            (max_vals, is_good, last_time) = self.pivals_to_series(pi_summaries.Item('Maximum').Value)
-            (cnt_vals, is_good, last_time) = self.pivals_to_series(pi_counts.Item('Count').Value)
-            output = pd.concat([avg_vals, std_vals, min_vals, max_vals, cnt_vals],
-                               axis=1)
-            output.columns=['Avg', 'Std', 'Min', 'Max', 'Num']
-            output.Num = output.Num.astype(int)
+            output = pd.DataFrame({c: self.pivals_to_series(pi_values[c],
+                                                            False)[0]
+                                   for c in summaries},
+                                  columns=summaries)
+            if 'Num' in summaries:
+                output.Num = output.Num.astype(int)
+        if metrics is not None:
+            metrics.record_conversion(self._tag_name, 'averaged', t0,
+                                      time.perf_counter(), len(output),
+                                      int(output.memory_usage().sum()))
         return output
 
 
     def get_large_time_averaged_data(self, start_time, end_time,
                                      interval_secs=600,
                                      max_samples_per_request=50000,
-                                     improve_start_time=False):
+                                     improve_start_time=False,
+                                     summaries=SUMMARY_COLUMNS):
         """This is just like get_time_averaged_data(), except that a specific
            Delta t is imposed and the processing is split across multiple
            downloads.  If a server timeout occurs, then the download size is
-           reduced and the request is re-tried (so no data will be lost).
+           reduced and the request is re-tried (so no data will be lost); the
+           size grows again after successful downloads, and the server's
+           RequestSizer remembers it for the next download of this tag.
 
         Args:
             start_time              -- a starting time (in the server's time
@@ -887,9 +2546,11 @@ class Tag:
                                        samples
             max_samples_per_request -- the maximum number of samples to request
                                        at a time; if a server timeout occurs,
-                                       then this will be reduced and stored in
+                                       then fewer will be requested, and the
+                                       reduced size is stored in
                                        self._max_samples_per_request for the
-                                       caller's reference
+                                       caller's reference (it is not changed
+                                       by downloads without timeouts)
             improve_start_time      -- if True, then if start_time is earlier
                                        than the tag's creation date, then reset
                                        start_time to midnight of the tag's
@@ -898,6 +2559,8 @@ class Tag:
                                        creation time because the tag creation
                                        time might not be an "even" number
                                        relative to interval_secs
+            summaries               -- the statistics to download; see
+                                       get_time_averaged_data()
 
         Returns:
             same as get_time_averaged_data()
@@ -917,11 +2580,13 @@ class Tag:
                      # PI tag's creationdate fails for some reason
         t2 = self._server.convert_time(end_time)
         t_end = t2.Clone()
-        max_samples_per_request = np.int32(min(max_samples_per_request,
-                                               self._max_samples_per_request))
+        sizer = self._server._sizer
+        max_size = max_samples_per_request
+        max_samples_per_request = sizer.start(self._tag_name, 'averaged',
+                                              max_size)
 
         # Download the data
-        output = pd.DataFrame()
+        chunks = []
         while True:
             # Decide how many samples to grab in this batch.
             num_complete_intervals = math.floor(
@@ -934,35 +2599,725 @@ class Tag:
             # Download this batch of samples
             t2.UTCSeconds = t1.UTCSeconds + num_intervals*interval_secs
             try:
-                new_output = self.get_time_averaged_data(t1, t2, num_intervals)
+                new_output = self.get_time_averaged_data(t1, t2, num_intervals,
+                                                         summaries)
             except Exception as e:
-                if is_timeout(e) and (num_intervals > 100):
-                    max_samples_per_request = np.int32(num_intervals / 2)
+                if is_timeout(e) and (num_intervals > sizer.min_size):
+                    max_samples_per_request = sizer.timed_out(
+                        self._tag_name, 'averaged', num_intervals)
                     print(  '\t*** WARNING:  ' + str(e) + '\n'
                           + '\t***   reducing max_samples_per_request to '
                           + str(max_samples_per_request) + '\n')
                     self._max_samples_per_request = max_samples_per_request
                     continue
                 else:
+                    if is_timeout(e):
+                        sizer.timed_out(self._tag_name, 'averaged', num_intervals,
+                                        retry=False)
                     print('\t*** ERROR:  ' + str(e))
                     raise
-            output = pd.concat([output,new_output], axis=0)
+            chunks.append(new_output)
+            max_samples_per_request = sizer.succeeded(
+                self._tag_name, 'averaged', max_samples_per_request,
+                max_size, num_intervals)
 
             # Go to the next batch
             t1.UTCSeconds = t2.UTCSeconds
 
         # Return the results
-        return output
+        return join_chunks(chunks, pd.DataFrame(columns=list(summaries)))
+
+
+    def is_step(self):
+        """Return True if the tag's values are held until the next recorded
+           value (as for digital tags, or tags with the 'step' attribute set)
+           rather than interpolated linearly between recorded values.
+        """
+        if self._is_digital:
+            return True
+        try:
+            return bool(int(self.get_attribute('step')))
+        except Exception:
+            return False
+
+
+    def compute_time_averaged_data(self, start_time, end_time,
+                                   interval_secs=600,
+                                   summaries=SUMMARY_COLUMNS,
+                                   raw_data=None, lookback_secs=86400,
+                                   max_samples_per_request=100000):
+        """This is just like get_large_time_averaged_data(), except that the
+           statistics are computed locally (see pisummary.summarize()) from
+           the tag's raw values instead of by the PI historian.  Given the
+           same raw_data (or with a cache, see Server.set_cache()), any number
+           of interval grids may be computed without loading the PI
+           historian.
+
+        Args:
+            start_time              -- a starting time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            end_time                -- an ending time (in the server's time
+                                       zone) in one of the formats accepted by
+                                       Server.convert_time()
+            interval_secs           -- the time difference (in seconds) between
+                                       samples
+            summaries               -- the statistics to compute; see
+                                       get_time_averaged_data()
+            raw_data                -- the raw values to summarize, as returned
+                                       by get_large_raw_data(); by default,
+                                       they are downloaded
+            lookback_secs           -- when downloading the raw values, start
+                                       this many seconds before start_time so
+                                       that the value at start_time is known
+            max_samples_per_request -- see get_large_raw_data()
+
+        Returns:
+            same as get_time_averaged_data()
+        """
+        t1 = self._server.convert_time(start_time).UTCSeconds
+        t2 = self._server.convert_time(end_time).UTCSeconds
+        if raw_data is None:
+            def fetch(a, b):
+                return self.get_large_raw_data(a, b, max_samples_per_request)
+            raw_data = self._server.cached_download(self, 'raw',
+                                                    t1 - lookback_secs, t2,
+                                                    fetch)
+        return pisummary.summarize(raw_data, t1, t2, interval_secs,
+                                   summaries, self.is_step())
+
+
+class RequestSizer(object):
+    """Chooses how many values to request at a time from a PI historian.
+
+    The size is controlled separately for each tag and retrieval mode ('raw',
+    'interpolated' or 'averaged') by additive increase, multiplicative
+    decrease: each timeout multiplies the size by decrease_factor, and each
+    successful full-size request adds increase_step, up to the caller's
+    max_samples_per_request.  Only sizes that timeouts have forced below the
+    caller's limit are remembered (a download that reaches its limit forgets
+    them), so a later download with a larger limit is not held back by an
+    earlier caller's smaller one.  The learned sizes may be saved to a file
+    so that the next run starts from them, and counters of requests,
+    timeouts, retries and size changes are kept for tuning
+    Server.set_timeout().
+    A RequestSizer may be shared between threads.
+    """
+
+    def __init__(self, path=None, increase_step=5000, decrease_factor=0.5,
+                 min_size=100):
+        """Create a RequestSizer, loading the sizes saved in path (if any).
+
+        Args:
+            path            -- an optional JSON file in which to save the
+                               learned sizes; see save()
+            increase_step   -- the number of values by which to grow the size
+                               after each successful full-size request
+            decrease_factor -- the factor by which to shrink the size after
+                               each timeout
+            min_size        -- the size at or below which a timeout is no
+                               longer retried
+        """
+        self.path = path
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.min_size = min_size
+        self._sizes = dict()
+        self._counters = dict()
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                with open(path) as fp:
+                    saved = json.load(fp)
+                self._sizes = {tuple(k.split('|', 1)): v
+                               for (k, v) in saved.items()}
+            except (IOError, ValueError):
+                pass
+
+    def start(self, tag_name, mode, max_size):
+        """Return the size to use for the first request of a download. """
+        with self._lock:
+            size = self._sizes.get((mode, tag_name), max_size)
+        return np.int32(max(1, min(size, max_size)))
+
+    def succeeded(self, tag_name, mode, size, max_size, num_values):
+        """Record a successful request for size values that returned
+           num_values values, and return the size for the next request.
+        """
+        with self._lock:
+            counters = self._count(tag_name, mode)
+            counters['requests'] += 1
+            counters['values'] += int(num_values)
+            key = (mode, tag_name)
+            if (num_values >= size) and (size < max_size):
+                size = min(size + self.increase_step, max_size)
+                counters['increases'] += 1
+                if key in self._sizes:
+                    self._sizes[key] = int(size)
+            if (size >= max_size) and (key in self._sizes):
+                # The caller's own limit no longer times out
+                del self._sizes[key]
+        return np.int32(size)
+
+    def timed_out(self, tag_name, mode, size, retry=True):
+        """Record a request for size values that timed out and, if retry, is
+           about to be re-tried, and return the size to re-try with.  A
+           timeout that is not re-tried (at or below min_size) is counted,
+           and its size is remembered, but the size is not decreased.
+        """
+        with self._lock:
+            counters = self._count(tag_name, mode)
+            counters['requests'] += 1
+            counters['timeouts'] += 1
+            if retry:
+                counters['retries'] += 1
+                counters['decreases'] += 1
+                size = max(self.min_size, int(size*self.decrease_factor))
+            self._sizes[(mode, tag_name)] = int(size)
+        return np.int32(size)
+
+    def get_size(self, tag_name, mode):
+        """Return the learned size for a tag and mode, or None. """
+        with self._lock:
+            return self._sizes.get((mode, tag_name))
+
+    def get_stats(self):
+        """Return the counters since this RequestSizer was created, as a
+           DataFrame indexed by (tag, mode) with the columns size, requests,
+           values, timeouts, retries, increases and decreases.
+        """
+        columns = ['size', 'requests', 'values', 'timeouts', 'retries',
+                   'increases', 'decreases']
+        with self._lock:
+            rows = [dict(c, tag=tag_name, mode=mode,
+                         size=self._sizes.get((mode, tag_name)))
+                    for ((mode, tag_name), c) in self._counters.items()]
+        output = pd.DataFrame(rows, columns=['tag', 'mode'] + columns)
+        return output.set_index(['tag', 'mode'])
+
+    def save(self):
+        """Save the learned sizes to self.path, if it is set. """
+        if self.path is None:
+            return
+        with self._lock:
+            saved = {mode + '|' + tag_name: size
+                     for ((mode, tag_name), size) in self._sizes.items()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(saved, fp, indent=0, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def _count(self, tag_name, mode):
+        counters = self._counters.get((mode, tag_name))
+        if counters is None:
+            counters = dict(requests=0, values=0, timeouts=0, retries=0,
+                            increases=0, decreases=0)
+            self._counters[(mode, tag_name)] = counters
+        return counters
+
+
+class TimeZoneRules(object):
+    """The UTC offsets of a PI historian's time zone, for converting local
+       times to UTC with NumPy instead of a PITimeFormat COM call per time.
+
+    The rules are a table of the local times at which the offset changes
+    (i.e. daylight saving time transitions) over a range of whole years.
+    Rules from from_time_format() start out empty and learn each year from
+    the PI SDK the first time a time in it is converted (see learn_times()),
+    so a run over a few years only pays for those years.  Local times outside
+    of the learned years, or before FIRST_YEAR or after LAST_YEAR, are left
+    for the PI SDK to convert.  TimeZoneRules may be shared between threads;
+    each thread learns with its own PITimeFormat.
+    """
+
+    # The range of years that learn_times() will learn
+    FIRST_YEAR = 1970
+    LAST_YEAR = 2100
+
+    def __init__(self, local_edges=(), offsets=(), years=None):
+        """Create TimeZoneRules from a table of offsets.
+
+        Args:
+            local_edges -- the increasing local times (as seconds since the
+                           epoch, as if they were UTC) at which each offset
+                           starts; the last one is the end of the range
+            offsets     -- the offset (local time minus UTC, in seconds) from
+                           each local_edges time to the next
+            years       -- the (first, last) years that the table covers,
+                           from the start of first to the end of last, if
+                           learn() may extend it; None for a fixed table
+                           (or for empty rules that learn() fills in)
+        """
+        self._table = (np.asarray(local_edges, dtype=np.float64),
+                       np.asarray(offsets, dtype=np.float64))
+        self._years = years
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_time_format(cls, pi_time, first_year=None, last_year=None):
+        """Return rules that learn from PITimeFormat (COM) objects, having
+           already learned the years first_year to last_year, if given, from
+           pi_time; see learn().
+        """
+        rules = cls()
+        if first_year is not None:
+            rules.learn(first_year, last_year, pi_time)
+        return rules
+
+    def get_years(self):
+        """Return the (first, last) years learned so far, or None. """
+        return self._years
+
+    def learn(self, first_year, last_year, pi_time):
+        """Learn the rules for the years first_year to last_year that aren't
+           known yet, from a PITimeFormat (COM) object of the calling thread,
+           by converting local times twice a month and then homing in on
+           each change of offset to the second.  This takes about 30
+           conversions per year.  Fixed tables are never extended.
+        """
+        with self._lock:
+            (edges, offsets) = self._table
+            if self._years is None:
+                if len(offsets) > 0:
+                    return
+                (edges, offsets) = _learn_offsets(pi_time, first_year,
+                                                  last_year)
+                self._years = (first_year, last_year)
+            else:
+                (lo, hi) = self._years
+                edges = list(edges)
+                offsets = list(offsets)
+                if first_year < lo:
+                    (e, o) = _learn_offsets(pi_time, first_year, lo - 1)
+                    edges = e[:-1] + edges
+                    offsets = o + offsets
+                if last_year > hi:
+                    (e, o) = _learn_offsets(pi_time, hi + 1, last_year)
+                    edges = edges[:-1] + e
+                    offsets = offsets + o
+                self._years = (min(lo, first_year), max(hi, last_year))
+            self._table = (np.asarray(edges, dtype=np.float64),
+                           np.asarray(offsets, dtype=np.float64))
+
+    def learn_times(self, local, pi_time):
+        """Learn the years of an array of local times (as seconds since the
+           epoch, as if they were UTC) that aren't known yet, between
+           FIRST_YEAR and LAST_YEAR; see learn().
+        """
+        local = np.asarray(local, dtype=np.float64)
+        local = local[  (local >= calendar.timegm((self.FIRST_YEAR, 1, 1,
+                                                   0, 0, 0)))
+                      & (local < calendar.timegm((self.LAST_YEAR + 1, 1, 1,
+                                                  0, 0, 0)))]
+        if len(local) == 0:
+            return
+        bounds = np.array([local.min(), local.max()])
+        (first_year, last_year) = (
+            1970 + bounds.astype('datetime64[s]').astype('datetime64[Y]')
+            .astype(np.int64))
+        years = self._years
+        if (   (years is not None)
+            and (years[0] <= first_year) and (last_year <= years[1])):
+            return
+        self.learn(int(first_year), int(last_year), pi_time)
+
+    def local_to_utc(self, local):
+        """Convert an array of local times (as seconds since the epoch, as if
+           they were UTC) to seconds since the epoch (UTC); NaN for times
+           outside of the range of the rules.
+        """
+        local = np.asarray(local, dtype=np.float64)
+        (local_edges, offsets) = self._table
+        if len(offsets) == 0:
+            return np.full(local.shape, np.nan)
+        i = np.searchsorted(local_edges, local, side='right') - 1
+        in_range = (i >= 0) & (i < len(offsets))
+        i = np.clip(i, 0, len(offsets) - 1)
+        return np.where(in_range, local - offsets[i], np.nan)
+
+    def string_to_utc(self, s):
+        """Convert a single local time string to seconds since the epoch
+           (UTC), or NaN if it isn't an absolute time within the rules.
+        """
+        try:
+            dt = datetime.datetime.fromisoformat(s.strip())
+        except ValueError:
+            return np.nan
+        if dt.tzinfo is not None:
+            return dt.timestamp()
+        local = calendar.timegm(dt.timetuple()) + dt.microsecond/1e6
+        return float(self.local_to_utc([local])[0])
+
+
+def _learn_offsets(pi_time, first_year, last_year):
+    """Return the (local_edges, offsets) lists of TimeZoneRules for the years
+       first_year to last_year, learned from a PITimeFormat (COM) object.
+    """
+    probe = pi_time.Clone()
+
+    def offset(local):
+        probe.InputString = time.strftime('%Y-%m-%d %H:%M:%S',
+                                          time.gmtime(local))
+        return local - probe.UTCSeconds
+
+    samples = [calendar.timegm((first_year, 1, 1, 0, 0, 0))]
+    samples += [calendar.timegm((year, month, day, 12, 0, 0))
+                for year in range(first_year, last_year + 1)
+                for month in range(1, 13)
+                for day in (1, 16)]
+    samples.append(calendar.timegm((last_year + 1, 1, 1, 0, 0, 0)))
+    local_edges = [samples[0]]
+    offsets = [offset(samples[0])]
+    for (lo, hi) in zip(samples[:-1], samples[1:]):
+        hi_offset = offset(hi)
+        if hi_offset == offsets[-1]:
+            continue
+        while hi - lo > 1:
+            mid = (lo + hi)//2
+            if offset(mid) == offsets[-1]:
+                lo = mid
+            else:
+                hi = mid
+        local_edges.append(hi)
+        offsets.append(hi_offset)
+    local_edges.append(samples[-1])
+    return (local_edges, offsets)
+
+
+class MetadataCache(object):
+    """Keeps PI tag metadata (attributes, point types and the tag names that
+       match a query) for a limited time, and up to a limited number of
+       entries, so that validating a tag list or constructing Tag objects
+       doesn't repeat the same requests to the PI historian.  A
+       MetadataCache may be shared between threads.
+    """
+
+    def __init__(self, ttl_secs=3600, max_entries=100000):
+        """Create an empty MetadataCache.
+
+        Args:
+            ttl_secs    -- the number of seconds for which an entry is used
+                           before it is requested from the PI historian again
+            max_entries -- the number of entries above which the least
+                           recently used ones are forgotten
+        """
+        self.ttl_secs = ttl_secs
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, key):
+        """Return the cached value of a kind ('attributes', 'point_type' or
+           'names') for a tag name or query, or None if it is missing or
+           expired.
+        """
+        with self._lock:
+            entry = self._entries.get((kind, key.lower()))
+            if (entry is None) or (time.time() - entry[0] > self.ttl_secs):
+                self.misses += 1
+                return None
+            self._entries.move_to_end((kind, key.lower()))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, kind, key, value):
+        """Cache a value of a kind for a tag name or query. """
+        with self._lock:
+            self._entries[(kind, key.lower())] = (time.time(), value)
+            self._entries.move_to_end((kind, key.lower()))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tag_name=None):
+        """Forget everything cached for a tag (as well as the tag names of
+           all queries), or everything if tag_name is None.
+        """
+        with self._lock:
+            if tag_name is None:
+                self._entries.clear()
+                return
+            for key in list(self._entries):
+                if (key[0] == 'names') or (key[1] == tag_name.lower()):
+                    del self._entries[key]
+
+
+class RequestPlan(object):
+    """Collects the PI tag requests of a whole run and downloads them with as
+       few Server calls as possible.
+
+    Each consumer adds its requests with values_at() or time_averaged(),
+    which return a PlannedRequest, and then takes its data from the
+    PlannedRequest's result().  The first result() that finds requests not
+    yet downloaded calls run(), which deduplicates the tags and groups the
+    requests: values at the same time become one Server.get_values_at()
+    call over the union of their tags, and time averages of the same
+    statistic on the same interval grid whose windows overlap or touch (e.g.
+    consecutive days) become one Server.get_time_averaged_frame() call over
+    the union of their windows and tags.  Requests that are already covered
+    by earlier downloads are answered without another call, so a plan may
+    be shared by several consumers, or filled in for several dates before
+    anything is downloaded.
+    """
+
+    def __init__(self, server, num_workers=1, dtype=np.float64):
+        """Create an empty RequestPlan.
+
+        Args:
+            server      -- the Server to download from
+            num_workers -- the number of tags to download at once; see
+                           Server.download_tags()
+            dtype       -- the dtype of the time-averaged frames; see
+                           make_frame()
+        """
+        self._server = server
+        self._num_workers = num_workers
+        self._dtype = dtype
+        self._pending = []
+        # Downloaded values by time (in UTC seconds) and tag name, and
+        # downloaded (t1, t2, frame, is_good) by (summary, interval, phase)
+        self._values = dict()
+        self._frames = dict()
+        self._counters = {'requests': 0, 'tags': 0, 'calls': 0,
+                          'tags_downloaded': 0}
+
+    def values_at(self, tag_names, t='*'):
+        """Plan a Server.get_values_at() request. """
+        t = self._server.convert_times([t])[0]
+        return self._add(PlannedRequest(self, 'values', tag_names, t))
+
+    def time_averaged(self, tag_names, start_time, end_time,
+                      interval_secs=600, summary='Avg'):
+        """Plan a Server.get_time_averaged_frame() request. """
+        (t1, t2) = self._server.convert_times([start_time, end_time])
+        t2 = t1 + math.floor((t2 - t1)/interval_secs)*interval_secs
+        return self._add(PlannedRequest(self, 'averaged', tag_names, t1, t2,
+                                        (summary, interval_secs,
+                                         t1 % interval_secs)))
+
+    def run(self):
+        """Download everything that the planned requests need and that has
+           not been downloaded yet.
+        """
+        (pending, self._pending) = (self._pending, [])
+        by_time = collections.OrderedDict()
+        by_grid = collections.OrderedDict()
+        for request in pending:
+            if request.kind == 'values':
+                known = self._values.get(request.t1, {})
+                by_time.setdefault(request.t1, []).extend(
+                    n for n in request.tag_names if n not in known)
+            elif self._find_frame(request) is None:
+                by_grid.setdefault(request.group, []).append(request)
+
+        for (t, tag_names) in by_time.items():
+            tag_names = _unique(tag_names)
+            if len(tag_names) == 0:
+                continue
+            values = self._server.get_values_at(tag_names, t,
+                                                self._num_workers)
+            self._values.setdefault(t, {}).update(values.items())
+            self._count(tag_names)
+
+        for (group, requests) in by_grid.items():
+            (summary, interval_secs, phase) = group
+            for (t1, t2, tag_names) in _merge_windows(requests):
+                (frame, is_good) = self._server.get_time_averaged_frame(
+                    tag_names, t1, t2, interval_secs, summary,
+                    num_workers=self._num_workers, dtype=self._dtype)
+                self._frames.setdefault(group, []).append(
+                    (t1, t2, frame, is_good))
+                self._count(tag_names)
+
+    def get_stats(self):
+        """Return counters of the planned requests and their tags, and of the
+           Server calls made and the tags that they downloaded.
+        """
+        return dict(self._counters)
+
+    def _add(self, request):
+        self._pending.append(request)
+        self._counters['requests'] += 1
+        self._counters['tags'] += len(request.tag_names)
+        return request
+
+    def _count(self, tag_names):
+        self._counters['calls'] += 1
+        self._counters['tags_downloaded'] += len(tag_names)
+
+    def _find_frame(self, request):
+        """Return a downloaded (t1, t2, frame, is_good) that covers a
+           time-averaged request, or None.
+        """
+        for entry in self._frames.get(request.group, []):
+            (t1, t2, frame) = entry[:3]
+            if (   (t1 <= request.t1) and (request.t2 <= t2)
+                and all(n in frame.columns for n in request.tag_names)):
+                return entry
+        return None
+
+
+class PlannedRequest(object):
+    """A request added to a RequestPlan, whose result() is available once
+       the plan has run.
+    """
+
+    def __init__(self, plan, kind, tag_names, t1, t2=None, group=None):
+        self._plan = plan
+        self.kind = kind
+        self.tag_names = list(tag_names)
+        self.t1 = t1
+        self.t2 = t2
+        self.group = group
+
+    def result(self):
+        """Return what the corresponding Server call would: a Series for
+           RequestPlan.values_at(), or (frame, is_good) for
+           RequestPlan.time_averaged().
+        """
+        if self._plan._pending:
+            self._plan.run()
+        if self.kind == 'values':
+            known = self._plan._values[self.t1]
+            return pd.Series([known[n] for n in self.tag_names],
+                             index=pd.Index(self.tag_names, name='tag'),
+                             name=pd.Timestamp(self.t1, unit='s', tz='UTC'))
+        (t1, t2, frame, is_good) = self._plan._find_frame(self)
+        times = frame.index.as_unit('ns').asi8/1e9
+        rows = (times >= self.t1) & (times < self.t2)
+        columns = frame.columns.get_indexer(self.tag_names)
+        return (frame.iloc[rows, columns], is_good[rows][:, columns])
+
+
+def _unique(names):
+    """Return the distinct names, in order of first appearance. """
+    return list(collections.OrderedDict.fromkeys(names))
+
+
+def _merge_windows(requests):
+    """Group time-averaged requests whose windows overlap or touch, returning
+       the (t1, t2, tag names) of each group.
+    """
+    merged = []
+    for request in sorted(requests, key=lambda r: r.t1):
+        if (len(merged) > 0) and (request.t1 <= merged[-1][1]):
+            merged[-1][1] = max(merged[-1][1], request.t2)
+            merged[-1][2].extend(request.tag_names)
+        else:
+            merged.append([request.t1, request.t2, list(request.tag_names)])
+    return [(t1, t2, _unique(names)) for (t1, t2, names) in merged]
+
+
+def simplify_attribute_value(val):
+    """Convert a PI tag attribute value into a basic Python type. """
+    if pywintypes is None:
+        return val
+    elif isinstance(val, pywintypes.TimeType):
+        return val.Format('%Y-%m-%d %H:%M:%S')
+    elif isinstance(val, win32com.client.CDispatch):
+        return str(val)
+    return val
 
 
 def is_timeout(e):
     """Determine if e is a server timeout exception. """
-    return (    isinstance(e, pywintypes.com_error)
+    if isinstance(e, TimeoutError):
+        return True
+    return (    (pywintypes is not None)
+            and isinstance(e, pywintypes.com_error)
             and isinstance(e.excepinfo, tuple)
             and (len(e.excepinfo) >= 3)
             and (e.excepinfo[2].lower().find('timeout') >= 0) )
 
 
+def join_chunks(chunks, empty):
+    """Join the batches downloaded by one of the Tag.get_large_*() methods
+       into a single Pandas object, copying the data only once.  Returns
+       empty if no batches were downloaded.
+    """
+    chunks = [c for c in chunks if len(c) > 0]
+    if len(chunks) == 0:
+        return empty
+    elif len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, axis=0)
+
+
+def make_frame(results, dtype=np.float64, digital='categorical'):
+    """Combine per-tag results into one wide DataFrame.
+
+    Args:
+        results -- an iterable of (tag name, Pandas Series, Tag object)
+                   tuples, as yielded by Server.get_tag_raw_data() or
+                   Server.get_tag_interpolated_data(); the Series and the
+                   Tag may be None
+        dtype   -- the dtype of the numeric columns; the default keeps the
+                   full precision of the values downloaded, and float32
+                   halves the memory for callers that can afford to round
+        digital -- how to give the values of digital tags: 'categorical' for
+                   a Pandas Categorical of the digital state names (see
+                   Tag.get_code_names()), or 'codes' for the integer codes
+                   (converted to dtype, with NaN for no good value)
+
+    Returns:
+        A 2-tuple of (frame, is_good).  frame is a Pandas DataFrame with one
+        column per tag, in the order of results, indexed by the union of all
+        of the tags' times (identical for interpolated data).  is_good is a
+        boolean NumPy array of the same shape that is False where a tag has
+        no good value at a time, i.e. where frame is NaN (or, for a
+        Categorical, missing).
+    """
+    tag_names = []
+    columns = []
+    code_names = dict()
+    digital_codes = set()
+    for (tag_name, data, tag) in results:
+        n = len(tag_names)
+        tag_names.append(tag_name)
+        if data is None:
+            data = pd.Series(dtype=np.float64,
+                             index=pd.DatetimeIndex([], tz='UTC'))
+        columns.append(data)
+        if (tag is not None) and tag._is_digital:
+            digital_codes.add(n)
+            if digital == 'categorical':
+                code_names[n] = tag.get_code_names()
+    if len(columns) == 0:
+        return (pd.DataFrame(), np.zeros((0, 0), dtype=bool))
+
+    # Align all of the columns in one pass
+    frame = pd.concat(columns, axis=1, keys=range(len(columns)))
+    is_good = frame.notna().to_numpy()
+    output = dict()
+    for (n, column) in frame.items():
+        if n in code_names:
+            output[n] = decode_codes(column.to_numpy(dtype=np.float64),
+                                     code_names[n])
+            is_good[:, n] &= output[n].codes >= 0
+        elif n in digital_codes:
+            codes = column.to_numpy(dtype=np.float64)
+            is_good[:, n] &= codes >= 0
+            output[n] = np.where(codes >= 0, codes, np.nan).astype(dtype)
+        elif column.dtype != object:
+            output[n] = column.to_numpy(dtype=dtype)
+        else:
+            output[n] = column.to_numpy()
+    frame = pd.DataFrame(output, index=frame.index)
+    frame.columns = tag_names
+    return (frame, is_good)
+
+
+def decode_codes(codes, names):
+    """Return a Pandas Categorical of the digital state names for an array of
+       digital codes; negative, unknown and NaN codes become missing values.
+    """
+    codes = np.asarray(codes, dtype=np.float64)
+    known = (codes >= 0) & (codes < len(names))
+    return pd.Categorical.from_codes(
+        np.where(known, codes, -1).astype(np.int32), names)
+
+
 def write_tag_attributes(fp, tag_attributes,
                          attrs=['tag', 'descriptor', 'typicalvalue',
                                 'engunits', 'exdesc', 'instrumenttag',
@@ -981,13 +3336,14 @@ def write_tag_attributes(fp, tag_attributes,
 
 def convert_string_to_utc(server, s):
     """ Convert a single date/time string from the server's time zone to UTC """
-    t = server.convert_time(s).UTCSeconds
+    t = server.convert_times([s])[0]
     dt = datetime.datetime.fromtimestamp(t, pytz.utc)
     return dt
 
 
 def convert_strings_to_utc(server, tag_data):
     """ Convert date/time strings from the server's time zone to UTC """
-    dts = [convert_string_to_utc(server, s) for s in tag_data.values]
+    dts = pd.to_datetime(server.convert_times(tag_data.values), unit='s',
+                         utc=True)
     return pd.Series(data=dts, index=tag_data.index, name=tag_data.name)
 
@@ -0,0 +1,165 @@
+"""Throughput benchmarks for pihist, run against the synthetic historian.
+
+Usage:
+    python pihist_bench.py [chunks|workers|wells|plan|all]
+
+    chunks  -- per-chunk cost of a long Tag.get_large_raw_data() pull (10
+               years of 1-minute data by default) for several request sizes
+    workers -- Server.get_tag_time_averaged_data() over many tags with
+               simulated historian latency, for several worker counts
+    wells   -- the Server passes made by AutoIPM.GetWellInputData(),
+               GetMPFMRates() and GetManifoldInputData() for a tag table of
+               synthetic wells and manifolds
+    plan    -- the same passes over several days, made directly and through
+               a pihist.RequestPlan
+"""
+
+import sys
+import time
+import numpy as np
+import pihist
+import pisynth
+
+start_time = '2012-01-01 00:00:00'
+end_time = '2022-01-01 00:00:00'
+
+
+def bench_chunks(sizes=(25000, 100000, 400000), years=10):
+    """Time a multi-year raw download, reporting how the cost per chunk
+       changes from the start to the end of the download.
+    """
+    historian = pisynth.SyntheticHistorian(raw_interval_secs=60.0)
+    server = pihist.Server('SYNTH', backend=historian)
+    t2 = '{0}-01-01 00:00:00'.format(2012 + years)
+    for size in sizes:
+        tag = pihist.Tag(server, 'BENCH.RAW')
+        historian.reset_stats()
+        t0 = time.time()
+        data = tag.get_large_raw_data(start_time, t2, size)
+        elapsed = time.time() - t0
+        times = np.array([r[0] for r in historian.request_log])
+        per_chunk = np.diff(times)
+        tenth = max(1, len(per_chunk)//10)
+        print('raw, {0:>7d} values/request: {1:>9d} values in {2:7.2f} s; '
+              '{3:4d} chunks, first/last 10% {4:6.1f}/{5:6.1f} ms per chunk'
+              .format(size, len(data), elapsed, len(times),
+                      1e3*per_chunk[:tenth].mean(),
+                      1e3*per_chunk[-tenth:].mean()))
+
+
+def bench_workers(num_tags=200, worker_counts=(1, 4, 8, 16),
+                  latency_secs=0.02):
+    """Time daily averages for many tags with a fixed per-request latency. """
+    historian = pisynth.SyntheticHistorian(num_tags=num_tags,
+                                           latency_secs=latency_secs)
+    server = pihist.Server('SYNTH', backend=historian)
+    tag_names = historian.get_tag_names()
+    for n in worker_counts:
+        historian.reset_stats()
+        t0 = time.time()
+        results = list(server.get_tag_time_averaged_data(
+            tag_names, '2021-12-10 00:00:00', '2021-12-11 00:00:00',
+            interval_secs=86400, num_workers=n, summaries=['Avg']))
+        elapsed = time.time() - t0
+        print('averages, {0:2d} workers: {1} tags in {2:6.2f} s '
+              '({3} requests)'.format(n, len(results), elapsed,
+                                      historian.get_stats()['requests']))
+
+
+def well_tags(num_wells, latency_secs, num_manifolds=4):
+    """Return the columns and PI tags of a synthetic well tag table (plus a
+       'Manifold' column of manifold pressure tags), and a synthetic
+       historian that has them.  The first two columns are read as values at
+       the end time and the rest as averages, as in AutoIPM.PlanWellInputData(),
+       PlanMPFMRates() and PlanManifoldInputData().
+    """
+    columns = ['Well Status', 'Flowline A Routing', 'WHP', 'WHT',
+               'Choke DP', 'BHP', 'GL Rate', 'MPFM Oil Rates',
+               'MPFM Water Rates', 'MPFM Gas Rates']
+    suffixes = ['.STS', '.ROUT', '.WHP', '.WHT', '.DP', '.BHP', '.GL',
+                '.QO', '.QW', '.QG']
+    wells = ['W{0:03d}'.format(i) for i in range(num_wells)]
+    tags = {c: ['KZA_' + w + s for w in wells]
+            for (c, s) in zip(columns, suffixes)}
+    columns.append('Manifold')
+    tags['Manifold'] = ['KZA_M{0:02d}.P'.format(i)
+                        for i in range(num_manifolds)]
+    historian = pisynth.SyntheticHistorian(
+        tag_names=sum(tags.values(), []), latency_secs=latency_secs,
+        digital_patterns=['*.sts', '*.rout'])
+    return (columns, tags, historian)
+
+
+def bench_wells(num_wells=60, num_workers=8, latency_secs=0.02):
+    """Time the historian passes of AutoIPM.GetWellInputData(),
+       GetMPFMRates() and GetManifoldInputData().
+    """
+    (columns, tags, historian) = well_tags(num_wells, latency_secs)
+    server = pihist.Server('SYNTH', backend=historian)
+    t1 = '2021-12-10 00:00:00'
+    t2 = '2021-12-11 00:00:00'
+    t0 = time.time()
+    num_values = 0
+    for c in columns[:2]:
+        num_values += len(server.get_values_at(tags[c], t2,
+                                               num_workers=num_workers))
+    for c in columns[2:]:
+        for (tag_name, data, tag) in server.get_tag_time_averaged_data(
+                tags[c], t1, t2, interval_secs=86400,
+                num_workers=num_workers, summaries=['Avg']):
+            num_values += 0 if data is None else len(data)
+    elapsed = time.time() - t0
+    stats = historian.get_stats()
+    print('Get*InputData passes, {0} wells, {1} workers: {2:6.2f} s, '
+          '{3} requests, {4} values downloaded, {5} returned'
+          .format(num_wells, num_workers, elapsed, stats['requests'],
+                  stats['values'], num_values))
+
+
+def bench_plan(num_wells=60, num_days=6, num_workers=8, latency_secs=0.02):
+    """Time the passes of AutoIPM.GetWellInputData(), GetMPFMRates() and
+       GetManifoldInputData() for several days, made one Server call at a
+       time and through a RequestPlan.
+    """
+    (columns, tags, historian) = well_tags(num_wells, latency_secs)
+    server = pihist.Server('SYNTH', backend=historian)
+    days = ['2021-12-{0:02d} 00:00:00'.format(10 + d)
+            for d in range(num_days + 1)]
+    for planned in (False, True):
+        historian.reset_stats()
+        t0 = time.time()
+        plan = pihist.RequestPlan(server, num_workers)
+        requests = []
+        for (t1, t2) in zip(days[:-1], days[1:]):
+            for c in columns[:2]:
+                if planned:
+                    requests.append(plan.values_at(tags[c], t2))
+                else:
+                    server.get_values_at(tags[c], t2, num_workers=num_workers)
+            for c in columns[2:]:
+                if planned:
+                    requests.append(plan.time_averaged(tags[c], t1, t2,
+                                                       86400))
+                else:
+                    server.get_time_averaged_frame(tags[c], t1, t2, 86400,
+                                                   num_workers=num_workers)
+        for r in requests:
+            r.result()
+        elapsed = time.time() - t0
+        print('Get*InputData passes, {0} days, {1}: {2:6.2f} s, '
+              '{3} requests'.format(num_days,
+                                    'planned' if planned else 'direct',
+                                    elapsed,
+                                    historian.get_stats()['requests']))
+
+
+if __name__ == '__main__':
+    which = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    if which in ('chunks', 'all'):
+        bench_chunks()
+    if which in ('workers', 'all'):
+        bench_workers()
+    if which in ('wells', 'all'):
+        bench_wells()
+    if which in ('plan', 'all'):
+        bench_plan()
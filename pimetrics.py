@@ -0,0 +1,214 @@
+"""Request metrics and tracing for pihist.
+
+A Metrics object, given to a pihist.Server (see Server.set_metrics()),
+records every request that the server's Tags make to the PI historian and
+every conversion of the returned PIValues into Pandas (see
+pihist.Tag.pivals_to_series()), so that the time a run spends waiting for the
+historian can be told apart from the time spent converting its data.  For
+each tag and retrieval mode ('raw', 'interpolated', 'averaged' or 'value')
+it keeps counters of requests, errors, timeouts, retries, samples and bytes
+returned, the total wait and conversion times, a histogram of the request
+latencies and the size of the latest request.
+
+The counters can be saved as a JSON summary, and (if trace is True) every
+request and conversion can be saved as a Chrome trace, to be opened in
+chrome://tracing or https://ui.perfetto.dev, with one row per thread.
+
+Usage:
+    metrics = pimetrics.Metrics(trace=True)
+    server = pihist.Server(server_name, metrics=metrics)
+    ...
+    metrics.save_json('pi_metrics.json')
+    metrics.save_chrome_trace('pi_trace.json')
+
+Without a Metrics object, the hooks in pihist cost one attribute test per
+request and per conversion.
+"""
+
+import os
+import json
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+# The upper edges, in seconds, of the bins of the latency histograms; the
+# last bin counts everything longer
+LATENCY_EDGES = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+# The counters kept for each tag and mode, in the order of get_stats()
+COUNTERS = ('requests', 'errors', 'timeouts', 'retries', 'samples', 'bytes',
+            'wait_secs', 'convert_secs', 'max_wait_secs', 'size')
+
+
+class Metrics(object):
+    """Counters, latency histograms and an optional trace of the requests
+       made to a PI historian.  A Metrics object may be shared between
+       threads (and between the worker connections of a Server).
+    """
+
+    def __init__(self, trace=False, max_events=1000000):
+        """Create an empty Metrics object.
+
+        Args:
+            trace      -- if True, then also keep every request and
+                          conversion for save_chrome_trace()
+            max_events -- the maximum number of trace events to keep; later
+                          events are counted but not traced
+        """
+        self.trace = trace
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Forget everything recorded so far. """
+        with self._lock:
+            self._stats = dict()
+            self._timed_out = set()
+            self._events = []
+            self.dropped_events = 0
+            self._t0 = time.perf_counter()
+
+    def record_request(self, tag_name, mode, t0, t1, size=None, error=None,
+                       timeout=False):
+        """Record one request to the PI historian.
+
+        Args:
+            tag_name -- the name of the PI tag
+            mode     -- the retrieval mode
+            t0, t1   -- the time.perf_counter() before and after the request
+            size     -- the number of values or intervals requested, if known
+            error    -- the exception raised by the request, if any
+            timeout  -- True if the error was a timeout; the next request
+                        for the same tag and mode is counted as a retry
+        """
+        key = (tag_name, mode)
+        if size is not None:
+            size = int(size)
+        with self._lock:
+            stats = self._get(key)
+            stats['requests'] += 1
+            stats['wait_secs'] += t1 - t0
+            stats['max_wait_secs'] = max(stats['max_wait_secs'], t1 - t0)
+            stats['latency'][np.searchsorted(LATENCY_EDGES, t1 - t0)] += 1
+            if size is not None:
+                stats['size'] = size
+            if key in self._timed_out:
+                stats['retries'] += 1
+                self._timed_out.discard(key)
+            if error is not None:
+                stats['errors'] += 1
+            if timeout:
+                stats['timeouts'] += 1
+                self._timed_out.add(key)
+            self._trace(mode + ' ' + tag_name, 'request', t0, t1,
+                        {'size': size,
+                         'error': None if error is None else str(error)})
+
+    def record_conversion(self, tag_name, mode, t0, t1, samples, nbytes):
+        """Record the conversion of a request's values into Pandas.
+
+        Args:
+            tag_name -- the name of the PI tag
+            mode     -- the retrieval mode of the request
+            t0, t1   -- the time.perf_counter() before and after converting
+            samples  -- the number of values converted
+            nbytes   -- the size of the converted times and values, in bytes
+        """
+        with self._lock:
+            stats = self._get((tag_name, mode))
+            stats['convert_secs'] += t1 - t0
+            stats['samples'] += int(samples)
+            stats['bytes'] += int(nbytes)
+            self._trace('convert ' + tag_name, 'convert', t0, t1,
+                        {'mode': mode, 'samples': int(samples)})
+
+    def get_stats(self):
+        """Return the counters as a Pandas DataFrame indexed by tag and mode,
+           with the COUNTERS as columns.
+        """
+        with self._lock:
+            keys = sorted(self._stats)
+            rows = [[self._stats[k][c] for c in COUNTERS] for k in keys]
+        index = pd.MultiIndex.from_tuples(keys, names=['tag', 'mode'])
+        return pd.DataFrame(rows, index=index, columns=list(COUNTERS))
+
+    def get_summary(self, by_tag=True):
+        """Return the counters and latency histograms as a dictionary (that
+           can be saved as JSON) with the totals over everything, the totals
+           per mode and, if by_tag, the counters per tag and mode.
+        """
+        with self._lock:
+            stats = [(k, dict(v, latency=list(v['latency'])))
+                     for (k, v) in sorted(self._stats.items())]
+            dropped = self.dropped_events
+        summary = {'latency_edges_secs': list(LATENCY_EDGES),
+                   'totals': _total(s for (k, s) in stats),
+                   'modes': dict((m, _total(s for (k, s) in stats
+                                            if k[1] == m))
+                                 for m in sorted(set(k[1] for (k, s)
+                                                     in stats))),
+                   'dropped_trace_events': dropped}
+        if by_tag:
+            tags = dict()
+            for ((tag_name, mode), s) in stats:
+                tags.setdefault(tag_name, dict())[mode] = s
+            summary['tags'] = tags
+        return summary
+
+    def save_json(self, path, by_tag=True):
+        """Save get_summary() as a JSON file. """
+        with open(path, 'w') as fp:
+            json.dump(self.get_summary(by_tag), fp, indent=1)
+
+    def save_chrome_trace(self, path):
+        """Save the traced requests and conversions in the Chrome trace
+           event format.
+        """
+        with self._lock:
+            events = list(self._events)
+        pid = os.getpid()
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': [dict(e, pid=pid) for e in events],
+                       'displayTimeUnit': 'ms'}, fp)
+
+    # --- internals ---
+
+    def _get(self, key):
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = dict((c, 0) for c in COUNTERS)
+            stats['wait_secs'] = 0.0
+            stats['convert_secs'] = 0.0
+            stats['max_wait_secs'] = 0.0
+            stats['latency'] = [0]*(len(LATENCY_EDGES) + 1)
+            self._stats[key] = stats
+        return stats
+
+    def _trace(self, name, category, t0, t1, args):
+        if not self.trace:
+            return
+        if len(self._events) >= self.max_events:
+            self.dropped_events += 1
+            return
+        self._events.append({'name': name, 'cat': category, 'ph': 'X',
+                             'ts': 1e6*(t0 - self._t0),
+                             'dur': 1e6*(t1 - t0),
+                             'tid': threading.get_ident(), 'args': args})
+
+
+def _total(stats):
+    """Add up the counters (and histograms) of several tags and modes. """
+    total = dict((c, 0) for c in COUNTERS if c != 'size')
+    total['latency'] = [0]*(len(LATENCY_EDGES) + 1)
+    for s in stats:
+        for c in total:
+            if c == 'latency':
+                total[c] = [a + b for (a, b) in zip(total[c], s[c])]
+            elif c == 'max_wait_secs':
+                total[c] = max(total[c], s[c])
+            else:
+                total[c] += s[c]
+    return total
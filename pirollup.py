@@ -0,0 +1,245 @@
+"""Local rollups of PI tag data for pihist's time-averaged downloads.
+
+A RollupStore keeps, for each tag, the time-weighted aggregates of its
+values (see pisummary.aggregate()) over fixed buckets at a few resolutions,
+by default 1 minute, 1 hour and 1 day.  Since the aggregates are additive,
+the statistics over any interval that is a whole number of buckets are
+computed from a handful of stored rows (see pisummary.combine()), so that
+daily, weekly and monthly averages over the same tags no longer need a
+Summaries call to the PI historian each time.
+
+The buckets are stored in a picache.TagCache under the retrieval mode
+'rollup@<resolution>+<phase>', so they persist between runs.  A request is
+answered from the stored buckets, and only the buckets that are not stored
+yet are requested from the PI historian's Summaries call, with the bucket
+length as the interval.  Each bucket keeps the Num, Min and Max returned by
+the PI historian, and the combined statistics of a run of buckets are the
+sum of their Num and the least Min and greatest Max, which are the same as
+the PI historian returns for the whole run.  Avg and Std are combined
+weighting each bucket with data by its length: since the PI historian's
+Summaries don't say how much of a bucket was good, they only differ from the
+PI historian's when some buckets are partly bad.  Buckets newer than the
+cache's settling time are requested again on each request.
+
+Usage:
+    cache = picache.TagCache(r'C:\\pi_cache')
+    server = pihist.Server(server_name, cache=cache,
+                           rollups=pirollup.RollupStore(cache))
+    results = server.get_tag_time_averaged_data(tag_names, t1, t2, 86400)
+
+Requests that the rollups can't answer (an interval that is not a whole
+number of buckets, improve_start_time, or a tag with non-numeric values) are
+passed on to the PI historian as before.
+
+Alternatively, a store created with build=True computes its buckets from raw
+values instead, with the statistics defined by pisummary.summarize(), as a
+pyramid: only the finest buckets are computed from raw values (downloaded
+through the server's own cache of raw values, if it has one), and each
+coarser bucket is added up from the finer buckets it contains (see
+pisummary.regroup()).  This makes no Summaries calls at all, but Num then
+counts the values in the raw download rather than the events counted by the
+PI historian's Count summary, and Min and Max include the interpolated values
+at the interval boundaries, so these columns (and the ends of the data) may
+differ from what the same request returned without rollups.  Buckets built
+from raw values are stored under their own retrieval mode, so they are never
+mixed with buckets from the PI historian.
+"""
+
+import math
+import threading
+import numpy as np
+import pandas as pd
+import picache
+import pisummary
+
+# The default bucket lengths, in seconds
+RESOLUTIONS = (60, 3600, 86400)
+
+
+class RollupStore(object):
+    """Multi-resolution store of time-weighted aggregates of PI tag data. """
+
+    def __init__(self, cache, resolutions=RESOLUTIONS, lookback_secs=86400,
+                 max_samples_per_request=100000, build=False):
+        """Create a RollupStore.
+
+        Args:
+            cache                   -- the picache.TagCache in which to keep
+                                       the buckets; it may be the same one
+                                       that the Server caches raw values in
+            resolutions             -- the bucket lengths, in seconds
+            lookback_secs           -- with build, when downloading raw
+                                       values, start this many seconds
+                                       before the first bucket so that the
+                                       value at its start is known
+            max_samples_per_request -- see pihist.Tag.get_large_raw_data()
+                                       and
+                                       Tag.get_large_time_averaged_data()
+            build                   -- if True, then compute the buckets
+                                       from raw values rather than request
+                                       them from the PI historian's
+                                       Summaries call (see the module
+                                       docstring)
+        """
+        self._cache = cache
+        self._resolutions = sorted(resolutions, reverse=True)
+        self._lookback_secs = lookback_secs
+        self._max_samples_per_request = max_samples_per_request
+        self._build = build
+        self._lock = threading.Lock()
+        self._counters = {'answered': 0, 'passed': 0, 'buckets': 0}
+
+    def choose_resolution(self, interval_secs):
+        """Return the longest bucket length that divides interval_secs
+           evenly, or None if there is none.
+        """
+        for r in self._resolutions:
+            k = 1.0*interval_secs/r
+            if (k >= 1) and (abs(k - round(k)) < 1e-9):
+                return r
+        return None
+
+    def get(self, tag, start_time, end_time, interval_secs=600,
+            summaries=pisummary.SUMMARY_COLUMNS):
+        """Compute time-averaged values of a tag from its rollups, adding
+           any buckets that are missing.
+
+        Args:
+            tag           -- the pihist.Tag
+            start_time    -- a starting time (in the server's time zone) in
+                             one of the formats accepted by
+                             pihist.Server.convert_time()
+            end_time      -- an ending time, as for start_time
+            interval_secs -- the width, in seconds, of each time interval
+                             over which to average the data
+            summaries     -- the statistics to compute; see
+                             pihist.Tag.get_time_averaged_data()
+
+        Returns:
+            The same as pihist.Tag.get_large_time_averaged_data(), or None
+            if the rollups can't answer the request.
+        """
+        resolution = self.choose_resolution(interval_secs)
+        if (resolution is None) or (tag._default_value == ''):
+            self._count('passed', 0)
+            return None
+        server = tag._server
+        t1 = server.convert_time(start_time).UTCSeconds
+        t2 = server.convert_time(end_time).UTCSeconds
+        group_size = int(round(1.0*interval_secs/resolution))
+        num_intervals = max(0, int(math.floor((t2 - t1)/interval_secs)))
+        t2 = t1 + num_intervals*interval_secs
+        aggregates = self.get_aggregates(tag, t1, t2, resolution)
+        self._count('answered', len(aggregates))
+        return pisummary.combine(aggregates, group_size, summaries)
+
+    def is_stored(self, tag, t1, t2, resolution):
+        """Return whether all of a tag's buckets of length resolution in
+           [t1, t2) (UTC seconds) are stored.
+        """
+        ranges = self._cache.get_ranges(tag._server._server_name,
+                                        tag._tag_name,
+                                        self._mode(t1, resolution))
+        return len(picache.subtract_ranges([(t1, t2)], ranges)) == 0
+
+    def get_aggregates(self, tag, t1, t2, resolution):
+        """Return the stored aggregates of a tag for the buckets of length
+           resolution in [t1, t2) (UTC seconds), adding any that are
+           missing; see pisummary.aggregate().
+
+        Missing buckets are requested from the PI historian's Summaries call
+        or, with build, added up from the buckets of the next finer
+        resolution that divides resolution evenly (which are stored too), so
+        that only the finest buckets are computed from raw values.
+        """
+        server = tag._server
+        step = tag.is_step()
+        finer = [r for r in self._resolutions
+                 if (r < resolution) and (resolution % r == 0)]
+
+        def fetch(a, b):
+            if not self._build:
+                summaries = tag.get_large_time_averaged_data(
+                    a, b, resolution, self._max_samples_per_request,
+                    summaries=pisummary.SUMMARY_COLUMNS)
+                return from_summaries(summaries, resolution)
+            if len(finer) > 0:
+                aggregates = self.get_aggregates(tag, a, b, finer[0])
+                return pisummary.regroup(aggregates,
+                                         int(round(resolution/finer[0])))
+
+            def download(c, d):
+                return tag.get_large_raw_data(c, d,
+                                              self._max_samples_per_request)
+            raw_data = server.cached_download(tag, 'raw',
+                                              a - self._lookback_secs, b,
+                                              download)
+            return pisummary.aggregate(raw_data, a, b, resolution, step)
+
+        num_buckets = max(0, int(math.floor((t2 - t1)/resolution)))
+        t2 = t1 + num_buckets*resolution
+        if num_buckets == 0:
+            # Nothing to download
+            return pisummary.aggregate(pd.Series(dtype=np.float64), t1, t1,
+                                       resolution)
+        mode = self._mode(t1, resolution)
+        columns = list(pisummary.AGGREGATE_COLUMNS)
+        aggregates = self._cache.get(server._server_name, tag._tag_name,
+                                     mode, t1, t2, fetch,
+                                     server.get_server_seconds,
+                                     columns, resolution)
+        # Every bucket is stored, but make sure of the grid before combining
+        grid = np.round((t1 + resolution*np.arange(num_buckets))*1e9)
+        grid = pd.to_datetime(grid.astype(np.int64), unit='ns', utc=True)
+        if not aggregates.index.equals(grid):
+            aggregates = aggregates[~aggregates.index.duplicated()]
+            aggregates = aggregates.reindex(grid)
+            aggregates[['Dur', 'Sum', 'Sq', 'Num']] = aggregates[
+                ['Dur', 'Sum', 'Sq', 'Num']].fillna(0)
+        return aggregates
+
+    def get_stats(self):
+        """Return counters of the requests answered from the rollups, the
+           requests passed on to the PI historian, and the buckets read.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _mode(self, t1, resolution):
+        mode = 'rollup@{0:g}+{1:g}'.format(resolution, t1 % resolution)
+        return mode + '[raw]' if self._build else mode
+
+    def _count(self, outcome, num_buckets):
+        with self._lock:
+            self._counters[outcome] += 1
+            self._counters['buckets'] += num_buckets
+
+
+def from_summaries(summaries, interval_secs):
+    """Convert the statistics returned by the PI historian's Summaries call
+       into aggregates that pisummary.combine() can add up.
+
+    Args:
+        summaries     -- a Pandas DataFrame as returned by
+                         pihist.Tag.get_time_averaged_data(), with all of the
+                         pisummary.SUMMARY_COLUMNS
+        interval_secs -- the width, in seconds, of each of its intervals
+
+    Returns:
+        The same as pisummary.aggregate(), where an interval with an Avg has
+        data for all of its interval_secs (the PI historian doesn't say how
+        much of it was good) and one without has none.
+    """
+    avgs = np.asarray(summaries.Avg.values, dtype=np.float64)
+    stds = np.asarray(summaries.Std.values, dtype=np.float64)
+    good = ~np.isnan(avgs)
+    durations = np.where(good, 1.0*interval_secs, 0.0)
+    avgs = np.where(good, avgs, 0.0)
+    stds = np.where(np.isnan(stds), 0.0, stds)
+    output = {'Dur': durations, 'Sum': avgs*durations,
+              'Sq': (stds*stds + avgs*avgs)*durations,
+              'Min': np.asarray(summaries.Min.values, dtype=np.float64),
+              'Max': np.asarray(summaries.Max.values, dtype=np.float64),
+              'Num': np.asarray(summaries.Num.values, dtype=np.int64)}
+    return pd.DataFrame(output, index=summaries.index,
+                        columns=list(pisummary.AGGREGATE_COLUMNS))
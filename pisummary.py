@@ -0,0 +1,282 @@
+"""Client-side time-weighted summaries of PI tag data.
+
+The functions here compute the same statistics as the PI historian's
+Data.Summaries() calls (see pihist.Tag.get_time_averaged_data()) from a raw
+series that is already in memory, so that averages over any number of
+interval grids can be taken from one raw download (or from a picache.TagCache)
+without another request to the PI historian.
+
+The raw values are treated as a continuous signal: linearly interpolated
+between recorded values, or held until the next recorded value for step
+(e.g. digital) tags.  After the last recorded value the signal holds that
+value, as the PI historian does with its snapshot; before the first recorded
+value there is no data, and that time is left out of the averages.
+
+Usage:
+    raw = tag.get_large_raw_data(t1 - 86400, t2)
+    hourly = pisummary.summarize(raw, t1, t2, 3600)
+    daily = pisummary.summarize(raw, t1, t2, 86400, ['Avg', 'Max'])
+"""
+
+import math
+import numpy as np
+import pandas as pd
+
+# The statistics that can be computed, named as in pihist.SUMMARY_COLUMNS
+SUMMARY_COLUMNS = ('Avg', 'Std', 'Min', 'Max', 'Num')
+
+# The additive (and extreme) aggregates from which the statistics of any
+# union of intervals can be computed: the time with data, the time integrals
+# of the signal and of its square, and Min, Max and Num as above
+AGGREGATE_COLUMNS = ('Dur', 'Sum', 'Sq', 'Min', 'Max', 'Num')
+
+
+def summarize(data, start_time, end_time, interval_secs,
+              summaries=SUMMARY_COLUMNS, step=False):
+    """Compute time-weighted statistics of a raw series over a grid of equal
+       intervals.
+
+    Args:
+        data          -- a Pandas Series of recorded values indexed by time (as
+                         returned by pihist.Tag.get_large_raw_data()); to
+                         know the value at start_time, it should begin
+                         before start_time
+        start_time    -- the start of the first interval, in UTC seconds
+        end_time      -- the end of the grid, in UTC seconds; as in
+                         pihist.Tag.get_large_time_averaged_data(), only
+                         complete intervals are included
+        interval_secs -- the length of each interval, in seconds
+        summaries     -- the statistics to compute, as a sequence of the
+                         column names documented for
+                         pihist.Tag.get_time_averaged_data()
+        step          -- if True, then hold each value until the next one
+                         instead of interpolating linearly between them
+
+    Returns:
+        A Pandas DataFrame indexed by the (UTC) start time of each interval,
+        with the columns named in summaries, in that order.  Avg and Std are
+        time-weighted over the part of the interval that has data, Min and Max
+        include the (interpolated) values at the interval boundaries, and Num
+        counts the values recorded in [start, end) of the interval.
+    """
+    summaries = _check_summaries(summaries)
+    (times, values, edges) = _prepare(data, start_time, end_time,
+                                      interval_secs)
+    num_intervals = len(edges) - 1
+
+    output = dict()
+    if 'Num' in summaries:
+        output['Num'] = np.diff(np.searchsorted(times, edges, side='left'))
+    if any(c != 'Num' for c in summaries) and (num_intervals > 0):
+        moments = _time_weighted(times, values, edges, step)
+        output.update(_statistics(moments))
+
+    index = pd.to_datetime(edges[:-1], unit='s', utc=True)
+    output = pd.DataFrame({c: output.get(c, np.full(num_intervals, np.nan))
+                           for c in summaries},
+                          index=index, columns=summaries)
+    if 'Num' in summaries:
+        output.Num = output.Num.astype(int)
+    return output
+
+
+def aggregate(data, start_time, end_time, interval_secs, step=False):
+    """Compute the additive aggregates of a raw series over a grid of equal
+       intervals, from which combine() can later compute the statistics of
+       any run of whole intervals.
+
+    Args:
+        data, start_time, end_time, interval_secs, step -- as for summarize()
+
+    Returns:
+        A Pandas DataFrame indexed by the (UTC) start time of each interval,
+        with the AGGREGATE_COLUMNS.  Sum and Sq are time integrals (in value
+        seconds and value squared seconds) over the Dur seconds of the
+        interval that have data.
+    """
+    (times, values, edges) = _prepare(data, start_time, end_time,
+                                      interval_secs)
+    num_intervals = len(edges) - 1
+    output = {'Dur': np.zeros(num_intervals), 'Sum': np.zeros(num_intervals),
+              'Sq': np.zeros(num_intervals),
+              'Min': np.full(num_intervals, np.nan),
+              'Max': np.full(num_intervals, np.nan)}
+    if num_intervals > 0:
+        moments = _time_weighted(times, values, edges, step)
+        # Undo the offset so that the integrals of neighboring intervals
+        # can simply be added
+        offset = moments['offset']
+        output['Dur'] = moments['Dur']
+        output['Sum'] = moments['Sum'] + offset*moments['Dur']
+        output['Sq'] = (moments['Sq'] + 2*offset*moments['Sum']
+                        + offset*offset*moments['Dur'])
+        output['Min'] = moments['Min']
+        output['Max'] = moments['Max']
+    output['Num'] = np.diff(np.searchsorted(times, edges, side='left'))
+    index = pd.to_datetime(edges[:-1], unit='s', utc=True)
+    return pd.DataFrame(output, index=index, columns=list(AGGREGATE_COLUMNS))
+
+
+def combine(aggregates, group_size, summaries=SUMMARY_COLUMNS):
+    """Compute statistics over runs of group_size consecutive intervals
+       from their aggregates.
+
+    Args:
+        aggregates -- a Pandas DataFrame as returned by aggregate(), covering
+                      a whole number of groups
+        group_size -- the number of aggregated intervals in each output
+                      interval
+        summaries  -- the statistics to compute, as for summarize()
+
+    Returns:
+        The same as summarize() over intervals group_size times as long.
+    """
+    summaries = _check_summaries(summaries)
+    totals = regroup(aggregates, group_size)
+    moments = {c: totals[c].to_numpy(dtype=np.float64)
+               for c in ('Dur', 'Sum', 'Sq', 'Min', 'Max')}
+    moments['offset'] = 0.0
+    output = _statistics(moments)
+    output['Num'] = totals['Num'].to_numpy()
+
+    output = pd.DataFrame({c: output[c] for c in summaries},
+                          index=totals.index, columns=summaries)
+    if 'Num' in summaries:
+        output.Num = output.Num.astype(int)
+    return output
+
+
+def regroup(aggregates, group_size):
+    """Add up the aggregates of runs of group_size consecutive intervals.
+
+    Args:
+        aggregates -- a Pandas DataFrame as returned by aggregate(), covering
+                      a whole number of groups
+        group_size -- the number of aggregated intervals in each output
+                      interval
+
+    Returns:
+        The same as aggregate() over intervals group_size times as long.
+    """
+    num_intervals = len(aggregates)//group_size
+    if num_intervals*group_size != len(aggregates):
+        raise ValueError('the aggregates do not cover whole intervals')
+
+    def grouped(column):
+        values = np.asarray(aggregates[column].values, dtype=np.float64)
+        return values.reshape(num_intervals, group_size)
+    output = {c: grouped(c).sum(axis=1) for c in ('Dur', 'Sum', 'Sq', 'Num')}
+    with np.errstate(invalid='ignore'):
+        output['Min'] = np.fmin.reduce(grouped('Min'), axis=1)
+        output['Max'] = np.fmax.reduce(grouped('Max'), axis=1)
+    output['Num'] = output['Num'].astype(np.int64)
+    index = aggregates.index[::group_size][:num_intervals]
+    return pd.DataFrame(output, index=index, columns=list(AGGREGATE_COLUMNS))
+
+
+def values_at(times, values, t, step=False):
+    """Return the signal of the recorded (times, values) at the times t,
+       linearly interpolated (or held, if step) between recorded values.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    if len(times) == 0:
+        return np.full(len(t), np.nan)
+    k = np.searchsorted(times, t, side='right') - 1
+    k0 = np.maximum(k, 0)
+    if step:
+        output = values[k0]
+    else:
+        k1 = np.minimum(k0 + 1, len(times) - 1)
+        dt = times[k1] - times[k0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(dt > 0, (t - times[k0])/dt, 0.0)
+        output = values[k0] + (values[k1] - values[k0])*np.clip(frac, 0, 1)
+    return np.where(k < 0, np.nan, output)
+
+
+def _check_summaries(summaries):
+    summaries = list(summaries)
+    unknown = [c for c in summaries if c not in SUMMARY_COLUMNS]
+    if len(unknown) > 0:
+        raise ValueError('unknown summaries: ' + ', '.join(unknown))
+    return summaries
+
+
+def _prepare(data, start_time, end_time, interval_secs):
+    """Return the sorted recorded times and values (in UTC seconds) of a raw
+       series, and the edges of the complete intervals of the grid.
+    """
+    num_intervals = max(0, int(math.floor(
+        1.0*(end_time - start_time)/interval_secs)))
+    edges = start_time + interval_secs*np.arange(num_intervals + 1,
+                                                 dtype=np.float64)
+    if len(data) > 0:
+        times = data.index.as_unit('ns').asi8/1e9
+        values = np.asarray(data.values, dtype=np.float64)
+        order = np.argsort(times, kind='stable')
+        times = times[order]
+        values = values[order]
+    else:
+        times = np.zeros(0)
+        values = np.zeros(0)
+    return (times, values, edges)
+
+
+def _statistics(moments):
+    """Compute Avg, Std, Min and Max from the moments of _time_weighted(). """
+    duration = moments['Dur']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(duration > 0, moments['Sum']/duration, np.nan)
+        stds = np.sqrt(np.maximum(moments['Sq']/duration - means*means, 0.0))
+    return {'Avg': means + moments['offset'], 'Std': stds,
+            'Min': moments['Min'], 'Max': moments['Max']}
+
+
+def _time_weighted(times, values, edges, step):
+    """Compute the time with data, the integrals of the signal and its square
+       (relative to the returned offset) and the Min and Max over each
+       interval between the edges.
+    """
+    num_intervals = len(edges) - 1
+
+    # The signal is piecewise linear (or constant) between the knots, which
+    # are the recorded values inside the grid plus the interval boundaries,
+    # so no segment between two knots crosses a boundary
+    inside = (times >= edges[0]) & (times < edges[-1])
+    knot_times = np.concatenate([edges, times[inside]])
+    knot_values = np.concatenate([values_at(times, values, edges, step),
+                                  values[inside]])
+    order = np.argsort(knot_times, kind='stable')
+    knot_times = knot_times[order]
+    knot_values = knot_values[order]
+
+    # Integrate each segment, relative to an offset to keep the variance
+    # accurate for large values
+    v0 = knot_values[:-1]
+    v1 = v0 if step else knot_values[1:]
+    dt = np.diff(knot_times)
+    good = np.isfinite(v0) & np.isfinite(v1) & (dt > 0)
+    offset = np.nanmean(knot_values) if good.any() else 0.0
+    v0 = np.where(good, v0 - offset, 0.0)
+    v1 = np.where(good, v1 - offset, 0.0)
+    dt = np.where(good, dt, 0.0)
+    bins = np.searchsorted(edges, knot_times[:-1], side='right') - 1
+    bins = np.minimum(bins, num_intervals - 1)
+    duration = np.bincount(bins, dt, num_intervals)
+    total = np.bincount(bins, dt*(v0 + v1)/2.0, num_intervals)
+    squares = np.bincount(bins, dt*(v0*v0 + v0*v1 + v1*v1)/3.0,
+                          num_intervals)
+
+    # The extremes of a piecewise linear signal are at its knots; each
+    # interval's knots start with its own lower boundary (the last knot is
+    # the upper boundary of the grid, which only counts when interpolating)
+    starts = np.searchsorted(knot_times, edges[:-1], side='left')
+    with np.errstate(invalid='ignore'):
+        mins = np.fmin.reduceat(knot_values[:-1], starts)
+        maxs = np.fmax.reduceat(knot_values[:-1], starts)
+        if not step:
+            ends = values_at(times, values, edges[1:], step)
+            mins = np.fmin(mins, ends)
+            maxs = np.fmax(maxs, ends)
+    return {'Dur': duration, 'Sum': total, 'Sq': squares, 'Min': mins,
+            'Max': maxs, 'offset': offset}
@@ -0,0 +1,680 @@
+"""Deterministic, in-memory stand-in for a PI historian.
+
+SyntheticHistorian is a pihist backend (see pihist.PISDK) that generates raw,
+interpolated and summary data for any number of tags without pywin32, the PI
+SDK or a network connection.  This allows the acquisition path (pihist and the
+AutoIPM.Get*InputData functions) to be profiled and load-tested on any
+machine, e.g.:
+
+    import pihist, pisynth
+    historian = pisynth.SyntheticHistorian(latency_secs=0.05)
+    server = pihist.Server('SYNTH', backend=historian)
+    data = server.get_tag(historian.get_tag_names()[0]).get_large_raw_data(
+        '2022-01-01 00:00:00', '2022-02-01 00:00:00')
+
+Every tag's data is a pure function of its name, the seed and the time, so
+repeated runs return identical values.  Recorded events lie on a regular
+per-tag grid and interpolation is linear (step-wise for digital tags).  The
+time-weighted summaries are integrals of that interpolated signal over each
+interval, leaving out the time between events that aren't good, and the
+event-weighted ones are computed from the good events in each interval.
+"""
+
+import re
+import math
+import time
+import zlib
+import random
+import fnmatch
+import datetime
+import threading
+import pytz
+import numpy as np
+
+# Enumerated constants, with the same names as the PI SDK's PIConstants
+CONSTANTS = {
+    'PointTypeConstants': {'Null': 0, 'Int16': 6, 'Int32': 8,
+                           'Float16': 11, 'Float32': 12, 'Float64': 13,
+                           'Digital': 101, 'Blob': 102, 'TimeStamp': 104,
+                           'String': 105},
+    'DirectionConstants': {'Forward': 1, 'Reverse': -1},
+    'BoundaryTypeConstants': {'Inside': 0, 'Outside': 1, 'Interpolated': 2,
+                              'Auto': 3},
+    'FilteredViewConstants': {'Remove Filtered': 0, 'Show Filtered': 1},
+    'RetrievalTypeConstants': {'Auto': 0, 'AtOrBefore': 1, 'Before': 2,
+                               'AtOrAfter': 3, 'After': 4, 'Compressed': 5,
+                               'Interpolated': 6},
+    'CalculationBasisConstants': {'Time Weighted': 0, 'Event Weighted': 1},
+    'ArchiveSummariesTypeConstants': {'Total': 1, 'Average': 2, 'Minimum': 4,
+                                      'Maximum': 8, 'Range': 16,
+                                      'StdDev': 32, 'PopulationStdDev': 64,
+                                      'Count': 128, 'PercentGood': 8192,
+                                      'All Supported Summary types': 8447},
+}
+_SUMMARY_BITS = CONSTANTS['ArchiveSummariesTypeConstants']
+
+
+class SyntheticHistorian(object):
+    """A pihist backend that serves generated data instead of a PI historian.
+
+    Any tag name may be requested; the tag_names given to the constructor are
+    only the ones listed by Server.get_tag_names() and similar queries.
+    """
+
+    def __init__(self, tag_names=None, num_tags=1000, seed=0,
+                 raw_interval_secs=60.0, digital_patterns=(),
+                 bad_fraction=0.0, latency_secs=0.0, secs_per_value=0.0,
+                 timeout_rate=0.0, max_values_per_request=None,
+                 time_zone='UTC', start_time='2000-01-01 00:00:00'):
+        """Configure the synthetic historian.
+
+        Args:
+            tag_names              -- the tag names that this historian lists;
+                                      by default, num_tags generated names
+            num_tags               -- the number of tag names to generate if
+                                       tag_names is None
+            seed                   -- changes every tag's data
+            raw_interval_secs      -- the mean time between recorded events;
+                                      each tag's spacing is between 0.5 and
+                                      1.5 times this (the data density)
+            digital_patterns       -- fnmatch-style patterns (e.g. '*.STS')
+                                      for tag names that are digital tags
+                                      with codes 0 and 1
+            bad_fraction           -- the fraction of recorded events that
+                                      are marked as not good
+            latency_secs           -- the time taken by every data request
+            secs_per_value         -- additional time per requested value
+            timeout_rate           -- the probability that any data request
+                                      times out
+            max_values_per_request -- data requests for more values than this
+                                      time out, as does any request whose
+                                      latency would exceed the server Timeout
+            time_zone              -- the server's time zone (a pytz name)
+            start_time             -- the server-local time of the first
+                                      recorded event of every tag
+        """
+        if tag_names is None:
+            tag_names = ['SYN_{0:05d}.PV'.format(i) for i in range(num_tags)]
+        self._tag_names = list(tag_names)
+        self._seed = seed
+        self._raw_interval_secs = float(raw_interval_secs)
+        self._digital_patterns = [p.lower() for p in digital_patterns]
+        self._bad_fraction = bad_fraction
+        self._latency_secs = latency_secs
+        self._secs_per_value = secs_per_value
+        self._timeout_rate = timeout_rate
+        self._max_values_per_request = max_values_per_request
+        self._tz = pytz.timezone(time_zone)
+        self._origin = parse_time(start_time, self._tz)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    # --- the pihist backend interface ---
+
+    def open_server(self, server_name, connection_string):
+        """Return a new connection to this historian. """
+        return _SyntheticServer(self, server_name)
+
+    def new_time_format(self, pi_server):
+        """Return a time object in this historian's time zone. """
+        return _SyntheticTime(self._tz)
+
+    def new_point_list(self):
+        """Return an empty list of points, for requests for several tags. """
+        return _SyntheticPointList()
+
+    def get_constant(self, collection_name, constant_name):
+        """Return an enumerated constant, as PISDK.get_constant() does. """
+        return _Constant(CONSTANTS[collection_name][constant_name])
+
+    def get_digital_codes(self, values, is_good):
+        """Return the codes of a digital tag's values; these are already
+           integers for this backend.
+        """
+        return np.where(is_good, values, -1).astype(np.int32)
+
+    def enter_thread(self):
+        pass
+
+    def for_thread(self):
+        return self
+
+    def leave_thread(self):
+        pass
+
+    # --- inspection ---
+
+    def get_tag_names(self):
+        """Return the tag names listed by this historian. """
+        return list(self._tag_names)
+
+    def reset_stats(self):
+        """Zero the request counters returned by get_stats(). """
+        with self._lock:
+            self._stats = {'requests': 0, 'values': 0, 'timeouts': 0,
+                           'wait_secs': 0.0}
+            self.request_log = []
+
+    def get_stats(self):
+        """Return a dictionary of request counters since the last
+           reset_stats(): requests, values, timeouts and wait_secs.  The
+           request_log attribute lists (wall clock time, request type, tag
+           name, number of values) for every successful data request.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    # --- internals ---
+
+    def _request(self, pi_server, kind, tag_name, num_values):
+        """Account for one data request, simulating its latency or timeout."""
+        latency = self._latency_secs + self._secs_per_value*num_values
+        with self._lock:
+            self._stats['requests'] += 1
+            timed_out = (   (   (self._max_values_per_request is not None)
+                             and (num_values > self._max_values_per_request))
+                         or (latency > pi_server.Timeout)
+                         or (self._random.random() < self._timeout_rate))
+            if timed_out:
+                self._stats['timeouts'] += 1
+            else:
+                self._stats['values'] += num_values
+                self._stats['wait_secs'] += latency
+        if timed_out:
+            raise TimeoutError('synthetic historian: request timeout for "'
+                               + tag_name + '"')
+        if latency > 0:
+            time.sleep(latency)
+        with self._lock:
+            self.request_log.append((time.time(), kind, tag_name, num_values))
+
+    def _is_digital(self, tag_name):
+        name = tag_name.lower()
+        return any(fnmatch.fnmatchcase(name, p) for p in self._digital_patterns)
+
+
+class _Constant(object):
+    def __init__(self, value):
+        self.Value = value
+
+    def __int__(self):
+        return self.Value
+
+
+def _value(c):
+    """Accept either a _Constant or a plain integer argument. """
+    return c.Value if isinstance(c, _Constant) else int(c)
+
+
+def _seconds(t):
+    """Accept either a _SyntheticTime or a number of seconds. """
+    return t.UTCSeconds if isinstance(t, _SyntheticTime) else float(t)
+
+
+# A relative time offset at the end of a PI time string, e.g. '-1d' or '+6h'
+_OFFSET = re.compile(r'([+-])\s*(\d+(?:\.\d*)?)\s*([smhdw])\s*$')
+_OFFSET_SECS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_time(s, tz):
+    """Convert a server-local time string to UTC seconds.
+
+    Besides ISO times, this accepts PI's relative times: '*' (now), 't' or
+    'today' (midnight), and 'y' or 'yesterday' (midnight a day earlier),
+    each optionally followed by offsets in seconds, minutes, hours, days or
+    weeks, e.g. '*-1d', 't+6h' or '*-1d+30m'.  Offsets alone are relative to
+    now.  Day and week offsets keep the local time of day across daylight
+    saving changes.
+    """
+    base = s.strip()
+    offsets = []
+    while True:
+        m = _OFFSET.search(base)
+        if m is None:
+            break
+        offsets.insert(0, (float(m.group(1) + m.group(2)), m.group(3)))
+        base = base[:m.start()].rstrip()
+    if base in ('', '*'):
+        dt = datetime.datetime.now(tz)
+    elif base.lower() in ('t', 'today', 'y', 'yesterday'):
+        day = datetime.datetime.now(tz).date()
+        if base.lower().startswith('y'):
+            day -= datetime.timedelta(days=1)
+        dt = tz.localize(datetime.datetime.combine(day, datetime.time()))
+    else:
+        dt = datetime.datetime.fromisoformat(base)
+        if dt.tzinfo is None:
+            dt = tz.localize(dt)
+    for (n, unit) in offsets:
+        delta = datetime.timedelta(seconds=n*_OFFSET_SECS[unit])
+        if unit in 'dw':
+            dt = tz.localize(dt.replace(tzinfo=None) + delta)
+        else:
+            dt = tz.normalize(dt + delta)
+    return dt.timestamp()
+
+
+def _noise(k, phase):
+    """Deterministic pseudo-random numbers in [-1, 1) for integer arrays k. """
+    x = np.sin(np.asarray(k, dtype=np.float64)*12.9898 + phase*78.233)
+    return 2.0*((x*43758.5453) % 1.0) - 1.0
+
+
+class _SyntheticTime(object):
+    """Mimics a PITimeServer.PITimeFormat COM object. """
+
+    def __init__(self, tz, utc_seconds=0.0):
+        self._tz = tz
+        self.UTCSeconds = utc_seconds
+        self.FormatString = 'yyyy-MM-dd hh:mm:ss'
+
+    def Clone(self):
+        return _SyntheticTime(self._tz, self.UTCSeconds)
+
+    @property
+    def InputString(self):
+        return self.OutputString
+
+    @InputString.setter
+    def InputString(self, s):
+        self.UTCSeconds = parse_time(s, self._tz)
+
+    @property
+    def OutputString(self):
+        dt = datetime.datetime.fromtimestamp(self.UTCSeconds, self._tz)
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _Version(object):
+    def __init__(self):
+        self.OSName = 'Synthetic'
+        self.OSVersion = '1'
+        self.Version = 'synthetic'
+
+
+class _SyntheticServer(object):
+    """Mimics an open PISDK.Server COM object. """
+
+    def __init__(self, historian, name):
+        self._historian = historian
+        self.Name = name
+        self.Path = '\\\\' + name
+        self.Port = 5450
+        self.ServerVersion = _Version()
+        self.CurrentUser = 'piuser'
+        self.Timeout = 600
+        self.PITimeZoneInfo = historian._tz
+        self.PIPoints = _SyntheticPoints(self)
+
+    def Open(self, connection_string=''):
+        pass
+
+    def Close(self):
+        pass
+
+    def ServerTime(self):
+        return _SyntheticTime(self._historian._tz, time.time())
+
+    def GetPoints(self, query, unused=None):
+        """Supports queries of the form tag="pattern" [or tag="pattern"...],
+           where the patterns may contain * and ? wildcards.
+        """
+        patterns = []
+        for phrase in query.split(' or '):
+            (attribute, sep, value) = phrase.partition('=')
+            if attribute.strip().lower() != 'tag':
+                raise ValueError('unsupported query: ' + query)
+            patterns.append(value.strip().strip('"\'').lower())
+        return [self.PIPoints.Item(name)
+                for name in self._historian._tag_names
+                if any(fnmatch.fnmatchcase(name.lower(), p) for p in patterns)]
+
+
+class _SyntheticPoints(object):
+    def __init__(self, pi_server):
+        self._pi_server = pi_server
+
+    def Item(self, tag_name):
+        return _SyntheticPoint(self._pi_server, tag_name)
+
+
+class _Attribute(object):
+    def __init__(self, name, value):
+        self.Name = name
+        self.Value = value
+
+
+class _SyntheticAttributes(object):
+    def __init__(self, attributes):
+        self._attributes = attributes
+        self.Count = len(attributes)
+
+    def Item(self, name):
+        return _Attribute(name, self._attributes[name])
+
+    def GetAttributes(self):
+        return [_Attribute(n, v) for (n, v) in self._attributes.items()]
+
+
+class _SyntheticPoint(object):
+    """Mimics a PIPoint COM object; all of its data is generated. """
+
+    def __init__(self, pi_server, tag_name):
+        historian = pi_server._historian
+        self._historian = historian
+        self.Name = tag_name
+
+        # Per-tag parameters, derived from the name and the seed
+        h = zlib.crc32((str(historian._seed) + '|' + tag_name).encode('utf-8'))
+        u = [((h >> s) & 0xff)/256.0 for s in (0, 8, 16, 24)]
+        self._dt = historian._raw_interval_secs*(0.5 + u[0])
+        self._base = 10.0 + 990.0*u[1]
+        self._phase = u[2]
+        self._noise_phase = u[3] + (h % 9973)/9973.0
+        self._digital = historian._is_digital(tag_name)
+        point_types = CONSTANTS['PointTypeConstants']
+        self.PointType = point_types['Digital' if self._digital else 'Float32']
+
+        created = _SyntheticTime(historian._tz, historian._origin).OutputString
+        self.PointAttributes = _SyntheticAttributes({
+            'tag': tag_name,
+            'descriptor': 'synthetic ' + ('digital' if self._digital
+                                          else 'analog') + ' tag',
+            'engunits': '' if self._digital else 'units',
+            'pointtype': 'Digital' if self._digital else 'Float32',
+            'digitalset': 'OPEN_CLOSED' if self._digital else '',
+            'typicalvalue': 0 if self._digital else round(self._base, 3),
+            'pointsource': 'SYN',
+            'exdesc': '', 'instrumenttag': '', 'sourcetag': '',
+            'totalcode': 0, 'compressing': 1,
+            'creationdate': created, 'changedate': created,
+        })
+        self.Data = _SyntheticData(self, pi_server)
+
+    def event_times(self, k):
+        return self._historian._origin + k*self._dt
+
+    def event_values(self, k):
+        """Return (values, statuses) of the recorded events k. """
+        t = self.event_times(k)
+        if self._digital:
+            day = np.floor(t/86400.0)
+            values = (_noise(day, self._noise_phase) < -0.6).astype(np.int64)
+        else:
+            values = self._base*(  1.0
+                                 + 0.1*np.sin(2*math.pi*(t/86400.0
+                                                          + self._phase))
+                                 + 0.02*_noise(k, self._noise_phase))
+        statuses = np.zeros(len(k), dtype=np.int32)
+        bad_fraction = self._historian._bad_fraction
+        if bad_fraction > 0:
+            is_bad = (_noise(k + 0.5, self._phase) + 1.0)/2.0 < bad_fraction
+            statuses[is_bad] = -1
+            if not self._digital:
+                values = np.where(is_bad, np.nan, values)
+        return (values, statuses)
+
+    def values_at(self, t):
+        """Return (values, statuses) of the signal at arbitrary times t,
+           interpolated linearly (or step-wise for digital tags).
+        """
+        t = np.asarray(t, dtype=np.float64)
+        x = (t - self._historian._origin)/self._dt
+        k0 = np.floor(x).astype(np.int64)
+        before = k0 < 0
+        k0 = np.maximum(k0, 0)
+        (v0, s0) = self.event_values(k0)
+        if self._digital:
+            values = v0
+            statuses = s0
+        else:
+            (v1, s1) = self.event_values(k0 + 1)
+            frac = x - k0
+            values = v0 + (v1 - v0)*frac
+            statuses = np.minimum(s0, s1)
+        statuses = np.where(before, -1, statuses)
+        return (values, statuses)
+
+    def segments(self, t):
+        """Return (values at the start, values at the end, is_good) of the
+           signal over the segments between consecutive times t, none of
+           which may contain a recorded event.  A segment is good if the
+           events on either side of it are good (for digital tags, the one
+           before it).
+        """
+        t = np.asarray(t, dtype=np.float64)
+        x = (t - self._historian._origin)/self._dt
+        k0 = np.floor((x[:-1] + x[1:])/2).astype(np.int64)
+        before = k0 < 0
+        k0 = np.maximum(k0, 0)
+        (v0, s0) = self.event_values(k0)
+        v0 = np.asarray(v0, dtype=np.float64)
+        if self._digital:
+            (starts, ends) = (v0, v0)
+            is_good = s0 >= 0
+        else:
+            (v1, s1) = self.event_values(k0 + 1)
+            starts = v0 + (v1 - v0)*(x[:-1] - k0)
+            ends = v0 + (v1 - v0)*(x[1:] - k0)
+            is_good = (s0 >= 0) & (s1 >= 0)
+        return (starts, ends, is_good & ~before)
+
+
+class _SyntheticPointList(object):
+    """Mimics a PISDK.PointList collection. """
+
+    def __init__(self):
+        self._points = []
+        self.Data = _SyntheticListData(self._points)
+
+    def Add(self, point):
+        self._points.append(point)
+
+    @property
+    def Count(self):
+        return len(self._points)
+
+
+class _SyntheticValue(object):
+    """Mimics a single PIValue. """
+
+    def __init__(self, value, status):
+        self.Value = value
+        self._status = status
+
+    def IsGood(self):
+        return self._status >= 0
+
+
+class _SyntheticPointValue(object):
+    """Mimics a PointValue, one point's value from a list request. """
+
+    def __init__(self, point, pi_value):
+        self.PIPoint = point
+        self.PIValue = pi_value
+
+
+class _SyntheticListData(object):
+    """Mimics the ListData object of a PointList. """
+
+    def __init__(self, points):
+        self._points = points
+
+    def ArcValue(self, time_stamp, retrieval_type, unused=None):
+        if len(self._points) == 0:
+            return []
+        pi_server = self._points[0].Data._pi_server
+        pi_server._historian._request(pi_server, 'values', '(list)',
+                                      len(self._points))
+        t = _seconds(time_stamp)
+        output = []
+        for point in self._points:
+            (values, statuses) = point.values_at([t])
+            value = values[0] if point._digital else float(values[0])
+            output.append(_SyntheticPointValue(
+                point, _SyntheticValue(value, statuses[0])))
+        return output
+
+
+class _SyntheticValues(object):
+    """Mimics a PIValues collection. """
+
+    def __init__(self, values, times, statuses):
+        self._arrays = (values, times, statuses)
+        self.Count = len(times)
+
+    def GetValueArrays(self):
+        return self._arrays
+
+
+class _SyntheticSummaries(object):
+    """Mimics the PINamedValues collection returned by Data.Summaries(). """
+
+    def __init__(self, summaries):
+        self._summaries = summaries
+        self.Count = len(summaries)
+
+    def Item(self, name):
+        return _Attribute(name, self._summaries[name])
+
+
+class _SyntheticData(object):
+    """Mimics a PIData object. """
+
+    def __init__(self, point, pi_server):
+        self._point = point
+        self._pi_server = pi_server
+
+    def _recorded(self, k):
+        (values, statuses) = self._point.event_values(k)
+        return _SyntheticValues(values, self._point.event_times(k), statuses)
+
+    def RecordedValues(self, start_time, end_time, boundary_type,
+                       filter_expression='', filtered_view=0, unused=None):
+        t1 = (_seconds(start_time) - self._point._historian._origin)
+        t2 = (_seconds(end_time) - self._point._historian._origin)
+        (t1, t2) = (min(t1, t2), max(t1, t2))
+        k1 = max(0, int(math.ceil(t1/self._point._dt)))
+        k2 = int(math.floor(t2/self._point._dt))
+        k = np.arange(k1, max(k1, k2 + 1), dtype=np.int64)
+        self._point._historian._request(self._pi_server, 'raw',
+                                        self._point.Name, len(k))
+        return self._recorded(k)
+
+    def RecordedValuesByCount(self, start_time, count, direction,
+                              boundary_type, filter_expression='',
+                              filtered_view=0, unused=None):
+        count = int(count)
+        self._point._historian._request(self._pi_server, 'raw',
+                                        self._point.Name, count)
+        x = ((_seconds(start_time) - self._point._historian._origin)
+             / self._point._dt)
+        if _value(direction) >= 0:
+            k0 = max(0, int(math.ceil(x)))
+            k = np.arange(k0, k0 + count, dtype=np.int64)
+        else:
+            k0 = int(math.floor(x))
+            k = np.arange(k0, max(-1, k0 - count), -1, dtype=np.int64)
+        return self._recorded(k)
+
+    def InterpolatedValues(self, start_time, end_time, num_values,
+                           filter_expression='', filtered_view=0,
+                           unused=None):
+        num_values = int(num_values)
+        self._point._historian._request(self._pi_server, 'interpolated',
+                                        self._point.Name, num_values)
+        times = np.linspace(_seconds(start_time), _seconds(end_time),
+                            num_values)
+        (values, statuses) = self._point.values_at(times)
+        return _SyntheticValues(values, times, statuses)
+
+    def Summaries(self, start_time, end_time, boundary_type, summary_type,
+                  num_intervals, calculation_basis, unused=None):
+        num_intervals = int(num_intervals)
+        self._point._historian._request(self._pi_server, 'summaries',
+                                        self._point.Name, num_intervals)
+        t1 = _seconds(start_time)
+        t2 = _seconds(end_time)
+        edges = np.linspace(t1, t2, num_intervals + 1)
+        starts = edges[:-1]
+
+        # All of the recorded events inside the time range, binned by interval
+        origin = self._point._historian._origin
+        k1 = max(0, int(math.ceil((t1 - origin)/self._point._dt)))
+        k2 = int(math.ceil((t2 - origin)/self._point._dt)) - 1
+        k = np.arange(k1, max(k1, k2 + 1), dtype=np.int64)
+        (values, statuses) = self._point.event_values(k)
+        good = statuses >= 0
+        values = np.asarray(values, dtype=np.float64)[good]
+        bins = np.searchsorted(edges, self._point.event_times(k)[good],
+                               side='right') - 1
+        counts = np.bincount(bins, minlength=num_intervals)[:num_intervals]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sums = np.bincount(bins, values, num_intervals)[:num_intervals]
+            squares = np.bincount(bins, values*values,
+                                  num_intervals)[:num_intervals]
+            means = sums/counts
+            stds = np.sqrt(np.maximum(squares/counts - means*means, 0.0))
+        mins = np.full(num_intervals, np.inf)
+        maxs = np.full(num_intervals, -np.inf)
+        np.minimum.at(mins, bins, values)
+        np.maximum.at(maxs, bins, values)
+
+        # Intervals without events take the interpolated value at their start
+        empty = counts == 0
+        if empty.any():
+            (at_start, start_statuses) = self._point.values_at(starts[empty])
+            at_start = np.where(start_statuses >= 0, at_start, np.nan)
+            means[empty] = at_start
+            mins[empty] = at_start
+            maxs[empty] = at_start
+            stds[empty] = 0.0
+
+        if _value(calculation_basis) == 0:
+            computed = self._time_weighted(edges, k)
+            computed['Count'] = counts.astype(np.float64)
+        else:
+            computed = {'Average': means, 'Minimum': mins, 'Maximum': maxs,
+                        'StdDev': stds, 'PopulationStdDev': stds,
+                        'Range': maxs - mins, 'Total': np.nan_to_num(sums),
+                        'Count': counts.astype(np.float64),
+                        'PercentGood': np.where(empty, 0.0, 100.0)}
+        summaries = dict()
+        requested = _value(summary_type)
+        for (name, values) in computed.items():
+            if requested & _SUMMARY_BITS[name]:
+                statuses = np.where(np.isnan(values), -1, 0)
+                summaries[name] = _SyntheticValues(values, starts, statuses)
+        return _SyntheticSummaries(summaries)
+
+    def _time_weighted(self, edges, k):
+        """Return the time-weighted summaries of the interpolated signal over
+           the intervals between the edges, given the recorded events k in
+           them.  Totals are in value days, as the PI historian gives them.
+        """
+        num_intervals = len(edges) - 1
+        nodes = np.union1d(edges, self._point.event_times(k))
+        nodes = nodes[(nodes >= edges[0]) & (nodes <= edges[-1])]
+        (a, b, is_good) = self._point.segments(nodes)
+        secs = np.where(is_good, np.diff(nodes), 0.0)
+        (a, b) = (np.where(is_good, a, 0.0), np.where(is_good, b, 0.0))
+        bins = np.minimum(np.searchsorted(edges, nodes[:-1], side='right') - 1,
+                          num_intervals - 1)
+        good_secs = np.bincount(bins, secs, num_intervals)
+        integrals = np.bincount(bins, secs*(a + b)/2, num_intervals)
+        squares = np.bincount(bins, secs*(a*a + a*b + b*b)/3, num_intervals)
+        mins = np.full(num_intervals, np.inf)
+        maxs = np.full(num_intervals, -np.inf)
+        np.minimum.at(mins, bins[is_good], np.minimum(a, b)[is_good])
+        np.maximum.at(maxs, bins[is_good], np.maximum(a, b)[is_good])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = integrals/good_secs
+            stds = np.sqrt(np.maximum(squares/good_secs - means*means, 0.0))
+        empty = good_secs == 0
+        (mins[empty], maxs[empty], stds[empty]) = (np.nan, np.nan, np.nan)
+        return {'Average': means, 'Minimum': mins, 'Maximum': maxs,
+                'StdDev': stds, 'PopulationStdDev': stds,
+                'Range': maxs - mins,
+                'Total': np.where(empty, np.nan, integrals/86400.0),
+                'PercentGood': 100.0*good_secs/np.diff(edges)}
@@ -0,0 +1,26 @@
+"""Shared fixtures for the tests, which run pihist against the synthetic
+historian in pisynth, so they need neither Windows nor a PI server.
+"""
+
+import os
+import sys
+import pytest
+
+# The modules under test live in the repository root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pihist
+import pisynth
+
+
+@pytest.fixture
+def historian():
+    return pisynth.SyntheticHistorian(
+        num_tags=20, raw_interval_secs=300.0, digital_patterns=['*.sts'])
+
+
+@pytest.fixture
+def server(historian):
+    server = pihist.Server('SYNTH', backend=historian)
+    yield server
+    server.close_workers()
@@ -0,0 +1,109 @@
+"""Tests of the conversion of PI SDK value collections into Pandas objects.
+"""
+
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import pytz
+import pihist
+import pisynth
+
+BAD = object() # stands in for the system digital state of a bad value
+
+
+class FakeValues(object):
+    """Mimics a PIValues collection from its "parallel SafeArrays". """
+
+    def __init__(self, values, times, statuses):
+        self._arrays = (tuple(values), tuple(times), tuple(statuses))
+        self.Count = len(times)
+
+    def GetValueArrays(self):
+        return self._arrays
+
+
+def loop_to_series(tag, pi_vals):
+    """The conversion as it was done value by value, for comparison. """
+    if pi_vals.Count == 0:
+        return (pd.Series(data=None, index=None, name=tag._tag_name,
+                          dtype=np.float64), [], np.nan)
+    sa = pi_vals.GetValueArrays()
+    is_good = [(sa[2][i] >= 0) for i in range(len(sa[0]))]
+    index = [datetime.datetime.fromtimestamp(t, pytz.utc) for t in sa[1]]
+    data = [(sa[0][i] if is_good[i] else tag._default_value)
+            for i in range(len(sa[0]))]
+    return (pd.Series(data=data, index=index, name=tag._tag_name),
+            is_good, sa[1][-1])
+
+
+def make_values(n, bad):
+    times = 1.6e9 + 0.25*np.arange(n)
+    values = [BAD if i in bad else 100.0 + i/7.0 for i in range(n)]
+    statuses = [-1 if i in bad else 0 for i in range(n)]
+    return FakeValues(values, times, statuses)
+
+
+@pytest.mark.parametrize('bad', [set(), {0}, {3, 4, 9}, set(range(10))])
+def test_vectorized_conversion_matches_the_loop(server, bad):
+    tag = server.get_tag('SYN_00001.PV')
+    pi_vals = make_values(10, bad)
+    (data, is_good, last_time) = tag.pivals_to_series(pi_vals)
+    (expected, expected_good, expected_last) = loop_to_series(tag, pi_vals)
+    assert data.dtype == np.float64
+    np.testing.assert_array_equal(data.to_numpy(), expected.to_numpy())
+    assert list(data.index) == list(expected.index)
+    assert data.name == expected.name
+    assert list(is_good) == expected_good
+    assert last_time == expected_last
+
+
+def test_bad_values_of_a_string_tag_are_empty(server):
+    tag = server.get_tag('SYN_00001.PV')
+    tag._default_value = ''
+    pi_vals = FakeValues(['a', BAD, 'c'], [1.6e9, 1.6e9 + 1, 1.6e9 + 2],
+                         [0, -1, 0])
+    (data, is_good, last_time) = tag.pivals_to_series(pi_vals)
+    assert list(data) == list(loop_to_series(tag, pi_vals)[0]) == \
+        ['a', '', 'c']
+
+
+def test_no_values(server):
+    tag = server.get_tag('SYN_00001.PV')
+    (data, is_good, last_time) = tag.pivals_to_series(FakeValues([], [], []))
+    assert len(data) == 0
+    assert len(is_good) == 0
+    assert np.isnan(last_time)
+
+
+def test_digital_values_become_codes(server):
+    tag = server.get_tag('SYN_00002.STS')
+    pi_vals = FakeValues([0, 1, BAD, 1], 1.6e9 + np.arange(4), [0, 0, -1, 0])
+    (data, is_good, last_time) = tag.pivals_to_series(pi_vals)
+    assert data.dtype == np.int32
+    assert list(data) == [0, 1, -1, 1]
+    decoded = tag.decode_digital(data)
+    assert list(decoded.astype(object).fillna('-')) == \
+        ['OPEN', 'CLOSED', '-', 'CLOSED']
+    assert decoded.index.equals(data.index)
+
+
+def test_unknown_codes_are_missing():
+    decoded = pihist.decode_codes([0, 1, -1, 2, np.nan], ['OFF', 'ON'])
+    assert list(decoded.codes) == [0, 1, -1, -1, -1]
+    assert list(decoded.categories) == ['OFF', 'ON']
+
+
+def test_code_tables_are_read_once(monkeypatch, server):
+    read = []
+    item = pisynth._SyntheticAttributes.Item
+
+    def counting_item(self, name):
+        read.append(name)
+        return item(self, name)
+    monkeypatch.setattr(pisynth._SyntheticAttributes, 'Item', counting_item)
+    tag = server.get_tag('SYN_00002.STS')
+    for i in range(3):
+        assert tag.get_code_names() == ['OPEN', 'CLOSED']
+    assert read == ['digitalset']
+    assert server.get_tag('SYN_00001.PV').get_code_names() is None
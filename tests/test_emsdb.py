@@ -0,0 +1,313 @@
+"""Tests of the EMSDB helpers that don't need an Oracle database.  When
+cx_Oracle isn't installed, a stand-in module with the names that EMSDB uses
+is put in its place.
+"""
+
+import sys
+import types
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+
+try:
+    import cx_Oracle
+except ImportError:
+    cx_Oracle = types.ModuleType('cx_Oracle')
+
+    class DatabaseError(Exception):
+        pass
+    cx_Oracle.DatabaseError = DatabaseError
+    cx_Oracle.SessionPool = object
+    cx_Oracle.Connection = object
+    cx_Oracle.SPOOL_ATTRVAL_WAIT = 1
+    for name in ['NUMBER', 'BINARY_DOUBLE', 'BINARY_FLOAT', 'DATE',
+                 'TIMESTAMP', 'VARCHAR']:
+        setattr(cx_Oracle, 'DB_TYPE_' + name, 'DB_TYPE_' + name)
+    sys.modules['cx_Oracle'] = cx_Oracle
+
+import EMSDB
+
+
+def sample_result():
+    return pd.DataFrame({
+        'WELL': ['A-1', None, 'C  3', ''],
+        'OIL_RATE': [1.5, np.nan, 3.0, 4.25],
+        'TESTS': np.array([1, 2, 3, 4], dtype=np.int64),
+        'TEST_DATE': pd.to_datetime(['2021-01-01', None, '2021-01-03',
+                                     '2021-01-04'])})
+
+
+def test_query_cache_round_trip(tmp_path):
+    cache = EMSDB.QueryCache(str(tmp_path))
+    expected = sample_result()
+    assert cache.get('EMS', 'select * from tests') is None
+    assert cache.put('EMS', 'select * from tests', None, expected)
+    result = cache.get('ems', '  select *\n  from tests ')
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.WELL.isna().tolist() == [False, True, False, False]
+    assert cache.get_stats() == {'hits': 1, 'misses': 1, 'expired': 0,
+                                 'entries': 1}
+
+
+def test_query_cache_keeps_duplicate_column_names(tmp_path):
+    cache = EMSDB.QueryCache(str(tmp_path))
+    expected = pd.DataFrame([[1.0, 'x', 2.0], [3.0, None, 4.0]],
+                            columns=['RATE', 'NAME', 'RATE'])
+    assert cache.put('EMS', 'q', {'well': 'A-1'}, expected)
+    result = cache.get('EMS', 'q', {'well': 'A-1'})
+    pd.testing.assert_frame_equal(result, expected)
+    assert cache.get('EMS', 'q', {'well': 'B-2'}) is None
+
+
+def test_query_cache_skips_other_objects(tmp_path):
+    cache = EMSDB.QueryCache(str(tmp_path))
+    result = pd.DataFrame({'LOB': [b'abc', None]})
+    assert not cache.put('EMS', 'q', None, result)
+    assert cache.get('EMS', 'q') is None
+
+
+def test_query_cache_expiry_and_invalidation(tmp_path):
+    cache = EMSDB.QueryCache(str(tmp_path))
+    for (database, query) in [('EMS', 'q1'), ('EMS', 'q2'), ('DEV', 'q1')]:
+        cache.put(database, query, None, sample_result())
+    assert cache.get('EMS', 'q1', ttlSecs=-1) is None
+    assert cache.get_stats()['expired'] == 1
+    assert cache.get('EMS', 'q1') is not None
+
+    cache.invalidate('EMS', 'q1')
+    assert cache.get('EMS', 'q1') is None
+    assert cache.get('EMS', 'q2') is not None
+    cache.invalidate('ems')
+    assert cache.get('EMS', 'q2') is None
+    assert cache.get('DEV', 'q1') is not None
+    assert cache.prune(ttlSecs=-1) == 1
+    assert cache.get_stats()['entries'] == 0
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('select  a,\n\tb from t ', 'select a, b from t'),
+    ("select * from t where name = 'A  B'", "select * from t where name = 'A  B'"),
+    ("where x = 'it''s  here'  and y = 1", "where x = 'it''s  here' and y = 1"),
+    ('select "My  Column" from t', 'select "My  Column" from t')])
+def test_normalize_sql(query, expected):
+    assert EMSDB.normalize_sql(query) == expected
+
+
+@pytest.mark.parametrize('num_values, num_binds', [
+    (1, 1), (2, 2), (3, 4), (5, 8), (600, 1000), (1000, 1000), (1200, 1200)])
+def test_bind_list_pads_to_a_power_of_two(num_values, num_binds):
+    params = {'start': 0}
+    values = ['W{0}'.format(i) for i in range(num_values)]
+    text = EMSDB.bind_list('well', values, params)
+    assert text.split(', ') == [':well' + str(i) for i in range(num_binds)]
+    assert len(params) == num_binds + 1
+    assert [params['well' + str(i)] for i in range(num_binds)] == \
+        values + values[-1:]*(num_binds - num_values)
+
+
+class FakeCursor(object):
+    """Mimics a cx_Oracle cursor returning fixed rows. """
+
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = list(rows)
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.outputtypehandler = None
+        self.executed = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def executemany(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        (rows, self.rows) = (self.rows, [])
+        return rows
+
+    def fetchmany(self, size):
+        (rows, self.rows) = (self.rows[:size], self.rows[size:])
+        return rows
+
+
+class FakeConnection(object):
+    def __init__(self, description=None, rows=()):
+        self.description = description
+        self.rows = rows
+        self.cursors = []
+
+    def cursor(self):
+        self.cursors.append(FakeCursor(self.description, self.rows))
+        return self.cursors[-1]
+
+    def ping(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def commit(self):
+        pass
+
+
+class FakePool(object):
+    """Mimics a cx_Oracle.SessionPool, handing out one FakeConnection. """
+
+    def __init__(self, connection=None, **kwargs):
+        self.dsn = kwargs.get('dsn')
+        self.connection = connection or FakeConnection()
+        self.released = 0
+        self.closed = False
+        # Whether every cursor was closed when each session was released
+        self.cursors_closed = []
+
+    def acquire(self):
+        return self.connection
+
+    def release(self, connection):
+        self.released += 1
+        self.cursors_closed.append(all(c.closed for c in connection.cursors))
+
+    def drop(self, connection):
+        pass
+
+    def close(self, force=False):
+        self.closed = True
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    monkeypatch.setenv('TNS_ADMIN', str(tmp_path))
+    db = EMSDB.EMSDB(tnsAdmin=str(tmp_path))
+    yield db
+    db.close()
+
+
+def test_one_pool_is_kept_per_database(monkeypatch, db):
+    created = []
+    barrier = threading.Barrier(4, timeout=5)
+
+    def session_pool(**kwargs):
+        # Every thread creates its pool at the same time, so no lock may be
+        # held while a pool is being created
+        pool = FakePool(**kwargs)
+        created.append(pool)
+        barrier.wait()
+        return pool
+    monkeypatch.setattr(EMSDB.cx_Oracle, 'SessionPool', session_pool,
+                        raising=False)
+    databases = ['EMS', 'EMS', 'DEV', 'DEV']
+    pools = [None]*len(databases)
+
+    def get(i):
+        pools[i] = db.get_pool(databases[i])
+    threads = [threading.Thread(target=get, args=(i,))
+               for i in range(len(databases))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(created) == 4
+    assert (pools[0] is pools[1]) and (pools[2] is pools[3])
+    assert pools[0] is not pools[2]
+    assert [p.dsn for p in pools] == databases
+    # The pools that lost the race are closed, and the others kept
+    assert sorted(p.closed for p in created) == [False, False, True, True]
+    assert db.get_pool('EMS') is pools[0]
+
+
+def use_pool(monkeypatch, connection):
+    pool = FakePool(connection)
+    monkeypatch.setattr(EMSDB.cx_Oracle, 'SessionPool',
+                        lambda **kwargs: pool, raising=False)
+    return pool
+
+
+DESCRIPTION = [('WELL', EMSDB.cx_Oracle.DB_TYPE_VARCHAR),
+               ('OIL_RATE', EMSDB.cx_Oracle.DB_TYPE_NUMBER),
+               ('TEST_DATE', EMSDB.cx_Oracle.DB_TYPE_DATE)]
+ROWS = [('A-1', 1.5, EMSDB.datetime(2021, 1, 1)),
+        (None, None, None),
+        ('C-3', 3.0, EMSDB.datetime(2021, 1, 3, 12, 30))]
+
+
+def test_cursors_are_closed_after_each_statement(monkeypatch, db):
+    connection = FakeConnection(DESCRIPTION, ROWS)
+    pool = use_pool(monkeypatch, connection)
+    result = db.query('EMS', 'select * from tests', {'well': 'A-1'})
+    assert list(result.columns) == ['WELL', 'OIL_RATE', 'TEST_DATE']
+    assert len(result) == 3
+    db.execute('EMS', 'delete from tests')
+    db.execute('EMS', 'insert into tests values (:1)', [[1], [2]])
+    assert len(connection.cursors) == 3
+    assert all(c.closed for c in connection.cursors)
+    assert connection.cursors[0].executed == [('select * from tests',
+                                               {'well': 'A-1'})]
+    assert pool.cursors_closed == [True, True, True]
+
+
+def test_cursors_are_closed_when_iteration_stops(monkeypatch, db):
+    connection = FakeConnection(DESCRIPTION, ROWS)
+    pool = use_pool(monkeypatch, connection)
+    batches = db.iter_query('EMS', 'select * from tests', batchSize=1)
+    next(batches)
+    assert not connection.cursors[0].closed
+    batches.close()
+    assert pool.cursors_closed == [True]
+
+
+def check_dtypes(batch):
+    assert list(batch.columns) == ['WELL', 'OIL_RATE', 'TEST_DATE']
+    assert batch.WELL.dtype == object
+    assert batch.OIL_RATE.dtype == np.float64
+    assert batch.TEST_DATE.dtype == np.dtype('datetime64[us]')
+
+
+def test_iter_query_batches_are_typed(monkeypatch, db):
+    connection = FakeConnection(DESCRIPTION, ROWS)
+    use_pool(monkeypatch, connection)
+    batches = list(db.iter_query('EMS', 'select * from tests', batchSize=2))
+    assert [len(b) for b in batches] == [2, 1]
+    for batch in batches:
+        check_dtypes(batch)
+    assert connection.cursors[0].outputtypehandler is \
+        EMSDB.fetch_numbers_as_floats
+    result = pd.concat(batches, ignore_index=True)
+    assert list(result.WELL) == ['A-1', None, 'C-3']
+    np.testing.assert_array_equal(result.OIL_RATE, [1.5, np.nan, 3.0])
+    assert result.TEST_DATE.isna().tolist() == [False, True, False]
+    assert result.TEST_DATE[2] == pd.Timestamp('2021-01-03 12:30')
+
+
+def test_iter_query_without_rows_yields_an_empty_frame(monkeypatch, db):
+    use_pool(monkeypatch, FakeConnection(DESCRIPTION, []))
+    batches = list(db.iter_query('EMS', 'select * from tests'))
+    assert len(batches) == 1
+    assert len(batches[0]) == 0
+    check_dtypes(batches[0])
+
+
+def test_numbers_are_fetched_as_floats():
+    class VarCursor(object):
+        arraysize = 500
+
+        def var(self, type_code, arraysize):
+            return (type_code, arraysize)
+    cursor = VarCursor()
+    assert EMSDB.fetch_numbers_as_floats(
+        cursor, 'OIL_RATE', EMSDB.cx_Oracle.DB_TYPE_NUMBER, 22, 0, 0) == \
+        (EMSDB.cx_Oracle.DB_TYPE_BINARY_DOUBLE, 500)
+    assert EMSDB.fetch_numbers_as_floats(
+        cursor, 'WELL', EMSDB.cx_Oracle.DB_TYPE_VARCHAR, 40, 0, 0) is None
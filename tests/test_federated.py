@@ -0,0 +1,105 @@
+"""Tests of FederatedServer routing and merging over two synthetic
+   historians.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import picache
+import pihist
+import pirollup
+import pisynth
+
+
+@pytest.fixture
+def federated():
+    historians = {'A': pisynth.SyntheticHistorian(num_tags=1, seed=1),
+                  'B': pisynth.SyntheticHistorian(num_tags=1, seed=2)}
+    servers = {name: pihist.Server(name, backend=h)
+               for (name, h) in historians.items()}
+    federated = pihist.FederatedServer(servers,
+                                       prefixes={'A_': 'A', 'B_': 'B'},
+                                       lookup={'B_SPECIAL.PV': 'A'})
+    yield (federated, servers)
+    federated.close()
+
+
+def test_federated_routing(federated):
+    (federated, servers) = federated
+    assert federated.route('a_1.PV') == 'A'
+    assert federated.route('B_1.PV') == 'B'
+    assert federated.route('b_special.pv') == 'A'
+    assert federated.route('C_1.PV') is None
+    with pytest.raises(ValueError):
+        pihist.FederatedServer(servers, prefixes={'C_': 'C'})
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_federated_results_come_from_each_tags_historian(federated, ordered):
+    (federated, servers) = federated
+    names = ['A_1.PV', 'B_1.PV', 'C_1.PV', 'B_SPECIAL.PV', 'A_1.PV']
+    results = list(federated.get_tag_interpolated_data(
+        names, '2021-01-01 00:00:00', '2021-01-02 00:00:00', 3600,
+        ordered=ordered))
+    if ordered:
+        assert [r[0] for r in results] == names
+    else:
+        assert sorted(r[0] for r in results) == sorted(names)
+    for (tag_name, data, tag) in results:
+        name = federated.route(tag_name)
+        if name is None:
+            assert (data, tag) == (None, None)
+            continue
+        expected = servers[name].get_tag(tag_name).get_large_interpolated_data(
+            '2021-01-01 00:00:00', '2021-01-02 00:00:00', 3600)
+        pd.testing.assert_series_equal(data, expected, check_freq=False)
+        assert isinstance(tag, pihist.Tag)
+
+
+def test_federated_values_at(federated):
+    (federated, servers) = federated
+    values = federated.get_values_at(['B_1.PV', 'A_1.PV', 'C_1.PV'],
+                                     '2021-01-01 00:00:00')
+    assert list(values.index) == ['B_1.PV', 'A_1.PV', 'C_1.PV']
+    for name in ['A', 'B']:
+        tag_name = name + '_1.PV'
+        expected = servers[name].get_values_at([tag_name],
+                                               '2021-01-01 00:00:00')
+        assert values[tag_name] == expected[tag_name]
+    assert np.isnan(values['C_1.PV'])
+
+
+def test_federated_requests_use_each_historians_settings(tmp_path):
+    historians = {'A': pisynth.SyntheticHistorian(num_tags=1, seed=1),
+                  'B': pisynth.SyntheticHistorian(num_tags=1, seed=2)}
+    servers = {name: pihist.Server(name, backend=h)
+               for (name, h) in historians.items()}
+    federated = pihist.FederatedServer(servers,
+                                       prefixes={'A_': 'A', 'B_': 'B'})
+    names = ['A_1.PV', 'B_1.PV']
+    try:
+        # Settings changed after the first request reach the historians
+        list(federated.get_tag_raw_data(names, '2021-01-01 00:00:00',
+                                        '2021-01-02 00:00:00'))
+        for (name, server) in servers.items():
+            cache = picache.TagCache(str(tmp_path / name))
+            server.set_cache(cache)
+            server.set_rollups(pirollup.RollupStore(cache))
+
+        for i in range(2):
+            for h in historians.values():
+                h.reset_stats()
+            results = list(federated.get_tag_time_averaged_data(
+                names, '2021-01-01 00:00:00', '2021-01-03 00:00:00', 86400,
+                summaries=['Avg']))
+            assert all(len(data) == 2 for (tag_name, data, tag) in results)
+            if i == 1:
+                # Answered from the stored buckets
+                assert all(h.get_stats()['requests'] == 0
+                           for h in historians.values())
+        for (name, server) in servers.items():
+            assert server.get_rollups().get_stats()['answered'] == 2
+            assert len(server._cache.get_ranges(
+                name, name + '_1.PV', 'rollup@86400+0')) == 1
+    finally:
+        federated.close()
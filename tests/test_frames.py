@@ -0,0 +1,51 @@
+"""Tests of the wide multi-tag frames built by pihist.make_frame(). """
+
+import numpy as np
+import pandas as pd
+import pihist
+
+START = '2021-01-01 00:00:00'
+END = '2021-01-02 00:00:00'
+TAG_NAMES = ['SYN_00001.PV', 'SYN_00002.STS', 'SYN_00003.PV', 'SYN_00001.PV']
+
+
+def test_interpolated_frame_columns_and_dtypes(server):
+    (frame, is_good) = server.get_interpolated_frame(TAG_NAMES, START, END,
+                                                     3600)
+    assert list(frame.columns) == TAG_NAMES
+    assert frame.shape == (24, 4)
+    assert is_good.shape == frame.shape
+    assert frame.dtypes.iloc[0] == np.float64
+    assert isinstance(frame.dtypes.iloc[1], pd.CategoricalDtype)
+    assert list(frame.iloc[:, 1].cat.categories) == ['OPEN', 'CLOSED']
+    for (tag_name, data, tag) in server.get_tag_interpolated_data(
+            TAG_NAMES[:1], START, END, 3600):
+        np.testing.assert_array_equal(frame.iloc[:, 0].to_numpy(),
+                                      data.to_numpy(dtype=np.float64))
+        assert frame.index.equals(data.index)
+
+
+def test_frame_dtype_and_digital_codes(server):
+    (frame, is_good) = server.get_interpolated_frame(
+        TAG_NAMES, START, END, 3600, dtype=np.float32, digital='codes')
+    assert (frame.dtypes == np.float32).all()
+    assert set(np.unique(frame.iloc[:, 1])) <= {0.0, 1.0}
+
+
+def test_time_averaged_frame_is_float64(server):
+    (frame, is_good) = server.get_time_averaged_frame(TAG_NAMES, START, END,
+                                                      3600, 'Max')
+    assert list(frame.columns) == TAG_NAMES
+    assert (frame.dtypes == np.float64).all()
+    assert is_good.all()
+
+
+def test_missing_data_is_not_good(server):
+    tag = server.get_tag('SYN_00001.PV')
+    data = next(server.get_tag_interpolated_data([tag._tag_name], START,
+                                                 END, 3600))[1]
+    (frame, is_good) = pihist.make_frame([('SYN_00001.PV', data, tag),
+                                          ('NOT_FOUND', None, None)])
+    assert list(frame.columns) == ['SYN_00001.PV', 'NOT_FOUND']
+    assert frame.NOT_FOUND.isna().all()
+    assert is_good[:, 0].all() and not is_good[:, 1].any()
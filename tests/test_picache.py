@@ -0,0 +1,74 @@
+"""Tests of the TagCache's range coverage, through pihist and the synthetic
+historian.
+"""
+
+import numpy as np
+import pandas as pd
+import picache
+
+TAG = 'SYN_00001.PV'
+
+
+def raw(server, start_time, end_time):
+    return next(server.get_tag_raw_data([TAG], start_time, end_time))[1]
+
+
+def test_cached_data_is_not_downloaded_again(tmp_path, historian, server):
+    expected = raw(server, '2021-01-01 00:00:00', '2021-01-03 00:00:00')
+    server.set_cache(picache.TagCache(str(tmp_path)))
+    first = raw(server, '2021-01-01 00:00:00', '2021-01-03 00:00:00')
+    pd.testing.assert_series_equal(first, expected, check_freq=False)
+
+    historian.reset_stats()
+    second = raw(server, '2021-01-01 00:00:00', '2021-01-03 00:00:00')
+    assert historian.get_stats()['requests'] == 0
+    pd.testing.assert_series_equal(second, expected, check_freq=False)
+
+    # A range inside the cached one is sliced from it
+    inside = raw(server, '2021-01-01 12:00:00', '2021-01-02 00:00:00')
+    assert historian.get_stats()['requests'] == 0
+    assert len(inside) > 0
+    assert inside.index[0] >= pd.Timestamp('2021-01-01 12:00:00', tz='UTC')
+    assert inside.index[-1] < pd.Timestamp('2021-01-02 00:00:00', tz='UTC')
+
+
+def test_only_the_missing_ranges_are_downloaded(tmp_path, server):
+    cache = picache.TagCache(str(tmp_path))
+    server.set_cache(cache)
+    tag = server.get_tag(TAG)
+    fetched = []
+
+    def fetch(a, b):
+        fetched.append((a, b))
+        return tag.get_large_raw_data(a, b)
+    (t1, t2, t3, t4) = server.convert_times(
+        ['2021-01-01 00:00:00', '2021-01-02 00:00:00',
+         '2021-01-03 00:00:00', '2021-01-04 00:00:00'])
+    server.cached_download(tag, 'raw', t2, t3, fetch)
+    data = server.cached_download(tag, 'raw', t1, t4, fetch)
+    assert fetched == [(t2, t3), (t1, t2), (t3, t4)]
+    assert cache.get_ranges('SYNTH', TAG, 'raw') == [(t1, t4)]
+    expected = tag.get_large_raw_data(t1, t4)
+    pd.testing.assert_series_equal(data, expected, check_freq=False)
+
+
+def test_unsettled_data_is_not_marked_as_covered(tmp_path):
+    cache = picache.TagCache(str(tmp_path), settle_secs=3600)
+    t1 = 1.6e9
+    now = t1 + 86400 + 600
+
+    def fetch(a, b):
+        times = np.arange(a, b, 60.0)
+        return pd.Series(np.ones(len(times)),
+                         index=pd.to_datetime(times, unit='s', utc=True))
+    data = cache.get('SYNTH', TAG, 'raw', t1, t1 + 86400, fetch, now)
+    assert len(data) == 1440
+    assert cache.get_ranges('SYNTH', TAG, 'raw') == [(t1, now - 3600)]
+
+
+def test_digital_codes_keep_their_dtype(tmp_path, server):
+    server.set_cache(picache.TagCache(str(tmp_path)))
+    for i in range(2):
+        (tag_name, data, tag) = next(server.get_tag_interpolated_data(
+            ['SYN_00007.STS'], '2021-01-01 00:00:00', '2021-01-02 00:00:00'))
+        assert data.dtype == np.int32
@@ -0,0 +1,87 @@
+"""Tests of the request metrics and traces recorded by pimetrics. """
+
+import json
+import pihist
+import pimetrics
+import pisynth
+
+START = '2021-01-01 00:00:00'
+END = '2021-01-02 00:00:00'
+TAG_NAMES = ['SYN_00001.PV', 'SYN_00002.STS']
+
+
+def download(server):
+    list(server.get_tag_raw_data(TAG_NAMES, START, END, 1000))
+    list(server.get_tag_time_averaged_data(TAG_NAMES, START, END, 3600))
+
+
+def test_metrics_json_counts_every_request(tmp_path, historian, server):
+    metrics = pimetrics.Metrics()
+    server.set_metrics(metrics)
+    historian.reset_stats()
+    download(server)
+    path = str(tmp_path / 'metrics.json')
+    metrics.save_json(path)
+    with open(path) as fp:
+        summary = json.load(fp)
+    totals = summary['totals']
+    assert totals['requests'] == historian.get_stats()['requests']
+    assert sum(totals['latency']) == totals['requests']
+    assert len(totals['latency']) == len(summary['latency_edges_secs']) + 1
+    assert sorted(summary['modes']) == ['averaged', 'raw']
+    assert sorted(summary['tags']) == TAG_NAMES
+    # Each time-averaged interval is counted once, whatever its summaries
+    for tag_name in TAG_NAMES:
+        assert summary['tags'][tag_name]['averaged']['samples'] == 24
+    stats = metrics.get_stats()
+    assert list(stats.columns) == list(pimetrics.COUNTERS)
+    assert stats.requests.sum() == totals['requests']
+
+
+def test_chrome_trace_is_well_formed(tmp_path, server):
+    metrics = pimetrics.Metrics(trace=True)
+    server.set_metrics(metrics)
+    download(server)
+    path = str(tmp_path / 'trace.json')
+    metrics.save_chrome_trace(path)
+    with open(path) as fp:
+        trace = json.load(fp)
+    events = trace['traceEvents']
+    requests = [e for e in events if e['cat'] == 'request']
+    assert len(requests) == metrics.get_summary()['totals']['requests']
+    assert any(e['cat'] == 'convert' for e in events)
+    for e in events:
+        assert e['ph'] == 'X'
+        assert (e['ts'] >= 0) and (e['dur'] >= 0)
+        assert {'name', 'pid', 'tid', 'args'} <= set(e)
+
+
+def test_timeouts_and_retries_are_counted():
+    historian = pisynth.SyntheticHistorian(num_tags=1,
+                                           raw_interval_secs=300.0,
+                                           max_values_per_request=100)
+    metrics = pimetrics.Metrics()
+    server = pihist.Server('SYNTH', backend=historian, metrics=metrics)
+    server.get_tag('SYN_00000.PV').get_large_raw_data(START, END, 1000)
+    totals = metrics.get_summary()['totals']
+    assert totals['timeouts'] == historian.get_stats()['timeouts'] > 0
+    assert totals['errors'] == totals['timeouts']
+    assert totals['retries'] > 0
+
+
+def test_disabled_metrics_record_nothing(tmp_path, server):
+    metrics = pimetrics.Metrics()
+    server.set_metrics(metrics)
+    server.set_metrics(None)
+    assert server.get_metrics() is None
+    download(server)
+    assert metrics.get_summary()['totals']['requests'] == 0
+    assert len(metrics.get_stats()) == 0
+
+    # Without trace, no events are kept
+    server.set_metrics(metrics)
+    download(server)
+    path = str(tmp_path / 'trace.json')
+    metrics.save_chrome_trace(path)
+    with open(path) as fp:
+        assert json.load(fp)['traceEvents'] == []
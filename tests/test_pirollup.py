@@ -0,0 +1,75 @@
+"""Tests of the RollupStore against the synthetic historian's own
+time-weighted summaries.
+"""
+
+import numpy as np
+import pirollup
+import picache
+
+TAG = 'SYN_00001.PV'
+SUMMARIES = ['Avg', 'Std', 'Min', 'Max', 'Num']
+
+
+def averages(server, start_time, end_time, interval_secs):
+    return next(server.get_tag_time_averaged_data(
+        [TAG], start_time, end_time, interval_secs, summaries=SUMMARIES))[1]
+
+
+def test_rollups_match_the_historian(tmp_path, historian, server):
+    expected = averages(server, '2021-01-01 00:00:00', '2021-01-03 00:00:00',
+                        7200)
+    rollups = pirollup.RollupStore(picache.TagCache(str(tmp_path)))
+    server.set_rollups(rollups)
+    for i in range(2):
+        historian.reset_stats()
+        data = averages(server, '2021-01-01 00:00:00', '2021-01-03 00:00:00',
+                        7200)
+        assert list(data.index) == list(expected.index)
+        for c in ['Min', 'Max', 'Num']:
+            np.testing.assert_array_equal(data[c].to_numpy(dtype=np.float64),
+                                          expected[c].to_numpy(
+                                              dtype=np.float64), err_msg=c)
+        for c in ['Avg', 'Std']:
+            np.testing.assert_allclose(data[c].to_numpy(dtype=np.float64),
+                                       expected[c].to_numpy(dtype=np.float64),
+                                       rtol=1e-9, err_msg=c)
+        if i == 1:
+            # Answered from the stored hourly buckets
+            assert historian.get_stats()['requests'] == 0
+    assert rollups.get_stats()['answered'] == 2
+
+
+def test_only_the_missing_buckets_are_requested(tmp_path, historian, server):
+    rollups = pirollup.RollupStore(picache.TagCache(str(tmp_path)))
+    server.set_rollups(rollups)
+    averages(server, '2021-01-02 00:00:00', '2021-01-03 00:00:00', 86400)
+    historian.reset_stats()
+    data = averages(server, '2021-01-01 00:00:00', '2021-01-04 00:00:00',
+                    86400)
+    assert len(data) == 3
+    # One Summaries call per missing day, for the time-weighted statistics
+    # and for Num
+    assert historian.get_stats()['requests'] == 4
+    (t1, t4) = server.convert_times(['2021-01-01 00:00:00',
+                                     '2021-01-04 00:00:00'])
+    tag = server.get_tag(TAG)
+    assert rollups.is_stored(tag, t1, t4, 86400)
+
+
+def test_building_from_raw_values_is_an_option(tmp_path, historian, server):
+    cache = picache.TagCache(str(tmp_path))
+    rollups = pirollup.RollupStore(cache, build=True)
+    server.set_rollups(rollups)
+    data = averages(server, '2021-01-01 00:00:00', '2021-01-02 00:00:00',
+                    3600)
+    assert len(data) == 24
+    assert cache.get_ranges('SYNTH', TAG, 'rollup@3600+0') == []
+    assert len(cache.get_ranges('SYNTH', TAG, 'rollup@3600+0[raw]')) == 1
+
+
+def test_unsuitable_intervals_are_passed_on(tmp_path, server):
+    rollups = pirollup.RollupStore(picache.TagCache(str(tmp_path)))
+    server.set_rollups(rollups)
+    data = averages(server, '2021-01-01 00:00:00', '2021-01-01 01:00:00', 90)
+    assert len(data) == 40
+    assert rollups.get_stats() == {'answered': 0, 'passed': 1, 'buckets': 0}
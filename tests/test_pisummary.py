@@ -0,0 +1,60 @@
+"""Tests of the client-side summaries against the synthetic historian's own
+time-weighted summaries.
+"""
+
+import numpy as np
+import pytest
+import pisummary
+
+SUMMARIES = ['Avg', 'Std', 'Min', 'Max', 'Num']
+
+
+def download(server, tag_name, start_time, end_time, interval_secs):
+    (t1, t2) = server.convert_times([start_time, end_time])
+    tag = server.get_tag(tag_name)
+    pi = tag.get_large_time_averaged_data(t1, t2, interval_secs,
+                                          summaries=SUMMARIES)
+    # Start a day early, so that the value at t1 is known
+    raw = tag.get_large_raw_data(t1 - 86400, t2 + interval_secs)
+    return (t1, t2, pi, raw.astype(np.float64))
+
+
+@pytest.mark.parametrize('tag_name, step', [('SYN_00001.PV', False),
+                                            ('SYN_00002.STS', True)])
+def test_summarize_matches_the_historian(server, tag_name, step):
+    (t1, t2, pi, raw) = download(server, tag_name, '2021-03-01 00:00:00',
+                                 '2021-03-03 00:00:00', 3600)
+    local = pisummary.summarize(raw, t1, t2, 3600, SUMMARIES, step=step)
+    assert list(local.index) == list(pi.index)
+    for c in SUMMARIES:
+        np.testing.assert_allclose(local[c].to_numpy(dtype=np.float64),
+                                   pi[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, err_msg=c)
+
+
+def test_combine_matches_summarize(server):
+    (t1, t2, pi, raw) = download(server, 'SYN_00004.PV',
+                                 '2021-03-01 00:00:00', '2021-03-05 00:00:00',
+                                 86400)
+    hourly = pisummary.aggregate(raw, t1, t2, 3600)
+    daily = pisummary.combine(hourly, 24, SUMMARIES)
+    expected = pisummary.summarize(raw, t1, t2, 86400, SUMMARIES)
+    for c in SUMMARIES:
+        np.testing.assert_allclose(daily[c].to_numpy(dtype=np.float64),
+                                   expected[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, err_msg=c)
+        np.testing.assert_allclose(daily[c].to_numpy(dtype=np.float64),
+                                   pi[c].to_numpy(dtype=np.float64),
+                                   rtol=1e-9, err_msg=c)
+
+
+def test_regroup_adds_up_the_aggregates(server):
+    (t1, t2, pi, raw) = download(server, 'SYN_00005.PV',
+                                 '2021-03-01 00:00:00', '2021-03-02 00:00:00',
+                                 3600)
+    hourly = pisummary.aggregate(raw, t1, t2, 3600)
+    quarters = pisummary.regroup(hourly, 6)
+    assert len(quarters) == 4
+    np.testing.assert_allclose(quarters.Dur, 6*3600.0)
+    assert quarters.Num.sum() == hourly.Num.sum()
+    np.testing.assert_allclose(quarters.Sum.sum(), hourly.Sum.sum())
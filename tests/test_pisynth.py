@@ -0,0 +1,84 @@
+"""Tests of the synthetic historian itself. """
+
+import time
+import numpy as np
+import pytz
+import pytest
+import pihist
+import pisynth
+
+
+def test_parse_time_absolute():
+    tz = pytz.timezone('America/Edmonton')
+    assert pisynth.parse_time('2021-07-01 12:00:00', tz) == \
+        tz.localize(pisynth.datetime.datetime(2021, 7, 1, 12)).timestamp()
+    assert pisynth.parse_time('2021-07-01T12:00:00+00:00', tz) == \
+        pisynth.datetime.datetime(2021, 7, 1, 12,
+                                  tzinfo=pytz.utc).timestamp()
+
+
+@pytest.mark.parametrize('text, offset', [
+    ('*', 0), ('*-1d', -86400), ('*+2h', 7200), ('*-1d+30m', -84600),
+    ('-10m', -600), ('*-1w', -604800), (' * - 1.5h ', -5400)])
+def test_parse_time_relative_to_now(text, offset):
+    now = time.time()
+    assert abs(pisynth.parse_time(text, pytz.utc) - (now + offset)) < 5
+
+
+def test_parse_time_today_and_yesterday():
+    tz = pytz.timezone('America/Edmonton')
+    today = pisynth.parse_time('t', tz)
+    local = pisynth.datetime.datetime.fromtimestamp(today, tz)
+    assert (local.hour, local.minute, local.second) == (0, 0, 0)
+    assert today <= time.time() < today + 25*3600
+    assert pisynth.parse_time('today', tz) == today
+    assert pisynth.parse_time('y+6h', tz) == pisynth.parse_time('y', tz) + 6*3600
+    yesterday = pisynth.datetime.datetime.fromtimestamp(
+        pisynth.parse_time('y', tz), tz)
+    assert yesterday.date() == local.date() - pisynth.datetime.timedelta(days=1)
+
+
+def test_parse_time_day_offsets_keep_the_local_time():
+    tz = pytz.timezone('America/Edmonton')
+    # Daylight saving time started at 02:00 on 2021-03-14, so that day has
+    # 23 hours
+    t = pisynth.parse_time('2021-03-14 06:00:00-1d', tz)
+    assert t == pisynth.parse_time('2021-03-13 06:00:00', tz)
+    t = pisynth.parse_time('2021-03-14 06:00:00-24h', tz)
+    assert t == pisynth.parse_time('2021-03-13 05:00:00', tz)
+
+
+def test_relative_times_are_converted_by_the_backend(server):
+    (t, now) = server.convert_times(['*-1d', '*'])
+    assert abs((now - t) - 86400) < 5
+
+
+def test_time_weighted_average_integrates_the_signal(server):
+    tag = server.get_tag('SYN_00003.PV')
+    (t1, t2) = server.convert_times(['2021-01-05 00:00:00',
+                                     '2021-01-05 06:00:00'])
+    averages = tag.get_large_time_averaged_data(t1, t2, 3600,
+                                                summaries=['Avg', 'Min',
+                                                           'Max'])
+    times = np.linspace(t1, t2, 6*3600 + 1)
+    (values, statuses) = tag._pi_point.values_at(times)
+    segments = (values[:-1] + values[1:])/2
+    expected = segments.reshape(6, 3600).mean(axis=1)
+    np.testing.assert_allclose(averages.Avg, expected, rtol=1e-6)
+    assert (averages.Min <= averages.Avg).all()
+    assert (averages.Avg <= averages.Max).all()
+
+
+def test_time_weighted_summaries_skip_bad_data():
+    historian = pisynth.SyntheticHistorian(num_tags=1, bad_fraction=0.3,
+                                           raw_interval_secs=300.0)
+    server = pihist.Server('SYNTH', backend=historian)
+    tag = server.get_tag('SYN_00000.PV')
+    (t1, t2) = server.convert_times(['2021-01-05 00:00:00',
+                                     '2021-01-06 00:00:00'])
+    averages = tag.get_large_time_averaged_data(t1, t2, 3600,
+                                                summaries=['Avg', 'Min',
+                                                           'Max'])
+    assert not np.isnan(averages.Avg.to_numpy(dtype=np.float64)).any()
+    assert (averages.Min <= averages.Avg).all()
+    assert (averages.Avg <= averages.Max).all()
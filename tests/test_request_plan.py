@@ -0,0 +1,44 @@
+"""Tests of RequestPlan against direct Server calls. """
+
+import numpy as np
+import pandas as pd
+import pihist
+
+
+def test_request_plan_merges_requests(historian, server):
+    tags = historian.get_tag_names()
+    days = ['2021-12-{0:02d} 00:00:00'.format(d) for d in (10, 11, 12)]
+    plan = pihist.RequestPlan(server)
+    values = [plan.values_at(tags[:5], days[2]),
+              plan.values_at(tags[3:8], days[2])]
+    averages = [plan.time_averaged(tags[:4], days[0], days[1], 3600),
+                plan.time_averaged(tags[2:6], days[1], days[2], 3600)]
+    historian.reset_stats()
+    for request in values + averages:
+        request.result()
+    # One call for the values and one for both (touching) days of averages
+    assert plan.get_stats()['calls'] == 2
+    assert plan.get_stats()['tags_downloaded'] == 8 + 6
+
+    for (request, names) in zip(values, [tags[:5], tags[3:8]]):
+        expected = server.get_values_at(names, days[2])
+        pd.testing.assert_series_equal(request.result(), expected)
+    for (request, names, (t1, t2)) in zip(
+            averages, [tags[:4], tags[2:6]],
+            [(days[0], days[1]), (days[1], days[2])]):
+        (frame, is_good) = request.result()
+        (expected, expected_good) = server.get_time_averaged_frame(
+            names, t1, t2, 3600)
+        pd.testing.assert_frame_equal(frame, expected, check_freq=False)
+        np.testing.assert_array_equal(is_good, expected_good)
+
+
+def test_request_plan_reuses_downloaded_data(historian, server):
+    tags = historian.get_tag_names()
+    plan = pihist.RequestPlan(server)
+    plan.time_averaged(tags[:4], '2021-12-10 00:00:00',
+                       '2021-12-12 00:00:00', 3600).result()
+    calls = plan.get_stats()['calls']
+    plan.time_averaged(tags[1:3], '2021-12-10 12:00:00',
+                       '2021-12-11 00:00:00', 3600).result()
+    assert plan.get_stats()['calls'] == calls
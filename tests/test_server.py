@@ -0,0 +1,154 @@
+"""Tests of pihist.Server's multi-tag downloads against the synthetic
+historian.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import pihist
+import pisynth
+
+START = '2021-01-01 00:00:00'
+END = '2021-01-02 00:00:00'
+
+
+def test_concurrent_downloads_match_sequential_ones():
+    historian = pisynth.SyntheticHistorian(num_tags=20, latency_secs=0.002)
+    server = pihist.Server('SYNTH', backend=historian)
+    tag_names = historian.get_tag_names()[::-1] + ['SYN_00003.PV']
+    try:
+        expected = list(server.get_tag_raw_data(tag_names, START, END, 1000))
+        results = list(server.get_tag_raw_data(tag_names, START, END, 1000,
+                                               num_workers=4))
+        assert [r[0] for r in results] == tag_names
+        for ((tag_name, data, tag), (_, data0, tag0)) in zip(results,
+                                                            expected):
+            pd.testing.assert_series_equal(data, data0)
+            # The caller gets the Tag objects of its own connection
+            assert tag is tag0
+
+        unordered = list(server.get_tag_time_averaged_data(
+            tag_names, START, END, 3600, num_workers=4, ordered=False))
+        assert sorted(r[0] for r in unordered) == sorted(tag_names)
+    finally:
+        server.close_workers()
+
+
+def count_resolved(monkeypatch):
+    """Count the tag names resolved through the synthetic PIPoints. """
+    resolved = []
+    item = pisynth._SyntheticPoints.Item
+
+    def counting_item(self, tag_name):
+        resolved.append(tag_name)
+        return item(self, tag_name)
+    monkeypatch.setattr(pisynth._SyntheticPoints, 'Item', counting_item)
+    return resolved
+
+
+def test_tag_handles_are_reused(monkeypatch, server):
+    resolved = count_resolved(monkeypatch)
+    tag = server.get_tag('SYN_00001.PV')
+    assert server.get_tag('SYN_00001.PV') is tag
+    for i in range(2):
+        list(server.get_tag_raw_data(['SYN_00001.PV', 'SYN_00002.PV'],
+                                     START, END, 1000))
+    assert resolved == ['SYN_00001.PV', 'SYN_00002.PV']
+
+    server.clear_tag_cache()
+    assert server.get_tag('SYN_00001.PV') is not tag
+    assert resolved[-1] == 'SYN_00001.PV'
+
+
+def test_least_recently_used_tags_are_forgotten(monkeypatch, historian):
+    resolved = count_resolved(monkeypatch)
+    server = pihist.Server('SYNTH', backend=historian, max_cached_tags=2)
+    for tag_name in ['A.PV', 'B.PV', 'A.PV', 'C.PV', 'A.PV', 'B.PV']:
+        server.get_tag(tag_name)
+    assert resolved == ['A.PV', 'B.PV', 'C.PV', 'B.PV']
+
+
+@pytest.mark.parametrize('num_workers', [1, 3])
+def test_streamed_chunks_join_up_to_the_full_download(server, num_workers):
+    tag_names = ['SYN_00001.PV', 'SYN_00002.PV', 'SYN_00003.STS']
+    chunks = {tag_name: [] for tag_name in tag_names}
+    for (tag_name, chunk) in server.stream_tag_raw_data(
+            tag_names, START, END, 50, num_workers=num_workers,
+            max_pending_chunks=2):
+        assert len(chunk) > 0
+        chunks[tag_name].append(chunk)
+    for tag_name in tag_names:
+        assert len(chunks[tag_name]) > 1
+        data = pd.concat(chunks[tag_name])
+        assert data.index.is_monotonic_increasing
+        expected = server.get_tag(tag_name).get_large_raw_data(START, END, 50)
+        pd.testing.assert_series_equal(data, expected)
+
+
+def test_streaming_can_be_stopped_early(server):
+    stream = server.stream_tag_raw_data(['SYN_00001.PV', 'SYN_00002.PV'],
+                                        START, END, 50, num_workers=2,
+                                        max_pending_chunks=1)
+    next(stream)
+    stream.close()
+
+
+@pytest.mark.parametrize('num_partitions', [1, 3, 7, 100])
+def test_partitions_join_without_duplicates_or_gaps(server, num_partitions):
+    tag = server.get_tag('SYN_00001.PV')
+    (t1, t2) = server.convert_times([START, '2021-01-03 12:34:56'])
+    expected = tag.get_large_raw_data(t1, t2, 1000)
+    data = server.get_partitioned_raw_data('SYN_00001.PV', t1, t2, 1000,
+                                           num_partitions=num_partitions)
+    assert not data.index.has_duplicates
+    pd.testing.assert_series_equal(data, expected, check_freq=False)
+
+    expected = tag.get_large_interpolated_data(t1, t2, 600)
+    data = server.get_partitioned_interpolated_data(
+        'SYN_00001.PV', t1, t2, 600, num_partitions=num_partitions)
+    assert not data.index.has_duplicates
+    pd.testing.assert_series_equal(data, expected, check_freq=False)
+
+
+def test_values_on_partition_edges_are_kept_once(server):
+    tag = server.get_tag('SYN_00001.PV')
+    (t1, t2) = server.convert_times([START, END])
+    expected = tag.get_large_raw_data(t1, t2, 1000)
+    # Split the range exactly at recorded events
+    edges = [t1] + [expected.index[k].value/1e9 for k in (10, 11, 50)] + [t2]
+
+    def fetch(server, tag, a, b):
+        return tag.get_large_raw_data(a, b, 1000)
+    chunks = server.download_partitions('SYN_00001.PV', edges, fetch, 2)
+    pd.testing.assert_series_equal(pd.concat(chunks), expected,
+                                   check_freq=False)
+
+
+VALUE_TAGS = ['SYN_00004.PV', 'SYN_00005.STS', 'SYN_00006.PV', 'SYN_00004.PV']
+
+
+def test_values_at_match_each_tag(historian, server):
+    t = '2021-01-01 12:34:56'
+    expected = [server.get_tag(tag_name).get_value_at(t)
+                for tag_name in VALUE_TAGS]
+    historian.reset_stats()
+    values = server.get_values_at(VALUE_TAGS, t)
+    assert historian.get_stats()['requests'] == 1
+    assert list(values.index) == VALUE_TAGS
+    assert values.name == pd.Timestamp('2021-01-01 12:34:56', tz='UTC')
+    np.testing.assert_allclose(values.to_numpy(dtype=np.float64),
+                               np.asarray(expected, dtype=np.float64),
+                               rtol=1e-6)
+    names = server.get_values_at(VALUE_TAGS, t, digital='names')
+    assert names.iloc[1] == ['OPEN', 'CLOSED'][expected[1]]
+
+
+def test_values_at_fall_back_to_one_tag_at_a_time(monkeypatch, server):
+    t = '2021-01-01 12:34:56'
+    expected = server.get_values_at(VALUE_TAGS, t)
+
+    def fail(self, *args):
+        raise RuntimeError('no list calls')
+    monkeypatch.setattr(pisynth._SyntheticListData, 'ArcValue', fail)
+    values = server.get_values_at(VALUE_TAGS, t, num_workers=2)
+    pd.testing.assert_series_equal(values, expected, rtol=1e-6)
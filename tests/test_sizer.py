@@ -0,0 +1,60 @@
+"""Tests of RequestSizer, alone and against the synthetic historian. """
+
+import pandas as pd
+import pihist
+import pisynth
+
+
+def test_sizer_decreases_on_timeouts_and_increases_on_success():
+    sizer = pihist.RequestSizer(increase_step=1000, decrease_factor=0.5,
+                                min_size=100)
+    assert sizer.start('T', 'raw', 8000) == 8000
+    assert sizer.timed_out('T', 'raw', 8000) == 4000
+    assert sizer.get_size('T', 'raw') == 4000
+    assert sizer.start('T', 'raw', 8000) == 4000
+    # A full-size success grows the size; a short one doesn't
+    assert sizer.succeeded('T', 'raw', 4000, 8000, 4000) == 5000
+    assert sizer.succeeded('T', 'raw', 5000, 8000, 10) == 5000
+    assert sizer.get_size('T', 'raw') == 5000
+    stats = sizer.get_stats().loc[('T', 'raw')]
+    assert (stats.requests, stats.timeouts, stats.increases) == (3, 1, 1)
+
+
+def test_sizer_forgets_sizes_that_reach_the_callers_limit():
+    sizer = pihist.RequestSizer(increase_step=1000)
+    sizer.timed_out('T', 'raw', 4000)
+    assert sizer.succeeded('T', 'raw', 2000, 3000, 2000) == 3000
+    assert sizer.get_size('T', 'raw') is None
+    assert sizer.start('T', 'raw', 50000) == 50000
+
+
+def test_sizer_counts_final_timeouts_without_decreasing():
+    sizer = pihist.RequestSizer(min_size=100)
+    assert sizer.timed_out('T', 'raw', 100, retry=False) == 100
+    stats = sizer.get_stats().loc[('T', 'raw')]
+    assert (stats.timeouts, stats.retries, stats.decreases) == (1, 0, 0)
+
+
+def test_sizer_saves_and_loads_sizes(tmp_path):
+    path = str(tmp_path / 'sizes.json')
+    sizer = pihist.RequestSizer(path)
+    sizer.timed_out('T', 'interpolated', 10000)
+    sizer.save()
+    assert pihist.RequestSizer(path).get_size('T', 'interpolated') == 5000
+
+
+def test_sizer_learns_the_historians_limit():
+    historian = pisynth.SyntheticHistorian(max_values_per_request=20000,
+                                           raw_interval_secs=60.0)
+    server = pihist.Server('SYNTH', backend=historian)
+    tag = server.get_tag('SYN_00000.PV')
+    data = tag.get_large_raw_data('2020-01-01 00:00:00',
+                                  '2020-03-01 00:00:00', 100000)
+    assert server.get_sizer().get_size('SYN_00000.PV', 'raw') <= 20000
+    assert historian.get_stats()['timeouts'] > 0
+
+    unlimited = pisynth.SyntheticHistorian(raw_interval_secs=60.0)
+    expected = pihist.Server('SYNTH', backend=unlimited).get_tag(
+        'SYN_00000.PV').get_large_raw_data('2020-01-01 00:00:00',
+                                           '2020-03-01 00:00:00', 100000)
+    pd.testing.assert_series_equal(data, expected, check_freq=False)
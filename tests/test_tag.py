@@ -0,0 +1,32 @@
+"""Tests of single-tag downloads through pihist.Tag. """
+
+import numpy as np
+import pytest
+import pihist
+
+START = '2021-01-01 00:00:00'
+END = '2021-01-02 00:00:00'
+
+
+@pytest.mark.parametrize('summaries, num_requests', [
+    (['Avg'], 1), (['Max', 'Avg'], 1), (['Num'], 1), (['Num', 'Min'], 2),
+    (list(pihist.SUMMARY_COLUMNS), 2)])
+def test_only_the_requested_summaries_are_downloaded(historian, server,
+                                                     summaries, num_requests):
+    tag = server.get_tag('SYN_00001.PV')
+    historian.reset_stats()
+    data = tag.get_time_averaged_data(START, END, 24, summaries)
+    assert list(data.columns) == summaries
+    assert len(data) == 24
+    assert historian.get_stats()['requests'] == num_requests
+    if 'Num' in summaries:
+        assert data.Num.dtype == int
+    full = tag.get_time_averaged_data(START, END, 24)
+    for c in summaries:
+        np.testing.assert_array_equal(data[c].to_numpy(), full[c].to_numpy())
+
+
+def test_unknown_summaries_are_an_error(server):
+    tag = server.get_tag('SYN_00001.PV')
+    with pytest.raises(ValueError):
+        tag.get_time_averaged_data(START, END, 24, ['Avg', 'Median'])
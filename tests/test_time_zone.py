@@ -0,0 +1,42 @@
+"""Tests of TimeZoneRules against pytz, through the synthetic historian. """
+
+import calendar
+import datetime
+import numpy as np
+import pytz
+import pytest
+import pihist
+import pisynth
+
+
+def local_seconds(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+@pytest.mark.parametrize('zone', ['America/Edmonton', 'Europe/London',
+                                  'Australia/Sydney', 'UTC'])
+def test_time_zone_rules_match_pytz_around_dst_changes(zone):
+    tz = pytz.timezone(zone)
+    server = pihist.Server('SYNTH', backend=pisynth.SyntheticHistorian(
+        num_tags=1, time_zone=zone))
+    times = []
+    for (year, month, day) in [(2021, 3, 14), (2021, 3, 28), (2021, 4, 4),
+                               (2021, 10, 3), (2021, 10, 31),
+                               (2021, 11, 7)]:
+        start = datetime.datetime(year, month, day)
+        times += [start + datetime.timedelta(minutes=15*i)
+                  for i in range(-8, 4*24)]
+    strings = [t.strftime('%Y-%m-%d %H:%M:%S') for t in times]
+    expected = [pisynth.parse_time(s, tz) for s in strings]
+    np.testing.assert_array_equal(server.convert_times(strings), expected)
+    np.testing.assert_array_equal(
+        server.local_to_utc([local_seconds(t) for t in times]), expected)
+
+
+def test_time_zone_rules_learn_only_the_years_converted():
+    server = pihist.Server('SYNTH', backend=pisynth.SyntheticHistorian(
+        num_tags=1, time_zone='America/Edmonton'))
+    server.convert_times(['2019-06-01 00:00:00', '2021-01-01 00:00:00'])
+    assert server.get_time_zone().get_years() == (2019, 2021)
+    server.convert_times(['2150-01-01 00:00:00'])
+    assert server.get_time_zone().get_years() == (2019, 2021)